@@ -0,0 +1,220 @@
+"""
+Background tasks for importing and exporting courses in Studio.
+
+Each import or export is a job identified by a job_id. The tasks record the job's progress in the
+django cache (see get_job_status) so that the course_job_status view can report it while the
+job runs on a worker. The uploaded course archive and the exported tarball live under the
+data root which must be shared between the Studio web and worker processes.
+"""
+import logging
+import os
+import shutil
+import tarfile
+import time
+import uuid
+
+from celery import task
+from path import path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from auth.authz import create_all_course_groups
+from xmodule.contentstore.django import contentstore
+from xmodule.modulestore import Location
+from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.xml_exporter import export_to_xml
+from xmodule.modulestore.xml_importer import import_from_xml
+
+log = logging.getLogger(__name__)
+
+# how long to remember the status of a job
+JOB_STATUS_TIMEOUT = 24 * 60 * 60
+
+# job states
+JOB_PENDING = 'pending'
+JOB_IN_PROGRESS = 'in_progress'
+JOB_COMPLETE = 'complete'
+JOB_FAILED = 'failed'
+
+
+def _job_status_key(job_id):
+    """
+    The cache key for the given job's status
+    """
+    return 'contentstore.course_job.{0}'.format(job_id)
+
+
+def new_job_id():
+    """
+    Generate an id for a new import or export job
+    """
+    return uuid.uuid4().hex
+
+
+def update_job_status(job_id, state, message='', **info):
+    """
+    Record the status of the job. info is any additional (json serializable) information
+    for the client, e.g., the location of the course.
+    """
+    status = get_job_status(job_id) or {}
+    status.update(info)
+    status.update({'state': state, 'message': message})
+    cache.set(_job_status_key(job_id), status, JOB_STATUS_TIMEOUT)
+    return status
+
+
+def get_job_status(job_id):
+    """
+    Get the status dict of the job or None if it's unknown (or expired)
+    """
+    return cache.get(_job_status_key(job_id))
+
+
+def export_root():
+    """
+    The directory under which exported course tarballs are written
+    """
+    return path(settings.GITHUB_REPO_ROOT) / 'exports'
+
+
+def export_tarball_path(job_id, name):
+    """
+    The path of the tarball for the given export job
+    """
+    return export_root() / job_id / (name + '.tar.gz')
+
+
+def remove_expired_exports():
+    """
+    Remove the export directories of jobs whose status has expired. Their tarballs can no longer
+    be downloaded, so they'd otherwise pile up.
+    """
+    if not export_root().isdir():
+        return
+    expiry = time.time() - JOB_STATUS_TIMEOUT
+    for job_dir in export_root().dirs():
+        if job_dir.mtime < expiry:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+class _ChunkBuffer(object):
+    """
+    A write only file like object which collects what is written to it until it's drained
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def drain(self):
+        data = ''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_tarball(source_dir, arcname):
+    """
+    Generate a gzipped tarball of source_dir (whose contents are put under arcname in the tarball)
+    as a sequence of chunks. The tarball is never built as a whole so this can feed a response or
+    file directly w/o holding more than one file's content in memory.
+    """
+    buf = _ChunkBuffer()
+    tar_file = tarfile.open(mode='w|gz', fileobj=buf)
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        relative_dir = os.path.relpath(dirpath, source_dir)
+        tar_file.add(dirpath, arcname=os.path.normpath(os.path.join(arcname, relative_dir)), recursive=False)
+        for filename in sorted(filenames):
+            tar_file.add(
+                os.path.join(dirpath, filename),
+                arcname=os.path.normpath(os.path.join(arcname, relative_dir, filename))
+            )
+            yield buf.drain()
+    tar_file.close()
+    yield buf.drain()
+
+
+@task
+def import_course_archive(job_id, user_id, location_url, course_subdir, archive_name):
+    """
+    Extract the uploaded archive (already saved as `archive_name` in the `course_subdir` of the data
+    root) and import the course in it into the course at `location_url`.
+
+    The course directory belongs to this job alone and is removed when done whether or not the
+    import succeeded.
+    """
+    data_root = path(settings.GITHUB_REPO_ROOT)
+    course_dir = data_root / course_subdir
+    location = Location(location_url)
+    try:
+        update_job_status(job_id, JOB_IN_PROGRESS, 'Extracting the course archive')
+        tar_file = tarfile.open(course_dir / archive_name)
+        tar_file.extractall(course_dir + '/')
+        tar_file.close()
+
+        # find the 'course.xml' file
+        course_xml_dir = None
+        for dirpath, _dirnames, filenames in os.walk(course_dir):
+            if 'course.xml' in filenames:
+                course_xml_dir = path(dirpath)
+                break
+
+        if course_xml_dir is None:
+            update_job_status(job_id, JOB_FAILED, 'Could not find the course.xml file in the package.')
+            return
+
+        log.debug('found course.xml at {0}'.format(course_xml_dir))
+
+        if course_xml_dir != course_dir:
+            for fname in os.listdir(course_xml_dir):
+                shutil.move(course_xml_dir / fname, course_dir)
+
+        update_job_status(job_id, JOB_IN_PROGRESS, 'Importing the course')
+        _module_store, course_items = import_from_xml(modulestore('direct'), settings.GITHUB_REPO_ROOT,
+                                                      [course_subdir], load_error_modules=False,
+                                                      static_content_store=contentstore(),
+                                                      target_location_namespace=location,
+                                                      draft_store=modulestore())
+
+        log.debug('new course at {0}'.format(course_items[0].location))
+
+        create_all_course_groups(User.objects.get(id=user_id), course_items[0].location)
+
+        update_job_status(job_id, JOB_COMPLETE, 'Import complete')
+    except Exception as err:
+        log.exception('Import of {0} failed'.format(location_url))
+        update_job_status(job_id, JOB_FAILED, 'Import failed: {0}'.format(err))
+    finally:
+        # we can blow this away when we're done importing.
+        shutil.rmtree(course_dir, ignore_errors=True)
+
+
+@task
+def export_course_archive(job_id, location_url, name):
+    """
+    Export the course at `location_url` to xml and stream it into a .tar.gz in the job's export
+    directory (see export_tarball_path). The export directories of expired jobs are removed first.
+    """
+    location = Location(location_url)
+    tarball_path = export_tarball_path(job_id, name)
+    root_dir = export_root() / job_id / 'xml'
+    try:
+        update_job_status(job_id, JOB_IN_PROGRESS, 'Exporting the course')
+        remove_expired_exports()
+        os.makedirs(root_dir)
+        export_to_xml(modulestore('direct'), contentstore(), location, root_dir, name, modulestore())
+
+        update_job_status(job_id, JOB_IN_PROGRESS, 'Compressing the course')
+        with open(tarball_path, 'wb') as tarball:
+            for chunk in iter_tarball(root_dir / name, name):
+                tarball.write(chunk)
+
+        update_job_status(job_id, JOB_COMPLETE, 'Export complete')
+    except Exception as err:
+        log.exception('Export of {0} failed'.format(location_url))
+        update_job_status(job_id, JOB_FAILED, 'Export failed: {0}'.format(err))
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
@@ -3,13 +3,24 @@ Unit tests for the asset upload endpoint.
 """
 
 import json
+import os
+import shutil
+import tarfile
+import time
 from datetime import datetime
 from io import BytesIO
+from path import path
 from pytz import UTC
+from tempfile import mkdtemp
 from unittest import TestCase, skip
 from .utils import CourseTestCase
+from django.conf import settings
 from django.core.urlresolvers import reverse
+from contentstore import tasks
 from contentstore.views import assets
+from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.django import contentstore
+from xmodule.modulestore.django import modulestore
 
 
 class AssetsTestCase(CourseTestCase):
@@ -36,6 +47,67 @@ class AssetsTestCase(CourseTestCase):
         self.assertIsInstance(content, list)
 
 
+class AssetPageTestCase(CourseTestCase):
+    """
+    Unit tests for the paged asset query endpoint
+    """
+    def setUp(self):
+        super(AssetPageTestCase, self).setUp()
+        location = self.course.location
+        self.url = reverse("asset_page", kwargs={
+            'org': location.org,
+            'course': location.course,
+            'name': location.name,
+        })
+        self.contents = []
+        for filename in ('a.txt', 'b.txt', 'other.txt'):
+            content = StaticContent(
+                StaticContent.compute_location(location.org, location.course, filename),
+                filename, 'text/plain', 'sample content'
+            )
+            contentstore().save(content)
+            self.contents.append(content)
+
+    def tearDown(self):
+        for content in self.contents:
+            contentstore().delete(content.get_id())
+        super(AssetPageTestCase, self).tearDown()
+
+    def test_paging(self):
+        resp = self.client.get(self.url, {'page_size': 2, 'sort': 'displayname', 'direction': 'asc'})
+        self.assertEquals(resp.status_code, 200)
+        content = json.loads(resp.content)
+        self.assertEquals(content['totalCount'], 3)
+        self.assertEquals(content['pageSize'], 2)
+        self.assertEquals([asset['name'] for asset in content['assets']], ['a.txt', 'b.txt'])
+
+        resp = self.client.get(self.url, {'page': 1, 'page_size': 2, 'sort': 'displayname', 'direction': 'asc'})
+        content = json.loads(resp.content)
+        self.assertEquals(content['start'], 2)
+        self.assertEquals([asset['name'] for asset in content['assets']], ['other.txt'])
+
+    def test_page_links_keep_query(self):
+        location = self.course.location
+        index_url = reverse("asset_index", kwargs={
+            'org': location.org,
+            'course': location.course,
+            'name': location.name,
+        })
+        resp = self.client.get(index_url, {
+            'page_size': 1, 'sort': 'displayname', 'direction': 'asc', 'text_search': 'txt'
+        })
+        self.assertEquals(resp.status_code, 200)
+        self.assertContains(
+            resp, 'href="?page=1&amp;page_size=1&amp;sort=displayname&amp;direction=asc&amp;text_search=txt"'
+        )
+
+    def test_text_search(self):
+        resp = self.client.get(self.url, {'text_search': 'OTHER'})
+        content = json.loads(resp.content)
+        self.assertEquals(content['totalCount'], 1)
+        self.assertEquals(content['assets'][0]['name'], 'other.txt')
+
+
 class UploadTestCase(CourseTestCase):
     """
     Unit tests for uploading a file
@@ -93,3 +165,107 @@ class AssetsToJsonTestCase(TestCase):
         self.assertEquals(compare["path"], "foo.png")
         self.assertEquals(compare["uploaded"], upload_date.isoformat())
         self.assertEquals(compare["id"], "/tag/org/course/12/category/name")
+
+
+class ExportTestCase(CourseTestCase):
+    """
+    Unit tests for exporting a course, both streamed and as a background job
+    """
+    def setUp(self):
+        super(ExportTestCase, self).setUp()
+        self.url = reverse("generate_export_course", kwargs={
+            'org': self.course.location.org,
+            'course': self.course.location.course,
+            'name': self.course.location.name,
+        })
+
+    def tearDown(self):
+        shutil.rmtree(tasks.export_root(), ignore_errors=True)
+        super(ExportTestCase, self).tearDown()
+
+    def test_streamed_export(self):
+        resp = self.client.get(self.url)
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(resp['Content-Type'], 'application/x-tgz')
+        tarball = tarfile.open(fileobj=BytesIO(''.join(resp)), mode='r:gz')
+        self.assertIn(self.course.location.name + '/course.xml', tarball.getnames())
+
+    def test_background_export(self):
+        resp = self.client.post(self.url)
+        self.assertEquals(resp.status_code, 200)
+        status_url = json.loads(resp.content)['JobStatusUrl']
+
+        # tests run celery tasks eagerly so the job is already done
+        resp = self.client.get(status_url)
+        self.assertEquals(resp.status_code, 200)
+        status = json.loads(resp.content)
+        self.assertEquals(status['state'], tasks.JOB_COMPLETE)
+
+        resp = self.client.get(status['DownloadUrl'])
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(resp['Content-Type'], 'application/x-tgz')
+        tarball = tarfile.open(fileobj=BytesIO(''.join(resp)), mode='r:gz')
+        self.assertIn(self.course.location.name + '/course.xml', tarball.getnames())
+
+        # the tarball is kept so that it can be downloaded again
+        resp = self.client.get(status['DownloadUrl'])
+        self.assertEquals(resp.status_code, 200)
+
+    def test_expired_exports_removed(self):
+        expired_dir = tasks.export_root() / 'expired'
+        expired_dir.makedirs()
+        expired_time = time.time() - tasks.JOB_STATUS_TIMEOUT - 60
+        os.utime(expired_dir, (expired_time, expired_time))
+
+        resp = self.client.post(self.url)
+        self.assertEquals(resp.status_code, 200)
+        self.assertFalse(expired_dir.exists())
+
+    def test_unknown_job(self):
+        resp = self.client.get(reverse("course_job_status", kwargs={
+            'org': self.course.location.org,
+            'course': self.course.location.course,
+            'name': self.course.location.name,
+            'job_id': 'abc123',
+        }))
+        self.assertEquals(resp.status_code, 404)
+
+
+class ImportTestCase(CourseTestCase):
+    """
+    Unit tests for importing a course as a background job
+    """
+    def setUp(self):
+        super(ImportTestCase, self).setUp()
+        self.url = reverse("import_course", kwargs={
+            'org': self.course.location.org,
+            'course': self.course.location.course,
+            'name': self.course.location.name,
+        })
+        self.temp_dir = path(mkdtemp())
+        self.tarball_path = self.temp_dir / 'toy.tar.gz'
+        with open(self.tarball_path, 'wb') as tarball:
+            for chunk in tasks.iter_tarball(path(settings.COMMON_TEST_DATA_ROOT) / 'toy', 'toy'):
+                tarball.write(chunk)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        super(ImportTestCase, self).tearDown()
+
+    def test_background_import(self):
+        with open(self.tarball_path, 'rb') as tarball:
+            resp = self.client.post(self.url, {'course-data': tarball})
+        self.assertEquals(resp.status_code, 200)
+        status_url = json.loads(resp.content)['JobStatusUrl']
+
+        # tests run celery tasks eagerly so the job is already done
+        resp = self.client.get(status_url)
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(json.loads(resp.content)['state'], tasks.JOB_COMPLETE)
+
+        chapter_location = self.course.location.replace(category='chapter', name='Overview')
+        self.assertIsNotNone(modulestore('direct').get_item(chapter_location))
+
+        # the job's upload directory is removed once it's been imported
+        upload_prefix = '{0.org}-{0.course}-{0.name}-'.format(self.course.location)
+        self.assertFalse(path(settings.GITHUB_REPO_ROOT).dirs(upload_prefix + '*'))
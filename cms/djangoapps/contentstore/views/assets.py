@@ -1,39 +1,44 @@
 import logging
 import json
+import math
 import os
-import tarfile
 import shutil
+import urllib
 from tempfile import mkdtemp
 from path import path
+import pymongo
 
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotFound
 from django.contrib.auth.decorators import login_required
 from django_future.csrf import ensure_csrf_cookie
 from django.core.urlresolvers import reverse
 from django.core.servers.basehttp import FileWrapper
-from django.core.files.temp import NamedTemporaryFile
 from django.views.decorators.http import require_POST, require_http_methods
 
 from mitxmako.shortcuts import render_to_response
 from cache_toolbox.core import del_cached_content
-from auth.authz import create_all_course_groups
 
-from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.xml_exporter import export_to_xml
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore import Location
 from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.mongo import ASSET_SORT_FIELDS
 from xmodule.util.date_utils import get_default_time_display
 from xmodule.modulestore import InvalidLocationError
 from xmodule.exceptions import NotFoundError
 
 from .access import get_location_and_verify_access
+from .. import tasks
 from util.json_request import JsonResponse
 
+# number of assets on each page of the asset library unless otherwise requested
+ASSETS_PAGE_SIZE = 50
+MAX_ASSETS_PAGE_SIZE = 500
 
-__all__ = ['asset_index', 'upload_asset', 'import_course', 'generate_export_course', 'export_course']
+__all__ = ['asset_index', 'asset_page', 'upload_asset', 'import_course', 'generate_export_course', 'export_course',
+           'course_job_status', 'download_export_course']
 
 
 def assets_to_json_dict(assets):
@@ -69,6 +74,73 @@ def assets_to_json_dict(assets):
     return ret
 
 
+def _get_asset_display_info(asset):
+    """
+    Build the info the asset library template needs to display the given asset document
+    """
+    asset_id = asset['_id']
+    display_info = {}
+    display_info['displayname'] = asset['displayname']
+    display_info['uploadDate'] = get_default_time_display(asset['uploadDate'])
+
+    asset_location = StaticContent.compute_location(asset_id['org'], asset_id['course'], asset_id['name'])
+    display_info['url'] = StaticContent.get_url_path_from_location(asset_location)
+
+    # note, due to the schema change we may not have a 'thumbnail_location' in the result set
+    _thumbnail_location = asset.get('thumbnail_location', None)
+    thumbnail_location = Location(_thumbnail_location) if _thumbnail_location is not None else None
+    display_info['thumb_url'] = StaticContent.get_url_path_from_location(thumbnail_location) if thumbnail_location is not None else None
+
+    return display_info
+
+
+def _parse_asset_page_params(request):
+    """
+    Get the paging, sorting and filtering parameters for the asset library from the request.
+    Returns a dict w/ page, page_size, sort, direction, and text_search. Invalid values fall back to
+    the defaults (first page, newest first, no filter).
+    """
+    try:
+        page = max(int(request.GET.get('page', 0)), 0)
+    except ValueError:
+        page = 0
+    try:
+        page_size = int(request.GET.get('page_size', ASSETS_PAGE_SIZE))
+    except ValueError:
+        page_size = ASSETS_PAGE_SIZE
+    page_size = min(max(page_size, 1), MAX_ASSETS_PAGE_SIZE)
+
+    sort = request.GET.get('sort', 'uploadDate')
+    if sort not in ASSET_SORT_FIELDS:
+        sort = 'uploadDate'
+    direction = 'asc' if request.GET.get('direction') == 'asc' else 'desc'
+
+    return {
+        'page': page,
+        'page_size': page_size,
+        'sort': sort,
+        'direction': direction,
+        'text_search': request.GET.get('text_search', '').strip(),
+    }
+
+
+def _get_asset_page(course_reference, page, page_size, sort, direction, text_search):
+    """
+    Query one page of the course's assets. Returns (assets, total_count) where total_count is the
+    number of assets matching text_search.
+    """
+    store = contentstore()
+    total_count = store.get_content_count_for_course(course_reference, filter_text=text_search)
+    assets = store.get_all_content_for_course(
+        course_reference,
+        start=page * page_size,
+        maxresults=page_size,
+        sort=[(sort, pymongo.ASCENDING if direction == 'asc' else pymongo.DESCENDING)],
+        filter_text=text_search
+    )
+    return assets, total_count
+
+
 @login_required
 @ensure_csrf_cookie
 def asset_index(request, org, course, name):
@@ -76,6 +148,9 @@ def asset_index(request, org, course, name):
     Display an editable asset library
 
     org, course, name: Attributes of the Location for the item to edit
+
+    The html page shows one page of assets as selected by the page, page_size, sort, direction, and
+    text_search GET parameters (see asset_page).
     """
     location = get_location_and_verify_access(request, org, course, name)
 
@@ -85,43 +160,70 @@ def asset_index(request, org, course, name):
         'coursename': name
     })
 
-    course_module = modulestore().get_item(location)
-
     course_reference = StaticContent.compute_location(org, course, name)
-    assets = contentstore().get_all_content_for_course(course_reference)
-
-    # sort in reverse upload date order
-    assets = sorted(assets, key=lambda asset: asset['uploadDate'], reverse=True)
 
     if request.META.get('HTTP_ACCEPT', "").startswith("application/json"):
+        # all of the assets in reverse upload date order
+        assets = contentstore().get_all_content_for_course(
+            course_reference, sort=[('uploadDate', pymongo.DESCENDING)]
+        )
         return JsonResponse(assets_to_json_dict(assets))
 
-    asset_display = []
-    for asset in assets:
-        asset_id = asset['_id']
-        display_info = {}
-        display_info['displayname'] = asset['displayname']
-        display_info['uploadDate'] = get_default_time_display(asset['uploadDate'])
-
-        asset_location = StaticContent.compute_location(asset_id['org'], asset_id['course'], asset_id['name'])
-        display_info['url'] = StaticContent.get_url_path_from_location(asset_location)
-
-        # note, due to the schema change we may not have a 'thumbnail_location' in the result set
-        _thumbnail_location = asset.get('thumbnail_location', None)
-        thumbnail_location = Location(_thumbnail_location) if _thumbnail_location is not None else None
-        display_info['thumb_url'] = StaticContent.get_url_path_from_location(thumbnail_location) if thumbnail_location is not None else None
+    course_module = modulestore().get_item(location)
 
-        asset_display.append(display_info)
+    params = _parse_asset_page_params(request)
+    assets, total_count = _get_asset_page(course_reference, **params)
+    page_count = max(int(math.ceil(total_count / float(params['page_size']))), 1)
+    # the links to the other pages keep the sorting and filtering of this one
+    page_query = urllib.urlencode([
+        (key, unicode(params[key]).encode('utf-8'))
+        for key in ('page_size', 'sort', 'direction', 'text_search') if params[key]
+    ])
 
     return render_to_response('asset_index.html', {
         'context_course': course_module,
-        'assets': asset_display,
+        'assets': [_get_asset_display_info(asset) for asset in assets],
+        'page': params['page'],
+        'page_count': page_count,
+        'page_query': page_query,
+        'total_count': total_count,
         'upload_asset_callback_url': upload_asset_callback_url,
         'remove_asset_callback_url': reverse('remove_asset', kwargs={
             'org': org,
             'course': course,
             'name': name
-        })
+        }),
+    })
+
+
+@login_required
+def asset_page(request, org, course, name):
+    """
+    Return one page of the course's assets as json.
+
+    GET parameters (all optional):
+        page: 0 based page number
+        page_size: number of assets per page (capped at MAX_ASSETS_PAGE_SIZE)
+        sort: the field to sort by (uploadDate or displayname)
+        direction: asc or desc
+        text_search: only include assets whose name contains this text
+    """
+    get_location_and_verify_access(request, org, course, name)
+
+    course_reference = StaticContent.compute_location(org, course, name)
+    params = _parse_asset_page_params(request)
+    assets, total_count = _get_asset_page(course_reference, **params)
+
+    start = params['page'] * params['page_size']
+    return JsonResponse({
+        'start': start,
+        'end': start + len(assets),
+        'page': params['page'],
+        'pageSize': params['page_size'],
+        'totalCount': total_count,
+        'sort': params['sort'],
+        'direction': params['direction'],
+        'assets': assets_to_json_dict(assets),
     })
 
 
@@ -163,23 +265,18 @@ def upload_asset(request, org, course, coursename):
     else:
         content = StaticContent(content_loc, filename, mime_type, upload_file.read())
 
-    thumbnail_content = None
-    thumbnail_location = None
+    # thumbnails are generated in the background once the content is saved
+    thumbnail_location = contentstore().schedule_thumbnail(content)
 
-    # first let's see if a thumbnail can be created
-    (thumbnail_content, thumbnail_location) = contentstore().generate_thumbnail(content,
-                                                                                tempfile_path=None if not chunked else
-                                                                                upload_file.temporary_file_path())
-
-    # delete cached thumbnail even if one couldn't be created this time (else the old thumbnail will continue to show)
-    del_cached_content(thumbnail_location)
-    # now store thumbnail location only if we could create it
-    if thumbnail_content is not None:
-        content.thumbnail_location = thumbnail_location
+    # delete any previous thumbnail (else the old thumbnail will continue to show until the new one is generated)
+    if thumbnail_location is not None:
+        contentstore().delete(StaticContent.get_id_from_location(thumbnail_location))
+        del_cached_content(thumbnail_location)
 
     # then commit the content
     contentstore().save(content)
     del_cached_content(content.location)
+    contentstore().queue_thumbnail(content)
 
     # readback the saved content - we need the database timestamp
     readback = contentstore().find(content.location)
@@ -187,7 +284,7 @@ def upload_asset(request, org, course, coursename):
     response_payload = {'displayname': content.name,
                         'uploadDate': get_default_time_display(readback.last_modified_at),
                         'url': StaticContent.get_url_path_from_location(content.location),
-                        'thumb_url': StaticContent.get_url_path_from_location(thumbnail_location) if thumbnail_content is not None else None,
+                        'thumb_url': StaticContent.get_url_path_from_location(thumbnail_location),
                         'msg': 'Upload completed'
                         }
 
@@ -252,7 +349,8 @@ def remove_asset(request, org, course, name):
 @login_required
 def import_course(request, org, course, name):
     """
-    This method will handle a POST request to upload and import a .tar.gz file into a specified course
+    This method will handle a POST request to upload a .tar.gz file and start a background job
+    importing it into a specified course. The response gives the url to poll for the job's status.
     """
     location = get_location_and_verify_access(request, org, course, name)
 
@@ -264,10 +362,12 @@ def import_course(request, org, course, name):
 
         data_root = path(settings.GITHUB_REPO_ROOT)
 
-        course_subdir = "{0}-{1}-{2}".format(org, course, name)
+        # each upload gets a directory of its own so that concurrent imports of the course don't
+        # overwrite (or remove) each other's files
+        job_id = tasks.new_job_id()
+        course_subdir = "{0}-{1}-{2}-{3}".format(org, course, name, job_id)
         course_dir = data_root / course_subdir
-        if not course_dir.isdir():
-            os.mkdir(course_dir)
+        os.mkdir(course_dir)
 
         temp_filepath = course_dir / filename
 
@@ -279,41 +379,13 @@ def import_course(request, org, course, name):
             temp_file.write(chunk)
         temp_file.close()
 
-        tar_file = tarfile.open(temp_filepath)
-        tar_file.extractall(course_dir + '/')
-
-        # find the 'course.xml' file
+        tasks.update_job_status(job_id, tasks.JOB_PENDING, 'Waiting to import', location=location.url())
+        tasks.import_course_archive.delay(job_id, request.user.id, location.url(), course_subdir, filename)
 
-        for dirpath, _dirnames, filenames in os.walk(course_dir):
-            for filename in filenames:
-                if filename == 'course.xml':
-                    break
-            if filename == 'course.xml':
-                break
-
-        if filename != 'course.xml':
-            return HttpResponse(json.dumps({'ErrMsg': 'Could not find the course.xml file in the package.'}))
-
-        logging.debug('found course.xml at {0}'.format(dirpath))
-
-        if dirpath != course_dir:
-            for fname in os.listdir(dirpath):
-                shutil.move(dirpath / fname, course_dir)
-
-        _module_store, course_items = import_from_xml(modulestore('direct'), settings.GITHUB_REPO_ROOT,
-                                                      [course_subdir], load_error_modules=False,
-                                                      static_content_store=contentstore(),
-                                                      target_location_namespace=location,
-                                                      draft_store=modulestore())
-
-        # we can blow this away when we're done importing.
-        shutil.rmtree(course_dir)
-
-        logging.debug('new course at {0}'.format(course_items[0].location))
-
-        create_all_course_groups(request.user, course_items[0].location)
-
-        return HttpResponse(json.dumps({'Status': 'OK'}))
+        return HttpResponse(json.dumps({
+            'Status': 'OK',
+            'JobStatusUrl': _job_status_url(location, job_id),
+        }))
     else:
         course_module = modulestore().get_item(location)
 
@@ -327,17 +399,38 @@ def import_course(request, org, course, name):
         })
 
 
+def _job_status_url(location, job_id):
+    """
+    The url of the status of the given import or export job for the course
+    """
+    return reverse('course_job_status', kwargs={
+        'org': location.org,
+        'course': location.course,
+        'name': location.name,
+        'job_id': job_id,
+    })
+
+
 @ensure_csrf_cookie
 @login_required
 def generate_export_course(request, org, course, name):
     """
     This method will serialize out a course to a .tar.gz file which contains a XML-based representation of
-    the course
+    the course.
+
+    A GET streams the .tar.gz as the response while it's generated. A POST instead starts a background
+    export job and responds with the url to poll for the job's status which, once the job completes,
+    includes the url from which to download the .tar.gz.
     """
     location = get_location_and_verify_access(request, org, course, name)
 
     loc = Location(location)
-    export_file = NamedTemporaryFile(prefix=name + '.', suffix=".tar.gz")
+
+    if request.method == 'POST':
+        job_id = tasks.new_job_id()
+        tasks.update_job_status(job_id, tasks.JOB_PENDING, 'Waiting to export', location=loc.url())
+        tasks.export_course_archive.delay(job_id, loc.url(), name)
+        return JsonResponse({'JobStatusUrl': _job_status_url(loc, job_id)})
 
     root_dir = path(mkdtemp())
 
@@ -346,18 +439,61 @@ def generate_export_course(request, org, course, name):
 
     export_to_xml(modulestore('direct'), contentstore(), loc, root_dir, name, modulestore())
 
-    logging.debug('tar file being generated at {0}'.format(export_file.name))
-    tar_file = tarfile.open(name=export_file.name, mode='w:gz')
-    tar_file.add(root_dir / name, arcname=name)
-    tar_file.close()
+    def stream_export():
+        """
+        Stream the tarball and remove the tempdir once it's all been sent
+        """
+        try:
+            for chunk in tasks.iter_tarball(root_dir / name, name):
+                yield chunk
+        finally:
+            shutil.rmtree(root_dir, ignore_errors=True)
+
+    response = HttpResponse(stream_export(), content_type='application/x-tgz')
+    response['Content-Disposition'] = 'attachment; filename=%s.tar.gz' % name
+    return response
+
+
+@login_required
+def course_job_status(request, org, course, name, job_id):
+    """
+    Return the json status of an import or export job of the course: its state (one of pending,
+    in_progress, complete, or failed) and a message. Completed export jobs also give the
+    DownloadUrl of the exported .tar.gz.
+    """
+    location = get_location_and_verify_access(request, org, course, name)
+
+    status = tasks.get_job_status(job_id)
+    if status is None or status.get('location') != location.url():
+        return HttpResponseNotFound()
+
+    if status['state'] == tasks.JOB_COMPLETE and tasks.export_tarball_path(job_id, name).exists():
+        status['DownloadUrl'] = reverse('download_export_course', kwargs={
+            'org': org,
+            'course': course,
+            'name': name,
+            'job_id': job_id,
+        })
+    return JsonResponse(status)
+
+
+@login_required
+def download_export_course(request, org, course, name, job_id):
+    """
+    Serve the .tar.gz generated by a background export job. It's kept (and can be downloaded again)
+    until the job's status expires (see tasks.remove_expired_exports).
+    """
+    location = get_location_and_verify_access(request, org, course, name)
 
-    # remove temp dir
-    shutil.rmtree(root_dir / name)
+    status = tasks.get_job_status(job_id)
+    tarball_path = tasks.export_tarball_path(job_id, name)
+    if status is None or status.get('location') != location.url() or not tarball_path.exists():
+        return HttpResponseNotFound()
 
-    wrapper = FileWrapper(export_file)
+    wrapper = FileWrapper(open(tarball_path, 'rb'))
     response = HttpResponse(wrapper, content_type='application/x-tgz')
-    response['Content-Disposition'] = 'attachment; filename=%s' % os.path.basename(export_file.name)
-    response['Content-Length'] = os.path.getsize(export_file.name)
+    response['Content-Disposition'] = 'attachment; filename=%s' % tarball_path.name
+    response['Content-Length'] = os.path.getsize(tarball_path)
     return response
 
 
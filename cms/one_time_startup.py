@@ -1,6 +1,7 @@
 from dogapi import dog_http_api, dog_stats_api
 from django.conf import settings
 from xmodule.modulestore.django import modulestore
+from xmodule.course_module import Textbook
 from django.dispatch import Signal
 from request_cache.middleware import RequestCache
 
@@ -14,6 +15,10 @@ for store_name in settings.MODULESTORE:
 
     modulestore_update_signal = Signal(providing_args=['modulestore', 'course_id', 'location'])
     store.modulestore_update_signal = modulestore_update_signal
+
+# share the fetched textbook tables of contents among all of the processes
+Textbook.toc_cache = get_cache('default')
+
 if hasattr(settings, 'DATADOG_API'):
     dog_http_api.api_key = settings.DATADOG_API
     dog_stats_api.start(api_key=settings.DATADOG_API, statsd=True)
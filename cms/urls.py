@@ -34,6 +34,10 @@ urlpatterns = ('',  # nopep8
         'contentstore.views.export_course', name='export_course'),
     url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/generate_export/(?P<name>[^/]+)$',
         'contentstore.views.generate_export_course', name='generate_export_course'),
+    url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/course_job/(?P<name>[^/]+)/(?P<job_id>[0-9a-f]+)$',
+        'contentstore.views.course_job_status', name='course_job_status'),
+    url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/download_export/(?P<name>[^/]+)/(?P<job_id>[0-9a-f]+)$',
+        'contentstore.views.download_export_course', name='download_export_course'),
 
     url(r'^preview/modx/(?P<preview_id>[^/]*)/(?P<location>.*?)/(?P<dispatch>[^/]*)$',
         'contentstore.views.preview_dispatch', name='preview_dispatch'),
@@ -76,6 +80,8 @@ urlpatterns = ('',  # nopep8
 
     url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/assets/(?P<name>[^/]+)$',
         'contentstore.views.asset_index', name='asset_index'),
+    url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/assets/(?P<name>[^/]+)/page$',
+        'contentstore.views.asset_page', name='asset_page'),
     url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/assets/(?P<name>[^/]+)/remove$',
         'contentstore.views.assets.remove_asset', name='remove_asset'),
     url(r'^(?P<org>[^/]+)/(?P<course>[^/]+)/textbooks/(?P<name>[^/]+)$',
@@ -26,6 +26,16 @@ class StaticContentServer(object):
                 try:
                     content = contentstore().find(loc, as_stream=True)
                 except NotFoundError:
+                    content = None
+
+                if content is None and loc.category == 'thumbnail':
+                    # thumbnails are generated in the background, so this one may not be there yet
+                    try:
+                        content = contentstore().generate_missing_thumbnail(loc)
+                    except NotFoundError:
+                        pass
+
+                if content is None:
                     response = HttpResponse()
                     response.status_code = 404
                     return response
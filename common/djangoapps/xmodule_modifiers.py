@@ -1,12 +1,15 @@
+import hashlib
 import json
 import logging
 import static_replace
 
 from django.conf import settings
+from django.core.cache import cache
 from functools import wraps
 from mitxmako.shortcuts import render_to_string
 from xmodule.seq_module import SequenceModule
 from xmodule.vertical_module import VerticalModule
+from xblock.core import Scope
 import datetime
 from django.utils.timezone import UTC
 
@@ -89,26 +92,124 @@ def replace_static_urls(get_html, data_dir, course_namespace=None):
     return _get_html
 
 
+def content_version(descriptor):
+    """
+    A digest of the values of the descriptor's content and settings fields, which changes
+    whenever the descriptor is edited (or published, or reimported w/ changes).
+    Memoized on the descriptor since modulestores return new descriptors when they change.
+    """
+    version = getattr(descriptor, '_content_version', None)
+    if version is None:
+        values = [
+            (field.name, getattr(descriptor, field.name))
+            for field in descriptor.fields
+            if field.scope in (Scope.content, Scope.settings)
+        ]
+        version = hashlib.sha1(json.dumps(values, sort_keys=True, default=unicode)).hexdigest()
+        descriptor._content_version = version
+    return version
+
+
+def cache_html(get_html, module, course_id, timeout, key_prefix=''):
+    """
+    Updates the given get_html function to share its output between all users viewing the module
+    in the course, through the cache, for timeout seconds, as long as the module declares that its
+    output doesn't depend on the user (see XModule.has_user_independent_html).
+
+    The output is keyed by the module's location and the version of its content, so edits show up
+    immediately. key_prefix should identify whatever else the output depends on (e.g. the wrappers
+    applied to get_html).
+    """
+    @wraps(get_html)
+    def _get_html():
+        if not module.has_user_independent_html:
+            return get_html()
+
+        key = 'xmodule_html.' + hashlib.md5(u'{0}|{1}|{2}|{3}'.format(
+            key_prefix, course_id, module.location.url(), content_version(module.descriptor)
+        ).encode('utf-8')).hexdigest()
+        html = cache.get(key)
+        if html is None:
+            html = get_html()
+            cache.set(key, html, timeout)
+        return html
+
+    return _get_html
+
+
+# how long (in seconds) the grade counts of a problem are cached; they're invalidated as grades are
+# published but other changes (e.g. deleted student state) only show up once they expire
+GRADE_HISTOGRAM_CACHE_TIMEOUT = getattr(settings, 'GRADE_HISTOGRAM_CACHE_TIMEOUT', 10 * 60)
+
+# the number of modules whose grades are counted per query
+GRADE_HISTOGRAM_CHUNK_SIZE = 500
+
+
+def _grade_counts_key(module_id):
+    """The cache key of the grade counts of the module"""
+    return 'xmodule_modifiers.grade_counts.' + hashlib.md5(module_id.encode('utf-8')).hexdigest()
+
+
+def _histogram_from_counts(grade_counts):
+    """The histogram (sorted list of (grade, count)) of the {grade: count} dict"""
+    grades = sorted(grade_counts.items())
+    if len(grades) >= 1 and grades[0][0] is None:
+        return []
+    return grades
+
+
+def grade_histograms(module_ids):
+    ''' The histograms of grades on the given problems, as a dict of module_id to the
+        histogram (see grade_histogram). The grades of the problems which aren't cached
+        are counted w/ one query per GRADE_HISTOGRAM_CHUNK_SIZE problems.
+    '''
+    from django.db import connection
+
+    keys = dict((module_id, _grade_counts_key(module_id)) for module_id in set(module_ids))
+    cached = cache.get_many(keys.values())
+    counts = dict(
+        (module_id, cached[key]) for module_id, key in keys.items() if key in cached
+    )
+    missing = [module_id for module_id in keys if module_id not in counts]
+    for index in range(0, len(missing), GRADE_HISTOGRAM_CHUNK_SIZE):
+        chunk = missing[index:index + GRADE_HISTOGRAM_CHUNK_SIZE]
+        chunk_counts = dict((module_id, {}) for module_id in chunk)
+        cursor = connection.cursor()
+        q = """SELECT courseware_studentmodule.module_id,
+                      courseware_studentmodule.grade,
+                      COUNT(courseware_studentmodule.student_id)
+        FROM courseware_studentmodule
+        WHERE courseware_studentmodule.module_id IN ({0})
+        GROUP BY courseware_studentmodule.module_id, courseware_studentmodule.grade""".format(
+            ', '.join(['%s'] * len(chunk))
+        )
+        # Passing the module_ids this way prevents sql-injection.
+        cursor.execute(q, chunk)
+        for module_id, grade, count in cursor.fetchall():
+            chunk_counts[module_id][grade] = count
+        cache.set_many(
+            dict((keys[module_id], grade_counts) for module_id, grade_counts in chunk_counts.items()),
+            GRADE_HISTOGRAM_CACHE_TIMEOUT
+        )
+        counts.update(chunk_counts)
+
+    return dict(
+        (module_id, _histogram_from_counts(grade_counts)) for module_id, grade_counts in counts.items()
+    )
+
+
 def grade_histogram(module_id):
     ''' Print out a histogram of grades on a given problem.
         Part of staff member debug info.
     '''
-    from django.db import connection
-    cursor = connection.cursor()
-
-    q = """SELECT courseware_studentmodule.grade,
-                  COUNT(courseware_studentmodule.student_id)
-    FROM courseware_studentmodule
-    WHERE courseware_studentmodule.module_id=%s
-    GROUP BY courseware_studentmodule.grade"""
-    # Passing module_id this way prevents sql-injection.
-    cursor.execute(q, [module_id])
-
-    grades = list(cursor.fetchall())
-    grades.sort(key=lambda x: x[0])  # Add ORDER BY to sql query?
-    if len(grades) >= 1 and grades[0][0] is None:
-        return []
-    return grades
+    return grade_histograms([module_id])[module_id]
+
+
+def invalidate_grade_histogram(module_id):
+    ''' Forget the cached grade counts of the problem after a student's grade on it changed,
+        so they're counted again when next needed.
+    '''
+    cache.delete(_grade_counts_key(module_id))
 
 
 def save_module(get_html, module):
@@ -126,13 +227,16 @@ def save_module(get_html, module):
     return _get_html
 
 
-def add_histogram(get_html, module, user):
+def add_histogram(get_html, module, user, get_histogram=grade_histogram):
     """
     Updates the supplied module with a new get_html function that wraps
     the output of the old get_html function with additional information
     for admin users only, including a histogram of student answers and the
     definition of the xmodule
 
+    get_histogram: a function returning the grade histogram of a module id
+    (e.g. from histograms fetched for all of the modules on the page)
+
     Does nothing if module is a SequenceModule or a VerticalModule.
     """
     @wraps(get_html)
@@ -143,7 +247,7 @@ def add_histogram(get_html, module, user):
 
         module_id = module.id
         if module.descriptor.has_score:
-            histogram = grade_histogram(module_id)
+            histogram = get_histogram(module_id)
             render_histogram = len(histogram) > 0
         else:
             histogram = None
@@ -0,0 +1,70 @@
+"""
+Tests of the asynchronous xqueue submission interface
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from mock import Mock, patch
+
+from capa.xqueue_interface import AsyncXQueueInterface
+
+
+@patch('capa.xqueue_interface.threading.Thread', Mock())
+class AsyncXQueueInterfaceTest(unittest.TestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.interface = Mock()
+        self.interface.send_to_queue.return_value = (0, 'Successfully queued')
+        self.queue = AsyncXQueueInterface(self.interface, self.spool_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_queued_immediately(self):
+        self.assertEqual(self.queue.send_to_queue('header', 'body'), (0, 'queued'))
+        self.assertFalse(self.interface.send_to_queue.called)
+        self.assertEqual(self.queue.depth(), 1)
+
+    def test_delivered_in_order(self):
+        self.queue.send_to_queue('header1', 'body1')
+        upload = StringIO('print "hello"')
+        upload.name = 'hello.py'
+        self.queue.send_to_queue('header2', 'body2', files_to_upload=[upload])
+
+        self.assertTrue(self.queue.deliver_pending())
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(self.queue.stats['delivered'], 2)
+
+        calls = self.interface.send_to_queue.call_args_list
+        self.assertEqual(calls[0][0][:2], ('header1', 'body1'))
+        self.assertEqual(calls[1][0][:2], ('header2', 'body2'))
+        files = calls[1][0][2]
+        self.assertEqual(files[0].name, 'hello.py')
+        self.assertEqual(files[0].read(), 'print "hello"')
+
+    def test_retried_when_unreachable(self):
+        self.interface.send_to_queue.return_value = (1, 'cannot connect to server')
+        self.queue.send_to_queue('header', 'body')
+        self.assertFalse(self.queue.deliver_pending())
+        self.assertEqual(self.queue.depth(), 1)
+
+        self.interface.send_to_queue.return_value = (0, 'Successfully queued')
+        self.assertTrue(self.queue.deliver_pending())
+        self.assertEqual(self.queue.depth(), 0)
+
+    def test_rejected(self):
+        self.interface.send_to_queue.return_value = (1, 'Queue does not exist')
+        self.queue.send_to_queue('header', 'body')
+        self.assertTrue(self.queue.deliver_pending())
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(len(os.listdir(os.path.join(self.spool_dir, 'failed'))), 1)
+
+    def test_survives_restart(self):
+        self.queue.send_to_queue('header', 'body')
+        restarted = AsyncXQueueInterface(self.interface, self.spool_dir)
+        self.assertEqual(restarted.depth(), 1)
+        restarted.deliver_pending()
+        self.interface.send_to_queue.assert_called_once_with('header', 'body', None)
@@ -1,15 +1,29 @@
 #
 #  LMS Interface to external queueing system (xqueue)
 #
+import base64
+import errno
 import hashlib
 import json
 import logging
+import os
+import threading
+import time
+import uuid
+from StringIO import StringIO
+
 import requests
 
 
 log = logging.getLogger(__name__)
 dateformat = '%Y%m%d%H%M%S'
 
+# seconds to wait for xqueue to respond to a request
+XQUEUE_TIMEOUT = 10
+
+# the replies to submissions which are worth retrying (as opposed to those xqueue rejected)
+TRANSIENT_ERRORS = ('cannot connect to server', 'unexpected HTTP status code')
+
 
 def make_hashkey(seed):
     '''
@@ -61,9 +75,10 @@ class XQueueInterface(object):
     Interface to the external grading system
     '''
 
-    def __init__(self, url, django_auth, requests_auth=None):
+    def __init__(self, url, django_auth, requests_auth=None, timeout=XQUEUE_TIMEOUT):
         self.url = url
         self.auth = django_auth
+        self.timeout = timeout
         self.session = requests.session(auth=requests_auth)
 
     def send_to_queue(self, header, body, files_to_upload=None):
@@ -116,8 +131,8 @@ class XQueueInterface(object):
 
     def _http_post(self, url, data, files=None):
         try:
-            r = self.session.post(url, data=data, files=files)
-        except requests.exceptions.ConnectionError, err:
+            r = self.session.post(url, data=data, files=files, timeout=self.timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout), err:
             log.error(err)
             return (1, 'cannot connect to server')
 
@@ -125,3 +140,204 @@ class XQueueInterface(object):
             return (1, 'unexpected HTTP status code [%d]' % r.status_code)
 
         return parse_xreply(r.text)
+
+
+class SpooledFile(StringIO):
+    """
+    The contents of a file to upload w/ a spooled submission
+    """
+    def __init__(self, name, data):
+        StringIO.__init__(self, data)
+        self.name = name
+
+
+class AsyncXQueueInterface(object):
+    """
+    An interface to xqueue which accepts submissions immediately and delivers them from a
+    background thread, so that the student's request doesn't wait on (or fail because of) xqueue.
+
+    Each submission (w/ the contents of its files) is persisted as a file in spool_dir until it's
+    delivered, so submissions survive both xqueue outages and process restarts. The worker
+    delivers the oldest submissions first, up to batch_size at a time over the interface's
+    (keep-alive) session. When xqueue can't be reached, it backs off exponentially up to
+    max_backoff seconds. Submissions which xqueue rejects are moved to spool_dir/failed.
+
+    Several processes may share a spool_dir: each claims a submission (by renaming it) before
+    delivering it.
+    """
+    SUFFIX = '.json'
+    CLAIMED = '.claimed.'
+
+    def __init__(self, interface, spool_dir, batch_size=50, initial_backoff=1, max_backoff=300,
+                 poll_interval=30, report_metric=None):
+        """
+        interface: the XQueueInterface through which to deliver the submissions
+        spool_dir: the directory in which to persist the undelivered submissions
+        report_metric: an optional function(name, value) to which to report the queue depth and
+            delivery counts (e.g. a statsd gauge)
+        """
+        self.interface = interface
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.batch_size = batch_size
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.report_metric = report_metric
+
+        self.stats = {'submitted': 0, 'delivered': 0, 'failed': 0, 'retries': 0}
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.worker = None
+
+        for directory in (self.spool_dir, self.failed_dir):
+            try:
+                os.makedirs(directory)
+            except OSError, err:
+                if err.errno != errno.EEXIST:
+                    raise
+        self._release_abandoned_claims()
+
+    def send_to_queue(self, header, body, files_to_upload=None):
+        """
+        Accept a submission for delivery to xqueue. Same arguments as XQueueInterface.send_to_queue.
+
+        Returns (error_code, msg) where error_code != 0 indicates an error. If the submission can't
+        be persisted, it's delivered synchronously instead.
+        """
+        try:
+            self._spool(header, body, files_to_upload)
+        except (IOError, OSError), err:
+            log.error("Unable to spool xqueue submission, sending it directly: %s", err)
+            return self.interface.send_to_queue(header, body, files_to_upload)
+
+        with self.lock:
+            self.stats['submitted'] += 1
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._work)
+                self.worker.daemon = True
+                self.worker.start()
+        self.wakeup.set()
+        return (0, 'queued')
+
+    def depth(self):
+        """
+        The number of submissions waiting to be delivered
+        """
+        return len(self._pending())
+
+    def deliver_pending(self):
+        """
+        Deliver (up to batch_size of) the waiting submissions. Returns False if xqueue couldn't be
+        reached (so the rest should wait), True otherwise.
+        """
+        for filename in self._pending()[:self.batch_size]:
+            path = os.path.join(self.spool_dir, filename)
+            claimed = '{0}{1}{2}'.format(path, self.CLAIMED, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # another process claimed it
+                continue
+
+            try:
+                with open(claimed) as spooled:
+                    submission = json.load(spooled)
+            except (IOError, ValueError), err:
+                log.error("Unreadable xqueue submission %s: %s", filename, err)
+                self._fail(claimed, filename)
+                continue
+
+            files = [
+                SpooledFile(spooled_file['name'], base64.b64decode(spooled_file['data']))
+                for spooled_file in submission['files']
+            ] or None
+            (error, msg) = self.interface.send_to_queue(submission['header'], submission['body'], files)
+
+            if not error:
+                os.remove(claimed)
+                self._count('delivered')
+            elif msg.startswith(TRANSIENT_ERRORS):
+                # put it back for the next attempt
+                os.rename(claimed, path)
+                self._count('retries')
+                log.warning("Unable to deliver xqueue submission %s, will retry: %s", filename, msg)
+                return False
+            else:
+                log.error("xqueue rejected submission %s: %s", filename, msg)
+                self._fail(claimed, filename)
+        return True
+
+    def _spool(self, header, body, files_to_upload):
+        """
+        Persist the submission in the spool directory
+        """
+        files = []
+        for upload in files_to_upload or []:
+            upload.seek(0)
+            files.append({'name': upload.name, 'data': base64.b64encode(upload.read())})
+
+        # named so that they sort in the order submitted
+        filename = '{0:017.6f}-{1}{2}'.format(time.time(), uuid.uuid4().hex, self.SUFFIX)
+        path = os.path.join(self.spool_dir, filename)
+        # written under a temporary name so that it's never seen partially written
+        with open(path + '.tmp', 'w') as spooled:
+            json.dump({'header': header, 'body': body, 'files': files}, spooled)
+        os.rename(path + '.tmp', path)
+
+    def _pending(self):
+        return sorted(filename for filename in os.listdir(self.spool_dir) if filename.endswith(self.SUFFIX))
+
+    def _fail(self, claimed, filename):
+        os.rename(claimed, os.path.join(self.failed_dir, filename))
+        self._count('failed')
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+        if self.report_metric is not None:
+            self.report_metric('xqueue.submissions.{0}'.format(stat), self.stats[stat])
+
+    def _release_abandoned_claims(self):
+        """
+        Return the submissions claimed by processes which are no longer running to the queue
+        """
+        for filename in os.listdir(self.spool_dir):
+            if self.CLAIMED not in filename:
+                continue
+            original, _, pid = filename.rpartition(self.CLAIMED)
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except (ValueError, OSError):
+                pass
+            try:
+                os.rename(os.path.join(self.spool_dir, filename), os.path.join(self.spool_dir, original))
+            except OSError:
+                pass
+
+    def _work(self):
+        """
+        The worker thread loop: deliver the waiting submissions, backing off while xqueue is down
+        """
+        backoff = 0
+        while True:
+            # cleared before looking so that no submission's wakeup is missed
+            self.wakeup.clear()
+            try:
+                delivered = self.deliver_pending()
+            except Exception:
+                log.exception("Error delivering xqueue submissions")
+                delivered = False
+
+            depth = self.depth()
+            if self.report_metric is not None:
+                self.report_metric('xqueue.submissions.depth', depth)
+
+            if not delivered:
+                backoff = min(self.max_backoff, backoff * 2 if backoff else self.initial_backoff)
+                time.sleep(backoff)
+            else:
+                backoff = 0
+                if depth == 0:
+                    self.wakeup.wait(self.poll_interval)
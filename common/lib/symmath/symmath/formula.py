@@ -30,6 +30,9 @@ import unicodedata
 from lxml import etree
 #import subprocess
 import requests
+import hashlib
+import threading
+from collections import OrderedDict
 from copy import deepcopy
 
 log = logging.getLogger(__name__)
@@ -39,6 +42,144 @@ log.warning("Dark code. Needs review before enabling in prod.")
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 #-----------------------------------------------------------------------------
+# conversion of presentation MathML to content MathML
+#
+# Conversions are done by a pluggable converter: a callable taking (asciimath, presentation
+# MathML) and returning content MathML. By default this is the snuggletex webapp, but a local
+# service (see make_snuggletex_converter) or an in-process function can be set with
+# set_content_mathml_converter. Since identical answers are common, the conversions, and
+# the sympy expressions parsed from them, are cached by their content.
+
+SNUGGLETEX_URL = os.environ.get(
+    'SNUGGLETEX_URL',
+    'https://math-xserver.mitx.mit.edu/snuggletex-webapp-1.2.2/ASCIIMathMLUpConversionDemo'
+)
+SNUGGLETEX_TIMEOUT = 10		# seconds
+
+CONTENT_MATHML_CACHE_SIZE = 5000
+SYMPY_CACHE_SIZE = 5000
+
+
+class LRUCache(object):
+    '''
+    A small thread safe dict which forgets its least recently used entries beyond maxsize
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def content_key(*parts):
+    '''
+    A key for the content of the given strings
+    '''
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        digest.update(str(len(part)) + ':' + part)
+    return digest.hexdigest()
+
+
+def make_snuggletex_converter(url=SNUGGLETEX_URL, timeout=SNUGGLETEX_TIMEOUT):
+    '''
+    Make a converter which converts by posting to the snuggletex webapp at url and
+    scraping the content MathML from its result page
+    '''
+    headers = {'User-Agent': "Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.8.1.13) Gecko/20080311 Firefox/2.0.0.13"}
+
+    def convert(asciimath, mathml):
+        payload = {'asciiMathInput': asciimath,
+                   'asciiMathML': mathml,
+                   #'asciiMathML':unicode(mathml).encode('utf-8'),
+                   }
+        r = requests.post(url, data=payload, headers=headers, verify=False, timeout=timeout)
+        # don't scrape (and cache) an error page
+        r.raise_for_status()
+        r.encoding = 'utf-8'
+        ret = r.text
+
+        mode = 0
+        cmathml = []
+        for k in ret.split('\n'):
+            if 'conversion to Content MathML' in k:
+                mode = 1
+                continue
+            if mode == 1:
+                if '<h3>Maxima Input Form</h3>' in k:
+                    mode = 0
+                    continue
+                cmathml.append(k)
+        cmathml = '\n'.join(cmathml[2:])
+        cmathml = '<math xmlns="http://www.w3.org/1998/Math/MathML">\n' + unescape(cmathml) + '\n</math>'
+        return cmathml
+
+    return convert
+
+
+_content_mathml_converter = make_snuggletex_converter()
+_content_mathml_cache = LRUCache(CONTENT_MATHML_CACHE_SIZE)
+_sympy_cache = LRUCache(SYMPY_CACHE_SIZE)
+
+
+def set_content_mathml_converter(converter):
+    '''
+    Use converter, a callable taking (asciimath, presentation MathML) and returning
+    content MathML, for all conversions. Forgets the cached conversions.
+    '''
+    global _content_mathml_converter
+    _content_mathml_converter = converter
+    _content_mathml_cache.clear()
+    _sympy_cache.clear()
+
+
+def _is_empty_mathml(mathml):
+    '''
+    Whether the MathML is empty (or not even well formed)
+    '''
+    try:
+        xml = etree.fromstring(mathml)
+    except etree.XMLSyntaxError:
+        return True
+    return len(xml) == 0 and not (xml.text or '').strip()
+
+
+def get_content_mathml(asciimath, mathml):
+    '''
+    Convert the presentation MathML (w/ its asciimath source) to content MathML, using
+    the cached conversion if these have been converted before
+    '''
+    key = content_key(asciimath or '', mathml)
+    cmathml = _content_mathml_cache.get(key)
+    if cmathml is None:
+        cmathml = _content_mathml_converter(asciimath, mathml)
+        # don't remember a conversion of which nothing could be scraped (e.g. an unexpected page)
+        if not _is_empty_mathml(cmathml):
+            _content_mathml_cache.set(key, cmathml)
+    return cmathml
+
+#-----------------------------------------------------------------------------
 
 
 class dot(sympy.operations.LatticeOp):	 # my dot product
@@ -103,6 +244,20 @@ def my_evalf(expr, chop=False):
 
 
 def my_sympify(expr, normphase=False, matrix=False, abcsym=False, do_qubit=False, symtab=None):
+    # sympy expressions are immutable so the parse of an expression can be shared (but not
+    # lists or matrices, nor parses w/ a caller's symbol table)
+    if symtab is None and isinstance(expr, basestring):
+        key = content_key(expr, repr((normphase, matrix, abcsym, do_qubit)))
+        sexpr = _sympy_cache.get(key)
+        if sexpr is None:
+            sexpr = _my_sympify(expr, normphase, matrix, abcsym, do_qubit)
+            if isinstance(sexpr, sympy.Basic):
+                _sympy_cache.set(key, sexpr)
+        return sexpr
+    return _my_sympify(expr, normphase, matrix, abcsym, do_qubit, symtab)
+
+
+def _my_sympify(expr, normphase=False, matrix=False, abcsym=False, do_qubit=False, symtab=None):
     # make all lowercase real?
     if symtab:
         varset = symtab
@@ -422,12 +577,22 @@ class formula(object):
                     else:
                         msg = 'Err %s while converting cmathml to xml; cmml=%s' % (err, cmml)
                     raise Exception, msg
-                xml = self.fix_greek_in_mathml(xml)
-                self.the_sympy = self.make_sympy(xml[0])
+                key = content_key(cmml, self.options or '')
+                self.the_sympy = _sympy_cache.get(key)
+                if self.the_sympy is None:
+                    xml = self.fix_greek_in_mathml(xml)
+                    self.the_sympy = self.make_sympy(xml[0])
+                    if isinstance(self.the_sympy, sympy.Basic):
+                        _sympy_cache.set(key, self.the_sympy)
             else:
-                xml = etree.fromstring(self.expr)
-                xml = self.fix_greek_in_mathml(xml)
-                self.the_sympy = self.make_sympy(xml[0])
+                key = content_key(self.expr, self.options or '')
+                self.the_sympy = _sympy_cache.get(key)
+                if self.the_sympy is None:
+                    xml = etree.fromstring(self.expr)
+                    xml = self.fix_greek_in_mathml(xml)
+                    self.the_sympy = self.make_sympy(xml[0])
+                    if isinstance(self.the_sympy, sympy.Basic):
+                        _sympy_cache.set(key, self.the_sympy)
             return self.the_sympy
 
         def gettag(x):
@@ -559,40 +724,7 @@ class formula(object):
     sympy = property(make_sympy, None, None, 'sympy representation')
 
     def GetContentMathML(self, asciimath, mathml):
-        # URL = 'http://192.168.1.2:8080/snuggletex-webapp-1.2.2/ASCIIMathMLUpConversionDemo'
-        # URL = 'http://127.0.0.1:8080/snuggletex-webapp-1.2.2/ASCIIMathMLUpConversionDemo'
-        URL = 'https://math-xserver.mitx.mit.edu/snuggletex-webapp-1.2.2/ASCIIMathMLUpConversionDemo'
-
-        if 1:
-            payload = {'asciiMathInput': asciimath,
-                       'asciiMathML': mathml,
-                       #'asciiMathML':unicode(mathml).encode('utf-8'),
-                       }
-            headers = {'User-Agent': "Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.8.1.13) Gecko/20080311 Firefox/2.0.0.13"}
-            r = requests.post(URL, data=payload, headers=headers, verify=False)
-            r.encoding = 'utf-8'
-            ret = r.text
-            #print "encoding: ",r.encoding
-
-        # return ret
-
-        mode = 0
-        cmathml = []
-        for k in ret.split('\n'):
-            if 'conversion to Content MathML' in k:
-                mode = 1
-                continue
-            if mode == 1:
-                if '<h3>Maxima Input Form</h3>' in k:
-                    mode = 0
-                    continue
-                cmathml.append(k)
-        # return '\n'.join(cmathml)
-        cmathml = '\n'.join(cmathml[2:])
-        cmathml = '<math xmlns="http://www.w3.org/1998/Math/MathML">\n' + unescape(cmathml) + '\n</math>'
-        # print cmathml
-        #return unicode(cmathml)
-        return cmathml
+        return get_content_mathml(asciimath, mathml)
 
 #-----------------------------------------------------------------------------
 
@@ -113,3 +113,46 @@ class FormulaTest(unittest.TestCase):
 
         # success?
         self.assertEqual(test, expected)
+
+
+class ContentMathMLTest(unittest.TestCase):
+    '''
+    Tests of the (cached) conversion of presentation MathML to content MathML
+    '''
+    pmathml = '<math xmlns="http://www.w3.org/1998/Math/MathML"><mstyle displaystyle="true"><mi>x</mi><mo>+</mo><mi>y</mi></mstyle></math>'
+    cmathml = '<math xmlns="http://www.w3.org/1998/Math/MathML"><apply><plus/><ci>x</ci><ci>y</ci></apply></math>'
+
+    def setUp(self):
+        self.conversions = []
+        formula.set_content_mathml_converter(self.convert)
+
+    def tearDown(self):
+        formula.set_content_mathml_converter(formula.make_snuggletex_converter())
+
+    def convert(self, asciimath, mathml):
+        self.conversions.append((asciimath, mathml))
+        return self.cmathml
+
+    def test_converter(self):
+        self.assertEqual(formula.formula(self.pmathml, asciimath='x+y').sympy, formula.sympy.sympify('x+y'))
+        self.assertEqual(len(self.conversions), 1)
+        self.assertEqual(self.conversions[0][0], 'x+y')
+
+    def test_conversion_cached(self):
+        for _ in range(3):
+            self.assertEqual(formula.formula(self.pmathml, asciimath='x+y').sympy, formula.sympy.sympify('x+y'))
+        self.assertEqual(len(self.conversions), 1)
+
+        # different input is converted
+        formula.formula(self.pmathml.replace('<mi>y</mi>', '<mi>z</mi>'), asciimath='x+z').cmathml
+        self.assertEqual(len(self.conversions), 2)
+
+    def test_empty_conversion_not_cached(self):
+        self.cmathml = '<math xmlns="http://www.w3.org/1998/Math/MathML">\n\n</math>'
+        for _ in range(2):
+            formula.formula(self.pmathml, asciimath='x+y').cmathml
+        self.assertEqual(len(self.conversions), 2)
+
+    def test_sympify_cached(self):
+        self.assertIs(formula.my_sympify('x+2*y'), formula.my_sympify('x+2*y'))
+        self.assertIsNot(formula.my_sympify('[1, 2]'), formula.my_sympify('[1, 2]'))
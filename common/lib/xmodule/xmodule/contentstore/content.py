@@ -4,15 +4,22 @@ XASSET_SRCREF_PREFIX = 'xasset:'
 XASSET_THUMBNAIL_TAIL_NAME = '.jpg'
 
 import os
+import re
 import logging
 import StringIO
 
 from xmodule.modulestore import Location
-from .django import contentstore
+from xmodule.exceptions import NotFoundError
+from .thumbnails import ThumbnailGenerator, DEFAULT_THUMBNAIL_SIZES, DEFAULT_THUMBNAIL_WORKERS
 # to install PIL on MacOSX: 'easy_install http://dist.repoze.org/PIL-1.1.6.tar.gz'
 from PIL import Image
 
 
+THUMBNAIL_VARIANT_RE = re.compile(
+    r'^(?P<base>.*)-(?P<width>\d+)x(?P<height>\d+)' + re.escape(XASSET_THUMBNAIL_TAIL_NAME) + '$'
+)
+
+
 class StaticContent(object):
     def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None,
                  length=None):
@@ -32,8 +39,25 @@ class StaticContent(object):
         return self.location.category == 'thumbnail'
 
     @staticmethod
-    def generate_thumbnail_name(original_name):
-        return ('{0}' + XASSET_THUMBNAIL_TAIL_NAME).format(os.path.splitext(original_name)[0])
+    def generate_thumbnail_name(original_name, dimensions=None):
+        """
+        The name of the thumbnail of the named asset. dimensions gives the (width, height) of a
+        size variant; None means the primary thumbnail.
+        """
+        if dimensions is None:
+            return ('{0}' + XASSET_THUMBNAIL_TAIL_NAME).format(os.path.splitext(original_name)[0])
+        return ('{0}-{1}x{2}' + XASSET_THUMBNAIL_TAIL_NAME).format(os.path.splitext(original_name)[0], *dimensions)
+
+    @staticmethod
+    def parse_thumbnail_name(thumbnail_name):
+        """
+        The inverse of generate_thumbnail_name as far as possible: returns the name of the primary
+        thumbnail and the dimensions of the variant (None for the primary thumbnail)
+        """
+        match = THUMBNAIL_VARIANT_RE.match(thumbnail_name)
+        if match is None:
+            return thumbnail_name, None
+        return match.group('base') + XASSET_THUMBNAIL_TAIL_NAME, (int(match.group('width')), int(match.group('height')))
 
     @staticmethod
     def compute_location(org, course, name, revision=None, is_thumbnail=False):
@@ -120,13 +144,19 @@ class ContentStore(object):
     '''
     Abstraction for all ContentStore providers (e.g. MongoDB)
     '''
+    # the (width, height) bounds of each thumbnail generated for images; the first is the primary one
+    thumbnail_sizes = DEFAULT_THUMBNAIL_SIZES
+    # the number of threads generating thumbnails in the background
+    thumbnail_workers = DEFAULT_THUMBNAIL_WORKERS
+    _thumbnail_generator = None
+
     def save(self, content):
         raise NotImplementedError
 
     def find(self, filename):
         raise NotImplementedError
 
-    def get_all_content_for_course(self, location):
+    def get_all_content_for_course(self, location, start=0, maxresults=-1, sort=None, filter_text=None):
         '''
         Returns a list of all static assets for a course. The return format is a list of dictionary elements. Example:
 
@@ -145,13 +175,88 @@ class ContentStore(object):
             ....
 
             ]
+
+        Use start and maxresults to get a page of the assets, sort (a list of (field, direction) pairs as
+        per pymongo, e.g., [('uploadDate', -1)]) to order them, and filter_text to only get the assets
+        whose displayname contains that text (case insensitive).
+        '''
+        raise NotImplementedError
+
+    def get_content_count_for_course(self, location, filter_text=None):
+        '''
+        Returns the number of static assets for a course (w/ displaynames containing filter_text if given)
         '''
         raise NotImplementedError
 
-    def generate_thumbnail(self, content, tempfile_path=None):
+    def find_thumbnail_source(self, thumbnail_location):
+        '''
+        Returns the StaticContent of the asset whose (primary) thumbnail is at thumbnail_location or
+        None if there's no such asset
+        '''
+        raise NotImplementedError
+
+    def get_thumbnail_generator(self):
+        '''
+        The ThumbnailGenerator which generates this store's thumbnails in the background
+        '''
+        if self._thumbnail_generator is None:
+            self._thumbnail_generator = ThumbnailGenerator(self, workers=self.thumbnail_workers)
+        return self._thumbnail_generator
+
+    def schedule_thumbnail(self, content):
+        '''
+        Arrange for the thumbnails of content to be generated after it's saved, w/o waiting for them.
+        If the content is an image, this sets content.thumbnail_location and returns it; otherwise,
+        returns None. Call before saving content so the thumbnail location is recorded w/ the asset.
+        '''
+        if content.content_type is None or content.content_type.split('/')[0] != 'image':
+            return None
+
+        thumbnail_name = StaticContent.generate_thumbnail_name(content.location.name)
+        content.thumbnail_location = StaticContent.compute_location(content.location.org, content.location.course,
+                                                                    thumbnail_name, is_thumbnail=True)
+        return content.thumbnail_location
+
+    def queue_thumbnail(self, content):
+        '''
+        Queue the generation of content's thumbnails. Call after saving content which
+        schedule_thumbnail gave a thumbnail location. If the queue is full, the thumbnails will be
+        generated on first request (see generate_missing_thumbnail).
+        '''
+        if content.thumbnail_location is not None:
+            self.get_thumbnail_generator().schedule(content.location)
+
+    def generate_missing_thumbnail(self, thumbnail_location):
+        '''
+        Generate the thumbnail at thumbnail_location (which hasn't been generated yet) from its asset and
+        return it as per find(thumbnail_location, as_stream=True). Raises NotFoundError if there's no asset
+        for it or its thumbnail can't be generated.
+        '''
+        primary_name, dimensions = StaticContent.parse_thumbnail_name(thumbnail_location.name)
+        if dimensions is not None and dimensions not in self.thumbnail_sizes[1:]:
+            raise NotFoundError()
+        primary_location = StaticContent.compute_location(thumbnail_location.org, thumbnail_location.course,
+                                                          primary_name, is_thumbnail=True)
+        source = self.find_thumbnail_source(primary_location)
+        if source is None:
+            raise NotFoundError()
+
+        thumbnail_content, _thumbnail_location = self.generate_thumbnail(source, dimensions=dimensions)
+        if thumbnail_content is None:
+            raise NotFoundError()
+        return self.find(thumbnail_location, as_stream=True)
+
+    def generate_thumbnail(self, content, tempfile_path=None, dimensions=None):
+        '''
+        Generate and save the thumbnail of content if it's an image. Returns (thumbnail_content,
+        thumbnail_location) where thumbnail_content is None if no thumbnail was generated.
+
+        dimensions is the (width, height) of a size variant; None means the primary thumbnail (whose
+        bounds are the first of thumbnail_sizes).
+        '''
         thumbnail_content = None
         # use a naming convention to associate originals with the thumbnail
-        thumbnail_name = StaticContent.generate_thumbnail_name(content.location.name)
+        thumbnail_name = StaticContent.generate_thumbnail_name(content.location.name, dimensions)
 
         thumbnail_file_location = StaticContent.compute_location(content.location.org, content.location.course,
                                                                  thumbnail_name, is_thumbnail=True)
@@ -163,7 +268,6 @@ class ContentStore(object):
                 # use PIL to do the thumbnail generation (http://www.pythonware.com/products/pil/)
                 # My understanding is that PIL will maintain aspect ratios while restricting
                 # the max-height/width to be whatever you pass in as 'size'
-                # @todo: move the thumbnail size to a configuration setting?!?
                 if tempfile_path is None:
                     im = Image.open(StringIO.StringIO(content.data))
                 else:
@@ -172,20 +276,32 @@ class ContentStore(object):
                 # I've seen some exceptions from the PIL library when trying to save palletted
                 # PNG files to JPEG. Per the google-universe, they suggest converting to RGB first.
                 im = im.convert('RGB')
-                size = 128, 128
+                size = dimensions if dimensions is not None else self.thumbnail_sizes[0]
                 im.thumbnail(size, Image.ANTIALIAS)
                 thumbnail_file = StringIO.StringIO()
                 im.save(thumbnail_file, 'JPEG')
-                thumbnail_file.seek(0)
-
-                # store this thumbnail as any other piece of content
-                thumbnail_content = StaticContent(thumbnail_file_location, thumbnail_name,
-                                                  'image/jpeg', thumbnail_file)
 
-                contentstore().save(thumbnail_content)
+                thumbnail_content, thumbnail_file_location = self.save_thumbnail(
+                    content, thumbnail_file.getvalue(), dimensions
+                )
 
             except Exception, e:
                 # log and continue as thumbnails are generally considered as optional
                 logging.exception("Failed to generate thumbnail for {0}. Exception: {1}".format(content.location, str(e)))
 
         return thumbnail_content, thumbnail_file_location
+
+    def save_thumbnail(self, content, thumbnail_data, dimensions=None):
+        '''
+        Store the already rendered jpeg thumbnail_data as the thumbnail of content. Returns
+        (thumbnail_content, thumbnail_location).
+        '''
+        thumbnail_name = StaticContent.generate_thumbnail_name(content.location.name, dimensions)
+        thumbnail_file_location = StaticContent.compute_location(content.location.org, content.location.course,
+                                                                 thumbnail_name, is_thumbnail=True)
+
+        # store this thumbnail as any other piece of content
+        thumbnail_content = StaticContent(thumbnail_file_location, thumbnail_name,
+                                          'image/jpeg', thumbnail_data)
+        self.save(thumbnail_content)
+        return thumbnail_content, thumbnail_file_location
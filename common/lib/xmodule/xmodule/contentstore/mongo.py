@@ -1,3 +1,6 @@
+import re
+
+import pymongo
 from pymongo import Connection
 import gridfs
 from gridfs.errors import NoFile
@@ -13,9 +16,14 @@ from xmodule.exceptions import NotFoundError
 from fs.osfs import OSFS
 import os
 
+# the _id fields used by the course asset queries and the fields which asset listings may be sorted by
+ASSET_QUERY_FIELDS = ('tag', 'org', 'course', 'category', 'revision')
+ASSET_SORT_FIELDS = ('uploadDate', 'displayname')
+
 
 class MongoContentStore(ContentStore):
-    def __init__(self, host, db, port=27017, user=None, password=None, bucket='fs', **kwargs):
+    def __init__(self, host, db, port=27017, user=None, password=None, bucket='fs',
+                 thumbnail_sizes=None, thumbnail_workers=None, **kwargs):
         logging.debug('Using MongoDB for static content serving at host={0} db={1}'.format(host, db))
         _db = Connection(host=host, port=port, **kwargs)[db]
 
@@ -26,6 +34,21 @@ class MongoContentStore(ContentStore):
 
         self.fs_files = _db[bucket + ".files"]   # the underlying collection GridFS uses
 
+        # Maintain indexes which match the course asset queries so that paging through a
+        # course's assets sorted by any of the sortable fields doesn't scan/sort in memory
+        for sort_field in ASSET_SORT_FIELDS:
+            self.fs_files.ensure_index(
+                [('_id.' + field, pymongo.ASCENDING) for field in ASSET_QUERY_FIELDS] +
+                [(sort_field, pymongo.DESCENDING)]
+            )
+        # for finding the asset of a not yet generated thumbnail
+        self.fs_files.ensure_index('thumbnail_location', sparse=True)
+
+        if thumbnail_sizes is not None:
+            self.thumbnail_sizes = tuple(tuple(size) for size in thumbnail_sizes)
+        if thumbnail_workers is not None:
+            self.thumbnail_workers = thumbnail_workers
+
     def save(self, content):
         id = content.get_id()
 
@@ -68,6 +91,12 @@ class MongoContentStore(ContentStore):
             else:
                 return None
 
+    def find_thumbnail_source(self, thumbnail_location):
+        asset = self.fs_files.find_one({'thumbnail_location': list(thumbnail_location)}, fields=['_id'])
+        if asset is None:
+            return None
+        return self.find(Location(asset['_id']), throw_on_not_found=False)
+
     def get_stream(self, location):
         id = StaticContent.get_id_from_location(location)
         try:
@@ -107,10 +136,28 @@ class MongoContentStore(ContentStore):
     def get_all_content_thumbnails_for_course(self, location):
         return self._get_all_content_for_course(location, get_thumbnails=True)
 
-    def get_all_content_for_course(self, location):
-        return self._get_all_content_for_course(location, get_thumbnails=False)
+    def get_all_content_for_course(self, location, start=0, maxresults=-1, sort=None, filter_text=None):
+        return self._get_all_content_for_course(location, get_thumbnails=False, start=start,
+                                                maxresults=maxresults, sort=sort, filter_text=filter_text)
 
-    def _get_all_content_for_course(self, location, get_thumbnails=False):
+    def get_content_count_for_course(self, location, filter_text=None):
+        return self._get_content_cursor(location, filter_text=filter_text).count()
+
+    def _get_content_cursor(self, location, get_thumbnails=False, filter_text=None):
+        '''
+        Returns an unevaluated cursor over the course's assets (or thumbnails) whose displayname
+        contains filter_text (case insensitive) if given.
+        '''
+        course_filter = Location(XASSET_LOCATION_TAG, category="asset" if not get_thumbnails else "thumbnail",
+                                 course=location.course, org=location.org)
+        # 'borrow' the function 'location_to_query' from the Mongo modulestore implementation
+        query = location_to_query(course_filter)
+        if filter_text:
+            query['displayname'] = {'$regex': re.escape(filter_text), '$options': 'i'}
+        return self.fs_files.find(query)
+
+    def _get_all_content_for_course(self, location, get_thumbnails=False, start=0, maxresults=-1, sort=None,
+                                    filter_text=None):
         '''
         Returns a list of all static assets for a course. The return format is a list of dictionary elements. Example:
 
@@ -129,9 +176,14 @@ class MongoContentStore(ContentStore):
             ....
 
             ]
+
+        start, maxresults, sort and filter_text are as per ContentStore.get_all_content_for_course
         '''
-        course_filter = Location(XASSET_LOCATION_TAG, category="asset" if not get_thumbnails else "thumbnail",
-                                 course=location.course, org=location.org)
-        # 'borrow' the function 'location_to_query' from the Mongo modulestore implementation
-        items = self.fs_files.find(location_to_query(course_filter))
+        items = self._get_content_cursor(location, get_thumbnails=get_thumbnails, filter_text=filter_text)
+        if sort is not None:
+            items = items.sort(sort)
+        if start > 0:
+            items = items.skip(start)
+        if maxresults > 0:
+            items = items.limit(maxresults)
         return list(items)
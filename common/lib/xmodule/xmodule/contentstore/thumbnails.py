@@ -0,0 +1,136 @@
+"""
+Deferred thumbnail generation for image assets.
+
+Decoding and resizing large images is slow, so rather than generating thumbnails while the
+uploading (or importing) request waits, callers schedule them on a ThumbnailGenerator which
+generates them on a small pool of worker threads. The queue is bounded: if it's full the
+thumbnail is simply not generated ahead of time and ContentStore.generate_missing_thumbnail
+generates it on first request instead.
+
+Identical images (by md5 of their content) are only decoded and resized once per size while
+their rendered thumbnails remain in the generator's small LRU cache.
+"""
+import hashlib
+import logging
+import threading
+import Queue
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# the (width, height) bounds of the thumbnails generated for each image. The first is the primary
+# thumbnail whose location is recorded on the asset; others are extra size variants.
+DEFAULT_THUMBNAIL_SIZES = ((128, 128),)
+
+DEFAULT_THUMBNAIL_WORKERS = 2
+DEFAULT_THUMBNAIL_QUEUE_SIZE = 1000
+
+# the number of rendered thumbnails to remember by source md5
+RENDERED_CACHE_SIZE = 200
+
+
+class ThumbnailGenerator(object):
+    """
+    Generates the thumbnails of assets in a ContentStore on a bounded pool of worker threads
+    """
+    def __init__(self, contentstore, workers=DEFAULT_THUMBNAIL_WORKERS, max_queue_size=DEFAULT_THUMBNAIL_QUEUE_SIZE):
+        """
+        contentstore: the ContentStore holding the assets and to which to save their thumbnails
+        workers: the number of worker threads
+        max_queue_size: the maximum number of assets waiting for thumbnails
+        """
+        self.contentstore = contentstore
+        self.workers = workers
+        self.queue = Queue.Queue(max_queue_size)
+        self.lock = threading.Lock()
+        # the asset locations queued but not yet processed
+        self.pending = set()
+        # (source md5, dimensions) -> rendered thumbnail data
+        self.rendered = OrderedDict()
+        self.threads = []
+
+    def schedule(self, location):
+        """
+        Queue the generation of the thumbnails of the asset at location. Returns False if the asset
+        couldn't be queued (because the queue is full).
+        """
+        with self.lock:
+            if location in self.pending:
+                # it'll be read from the store when processed so will get the latest content anyway
+                return True
+            if not self.threads:
+                self._start_workers()
+            try:
+                self.queue.put_nowait(location)
+            except Queue.Full:
+                log.warning("Thumbnail queue is full, deferring thumbnail of {0} to first request".format(location))
+                return False
+            self.pending.add(location)
+            return True
+
+    def wait(self):
+        """
+        Block until all of the queued thumbnails have been generated
+        """
+        self.queue.join()
+
+    def generate(self, content, tempfile_path=None):
+        """
+        Generate and save all of the thumbnails of the content now. Returns the list of
+        (thumbnail_content, thumbnail_location) for each thumbnail size (thumbnail_content is
+        None for any which couldn't be generated).
+        """
+        data = content.data
+        if tempfile_path is None and isinstance(data, str):
+            source_md5 = hashlib.md5(data).hexdigest()
+        else:
+            source_md5 = None
+
+        results = []
+        for index, dimensions in enumerate(self.contentstore.thumbnail_sizes):
+            variant = None if index == 0 else dimensions
+            key = (source_md5, dimensions)
+            with self.lock:
+                thumbnail_data = self.rendered.get(key) if source_md5 is not None else None
+            if thumbnail_data is not None:
+                results.append(self.contentstore.save_thumbnail(content, thumbnail_data, variant))
+                continue
+
+            thumbnail_content, thumbnail_location = self.contentstore.generate_thumbnail(
+                content, tempfile_path=tempfile_path, dimensions=variant
+            )
+            if thumbnail_content is not None and source_md5 is not None:
+                with self.lock:
+                    self.rendered[key] = thumbnail_content.data
+                    while len(self.rendered) > RENDERED_CACHE_SIZE:
+                        self.rendered.popitem(last=False)
+            results.append((thumbnail_content, thumbnail_location))
+        return results
+
+    def _start_workers(self):
+        """
+        Start the worker threads. Should be called w/ the lock held.
+        """
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        """
+        The worker thread loop: generate the thumbnails of queued asset locations
+        """
+        while True:
+            location = self.queue.get()
+            with self.lock:
+                self.pending.discard(location)
+            try:
+                content = self.contentstore.find(location, throw_on_not_found=False)
+                if content is not None:
+                    self.generate(content)
+            except Exception:
+                # thumbnails are optional; the missing ones will be generated on request
+                log.exception("Failed to generate thumbnails for {0}".format(location))
+            finally:
+                self.queue.task_done()
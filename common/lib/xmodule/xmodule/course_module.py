@@ -1,4 +1,7 @@
+import hashlib
 import logging
+import threading
+import time
 from cStringIO import StringIO
 from math import exp
 from lxml import etree
@@ -55,10 +58,81 @@ class StringOrDate(Date):
 edx_xml_parser = etree.XMLParser(dtd_validation=False, load_dtd=False,
                                  remove_comments=True, remove_blank_text=True)
 
+# how long (in seconds) a fetched textbook table of contents is considered fresh. Once stale it's
+# still served while it's refreshed in the background.
+TOC_FRESH_SECONDS = 10 * 60
+# how long (in seconds) the shared cache keeps a table of contents (fresh or stale)
+TOC_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+# the timeout (in seconds) for fetching a table of contents
+TOC_FETCH_TIMEOUT = 5
+
+# toc_url -> {'text': xml text, 'fetched': time fetched} for when there's no shared cache
 _cached_toc = {}
+# toc_url -> (xml text, parsed tree) so each process only parses each table of contents once
+_parsed_toc = {}
+# the toc_urls being refreshed by this process
+_refreshing_toc = set()
+_toc_lock = threading.Lock()
+
+
+def _toc_cache_key(toc_url):
+    return 'textbook_toc.{0}'.format(hashlib.md5(toc_url.encode('utf-8')).hexdigest())
+
+
+def _fetch_toc(toc_url):
+    """
+    Fetch the table of contents xml at toc_url and remember it in the shared cache (if any)
+    """
+    log.info("Retrieving textbook table of contents from %s" % toc_url)
+    try:
+        r = requests.get(toc_url, timeout=TOC_FETCH_TIMEOUT)
+        r.raise_for_status()
+    except Exception as err:
+        msg = 'Error %s: Unable to retrieve textbook table of contents at %s' % (err, toc_url)
+        log.error(msg)
+        raise Exception(msg)
+
+    entry = {'text': r.text, 'fetched': time.time()}
+    if Textbook.toc_cache is not None:
+        Textbook.toc_cache.set(_toc_cache_key(toc_url), entry, TOC_CACHE_TIMEOUT)
+    else:
+        _cached_toc[toc_url] = entry
+    return entry
+
+
+def _refresh_toc(toc_url):
+    """
+    Refetch the table of contents at toc_url in a background thread unless it's already being
+    refreshed (by this process or, if there's a shared cache, by any)
+    """
+    with _toc_lock:
+        if toc_url in _refreshing_toc:
+            return
+        if Textbook.toc_cache is not None and \
+                not Textbook.toc_cache.add(_toc_cache_key(toc_url) + '.refreshing', True, TOC_FETCH_TIMEOUT * 2):
+            return
+        _refreshing_toc.add(toc_url)
+
+    def refresh():
+        try:
+            _fetch_toc(toc_url)
+        except Exception:
+            # keep serving the stale copy; it'll be retried when next requested
+            pass
+        finally:
+            with _toc_lock:
+                _refreshing_toc.discard(toc_url)
+
+    thread = threading.Thread(target=refresh)
+    thread.daemon = True
+    thread.start()
 
 
 class Textbook(object):
+    # the cache shared by all processes (e.g., memcached) in which to keep the fetched tables of
+    # contents. Set at startup; if None, each process keeps its own.
+    toc_cache = None
+
     def __init__(self, title, book_url):
         self.title = title
         self.book_url = book_url
@@ -81,40 +155,31 @@ class Textbook(object):
         """
         toc_url = self.book_url + 'toc.xml'
 
-        # cdodge: I've added this caching of TOC because in Mongo-backed instances (but not Filesystem stores)
-        # course modules have a very short lifespan and are constantly being created and torn down.
-        # Since this module in the __init__() method does a synchronous call to AWS to get the TOC
-        # this is causing a big performance problem. So let's be a bit smarter about this and cache
-        # each fetch and store in-mem for 10 minutes.
-        # NOTE: I have to get this onto sandbox ASAP as we're having runtime failures. I'd like to swing back and
-        # rewrite to use the traditional Django in-memory cache.
-        try:
-            # see if we already fetched this
-            if toc_url in _cached_toc:
-                (table_of_contents, timestamp) = _cached_toc[toc_url]
-                age = datetime.now(UTC) - timestamp
-                # expire every 10 minutes
-                if age.seconds < 600:
-                    return table_of_contents
-        except Exception as err:
-            pass
+        # Course modules are constantly being created and torn down (in Mongo-backed instances), so
+        # rather than fetching the TOC from AWS for each, the fetched TOC is cached (in the shared
+        # cache if there is one). A stale TOC is served while it's refetched in the background so
+        # only the very first load of a textbook waits on AWS.
+        if Textbook.toc_cache is not None:
+            entry = Textbook.toc_cache.get(_toc_cache_key(toc_url))
+        else:
+            entry = _cached_toc.get(toc_url)
 
-        # Get the table of contents from S3
-        log.info("Retrieving textbook table of contents from %s" % toc_url)
-        try:
-            r = requests.get(toc_url)
-        except Exception as err:
-            msg = 'Error %s: Unable to retrieve textbook table of contents at %s' % (err, toc_url)
-            log.error(msg)
-            raise Exception(msg)
+        if entry is None:
+            entry = _fetch_toc(toc_url)
+        elif time.time() - entry['fetched'] > TOC_FRESH_SECONDS:
+            _refresh_toc(toc_url)
 
-        # TOC is XML. Parse it
+        # TOC is XML. Parse it (unless this process already has)
+        parsed = _parsed_toc.get(toc_url)
+        if parsed is not None and parsed[0] == entry['text']:
+            return parsed[1]
         try:
-            table_of_contents = etree.fromstring(r.text)
+            table_of_contents = etree.fromstring(entry['text'])
         except Exception as err:
             msg = 'Error %s: Unable to parse XML for textbook table of contents at %s' % (err, toc_url)
             log.error(msg)
             raise Exception(msg)
+        _parsed_toc[toc_url] = (entry['text'], table_of_contents)
 
         return table_of_contents
 
@@ -40,6 +40,10 @@ class HtmlModule(HtmlFields, XModule):
     js_module_name = "HTMLModule"
     css = {'scss': [resource_string(__name__, 'css/html/display.scss')]}
 
+    @property
+    def has_user_independent_html(self):
+        return "%%USER_ID%%" not in self.data
+
     def get_html(self):
         if self.system.anonymous_student_id:
             return self.data.replace("%%USER_ID%%", self.system.anonymous_student_id)
@@ -8,7 +8,7 @@ import re
 
 from collections import namedtuple
 
-from .exceptions import InvalidLocationError, InsufficientSpecificationError
+from .exceptions import InvalidLocationError, InsufficientSpecificationError, ItemNotFoundError
 from xmodule.errortracker import make_error_tracker
 from bson.son import SON
 
@@ -283,6 +283,25 @@ class ModuleStore(object):
         """
         raise NotImplementedError
 
+    def get_instances(self, course_id, locations, depth=0):
+        """
+        Get the instances of all of the given locations, with policy for course_id applied.
+
+        Returns a dict mapping the Location of each instance found to the instance. Locations
+        which don't exist are omitted.
+
+        This default gets each instance separately; stores which can fetch many items at once
+        should override it.
+        """
+        instances = {}
+        for location in locations:
+            location = Location(location)
+            try:
+                instances[location] = self.get_instance(course_id, location, depth=depth)
+            except ItemNotFoundError:
+                pass
+        return instances
+
     def get_item_errors(self, location):
         """
         Return a list of (msg, exception-or-None) errors that the modulestore
@@ -449,8 +449,17 @@ class MongoModuleStore(ModuleStoreBase):
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
         If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+
+        If depth is None or the course's items are already in the request cache, this gets
+        the descendents from the course's items (see _get_course_items) which takes at most
+        one query. Otherwise, it makes a number of queries that is linear in the depth.
         """
+        if depth != 0 and items:
+            course_keys = set(metadata_cache_key(Location(item['_id'])) for item in items)
+            if len(course_keys) == 1:
+                course_key = course_keys.pop()
+                if depth is None or self._get_request_cached_course_items(course_key) is not None:
+                    return self._cache_children_from_course_items(items, depth, course_key)
 
         data = {}
         to_process = list(items)
@@ -477,6 +486,88 @@ class MongoModuleStore(ModuleStoreBase):
 
         return data
 
+    def _cache_children_from_course_items(self, items, depth, course_key):
+        """
+        Same as _cache_children but walks the descendents using the course's item map from
+        _get_course_items. The cached items are copied so that they don't get polluted by
+        changes to the loaded descriptors.
+        """
+        course_items = self._get_course_items(course_key)
+        data = {}
+        to_process = list(items)
+        while to_process and (depth is None or depth >= 0):
+            children = []
+            for item in to_process:
+                self._clean_item_data(item)
+                children.extend(item.get('definition', {}).get('children', []))
+                data[Location(item['location'])] = item
+
+            if depth == 0:
+                break
+
+            to_process = []
+            for child in children:
+                child_item = course_items.get(Location(child))
+                if child_item is not None and Location(child_item['_id']) not in data:
+                    to_process.append(copy.deepcopy(child_item))
+
+            if depth is not None:
+                depth -= 1
+
+        return data
+
+    def _get_request_cached_course_items(self, course_key):
+        """
+        Returns the item map for the (org, course) course_key cached in the request cache (if any)
+        """
+        if self.request_cache is None:
+            return None
+        # keyed by store as the draft and direct stores share the request cache but see different items
+        return self.request_cache.data.get('course_items', {}).get(id(self), {}).get(course_key)
+
+    def _get_course_items(self, course_key):
+        """
+        Returns a dict mapping the non-draft Location of each module of the (org, course) course_key
+        to its document, fetching all of them in one query. The map is kept in the request cache
+        (if present) so that loading several subtrees of the same course in a request doesn't
+        repeat the query. Don't modify the returned documents.
+        """
+        course_items = self._get_request_cached_course_items(course_key)
+        if course_items is not None:
+            return course_items
+
+        org, course = course_key
+        # uses the _id.* index; only get the fields from which descriptors are built
+        resultset = self.collection.find(
+            {'_id.tag': 'i4x', '_id.org': org, '_id.course': course},
+            {'_id': 1, 'definition': 1, 'metadata': 1}
+        )
+        course_items = self._collate_course_items(resultset)
+
+        if self.request_cache is not None:
+            self.request_cache.data.setdefault('course_items', {}).setdefault(id(self), {})[course_key] = course_items
+        return course_items
+
+    def _collate_course_items(self, resultset):
+        """
+        Make the non-draft Location -> document map for _get_course_items from all of the course's documents.
+        This store ignores drafts.
+        """
+        return dict(
+            (Location(item['_id']), item)
+            for item in resultset
+            if item['_id'].get('revision') is None
+        )
+
+    def _invalidate_course_items(self, location):
+        """
+        Drop the request cached course item maps (of all stores) for the course of location b/c it has changed
+        """
+        if self.request_cache is not None:
+            course_key = metadata_cache_key(Location(location))
+            for store_course_items in self.request_cache.data.get('course_items', {}).itervalues():
+                store_course_items.pop(course_key, None)
+
     def _load_item(self, item, data_cache, apply_cached_metadata=True):
         """
         Load an XModuleDescriptor from item, using the children stored in data_cache
@@ -590,6 +681,22 @@ class MongoModuleStore(ModuleStoreBase):
         """
         return self.get_item(location, depth=depth)
 
+    def get_instances(self, course_id, locations, depth=0):
+        """
+        Get the instances of all of the given (fully specified) locations in one query.
+
+        Returns a dict mapping the Location of each instance found to the instance.
+        """
+        locations = [Location.ensure_fully_specified(location) for location in locations]
+        if not locations:
+            return {}
+        items = self.collection.find(
+            {'$or': [location_to_query(location, wildcard=False) for location in locations]},
+            sort=[('revision', pymongo.ASCENDING)],
+        )
+        modules = self._load_items(list(items), depth)
+        return dict((module.location, module) for module in modules)
+
     def get_items(self, location, course_id=None, depth=0):
         items = self.collection.find(
             location_to_query(location),
@@ -645,6 +752,7 @@ class MongoModuleStore(ModuleStoreBase):
         """
         # Save any changes to the xmodule to the MongoKeyValueStore
         xmodule.save()
+        self._invalidate_course_items(xmodule.location)
         # split mongo's persist_dag is more general and useful.
         self.collection.save({
                 '_id': xmodule.location.dict(),
@@ -734,6 +842,7 @@ class MongoModuleStore(ModuleStoreBase):
         if the location doesn't exist
         """
 
+        self._invalidate_course_items(location)
         # See http://www.mongodb.org/display/DOCS/Updating for
         # atomic update syntax
         result = self.collection.update(
@@ -827,6 +936,7 @@ class MongoModuleStore(ModuleStoreBase):
 
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
+        self._invalidate_course_items(location)
         self.collection.remove({'_id': Location(location).dict()}, safe=self.collection.safe)
         # recompute (and update) the metadata inheritance tree which is cached
         self.refresh_cached_metadata_inheritance_tree(Location(location))
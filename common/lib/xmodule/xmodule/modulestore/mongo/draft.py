@@ -93,6 +93,24 @@ class DraftModuleStore(MongoModuleStore):
         except ItemNotFoundError:
             return wrap_draft(super(DraftModuleStore, self).get_instance(course_id, location, depth=depth))
 
+    def get_instances(self, course_id, locations, depth=0):
+        """
+        Get the instances of all of the given locations (the drafts in preference to the
+        published versions) in one query.
+
+        Returns a dict mapping the (published) Location of each instance found to the instance.
+        """
+        locations = [as_published(location) for location in locations]
+        found = super(DraftModuleStore, self).get_instances(
+            course_id, locations + [as_draft(location) for location in locations], depth=depth
+        )
+        instances = {}
+        for location in locations:
+            instance = found.get(as_draft(location)) or found.get(location)
+            if instance is not None:
+                instances[location] = wrap_draft(instance)
+        return instances
+
     def create_xmodule(self, location, definition_data=None, metadata=None, system=None):
         """
         Create the new xmodule but don't save it. Returns the new module with a draft locator
@@ -146,6 +164,7 @@ class DraftModuleStore(MongoModuleStore):
         if draft_location.category in DIRECT_ONLY_CATEGORIES:
             raise InvalidVersionError(source_location)
         original['_id'] = draft_location.dict()
+        self._invalidate_course_items(draft_location)
         try:
             self.collection.insert(original)
         except pymongo.errors.DuplicateKeyError:
@@ -249,6 +268,20 @@ class DraftModuleStore(MongoModuleStore):
         self.convert_to_draft(location)
         super(DraftModuleStore, self).delete_item(location)
 
+    def _collate_course_items(self, resultset):
+        """
+        Make the non-draft Location -> document map of the course's documents preferring
+        drafts over their non-draft versions
+        """
+        course_items = {}
+        for item in resultset:
+            location = Location(item['_id'])
+            if location.revision == DRAFT:
+                course_items[location.replace(revision=None)] = item
+            elif location.revision is None:
+                course_items.setdefault(location, item)
+        return course_items
+
     def _query_children_for_cache_children(self, items):
         # first get non-draft in a round-trip
         to_process_non_drafts = super(DraftModuleStore, self)._query_children_for_cache_children(items)
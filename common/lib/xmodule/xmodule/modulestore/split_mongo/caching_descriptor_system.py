@@ -48,6 +48,8 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
         self.lazy = lazy
         self.module_data = module_data
         self.default_class = default_class
+        # definition ids of lazy loaders not yet fetched; the first fetch gets them all
+        self.pending_definitions = set()
         # TODO see if self.course_id is needed: is already in course_entry but could be > 1 value
         # Compute inheritance
         modulestore.inherit_metadata(course_entry.get('blocks', {}),
@@ -7,20 +7,34 @@ class DefinitionLazyLoader(object):
     when accessed knows how to get its content. Only useful if the containing
     object doesn't force access during init but waits until client wants the
     definition. Only works if the modulestore is a split mongo store.
+
+    If created with a descriptor system, the loader registers its definition
+    as pending on that system so that the first fetch of any loader in the
+    system pulls all of the pending definitions in one query.
     """
-    def __init__(self, modulestore, definition_id):
+    def __init__(self, modulestore, definition_id, system=None):
         """
         Simple placeholder for yet-to-be-fetched data
         :param modulestore: the pymongo db connection with the definitions
         :param definition_locator: the id of the record in the above to fetch
+        :param system: the CachingDescriptorSystem which batches pending fetches (optional)
         """
         self.modulestore = modulestore
         self.definition_locator = DescriptionLocator(definition_id)
+        self.system = system
+        if system is not None:
+            system.pending_definitions.add(definition_id)
 
     def fetch(self):
         """
         Fetch the definition. Note, the caller should replace this lazy
         loader pointer with the result so as not to fetch more than once
         """
-        return self.modulestore.definitions.find_one(
-            {'_id': self.definition_locator.definition_id})
+        definition_id = self.definition_locator.definition_id
+        if self.system is not None:
+            definition_ids = self.system.pending_definitions
+            definition_ids.add(definition_id)
+            self.system.pending_definitions = set()
+        else:
+            definition_ids = [definition_id]
+        return self.modulestore.get_definitions(definition_ids).get(definition_id)
@@ -3,6 +3,8 @@ import datetime
 import logging
 import pymongo
 import re
+import copy
+from collections import OrderedDict
 from importlib import import_module
 from path import path
 
@@ -38,6 +40,9 @@ log = logging.getLogger(__name__)
 #
 #==============================================================================
 
+# maximum number of definitions kept in the per process definition cache
+DEFINITION_CACHE_SIZE = 10000
+
 
 class SplitMongoModuleStore(ModuleStoreBase):
     """
@@ -70,6 +75,11 @@ class SplitMongoModuleStore(ModuleStoreBase):
         # _add_cache could use a lru mechanism to control the cache size?
         self.thread_cache = threading.local()
 
+        # definitions are immutable (edits create new ids) so they can be cached per process
+        # by id. LRU order is kept by the OrderedDict; guarded by a lock b/c it's shared by threads.
+        self.definition_cache = OrderedDict()
+        self.definition_cache_lock = threading.Lock()
+
         if user is not None and password is not None:
             self.db.authenticate(user, password)
 
@@ -115,15 +125,12 @@ class SplitMongoModuleStore(ModuleStoreBase):
         if lazy:
             for block in new_module_data.itervalues():
                 block['definition'] = DefinitionLazyLoader(self,
-                                                           block['definition'])
+                                                           block['definition'],
+                                                           system)
         else:
             # Load all descendants by id
-            descendent_definitions = self.definitions.find({
-                '_id': {'$in': [block['definition']
-                                for block in new_module_data.itervalues()]}})
-            # turn into a map
-            definitions = {definition['_id']: definition
-                           for definition in descendent_definitions}
+            definitions = self.get_definitions(
+                [block['definition'] for block in new_module_data.itervalues()])
 
             for block in new_module_data.itervalues():
                 if block['definition'] in definitions:
@@ -132,6 +139,41 @@ class SplitMongoModuleStore(ModuleStoreBase):
         system.module_data.update(new_module_data)
         return system.module_data
 
+    def get_definitions(self, definition_ids):
+        '''
+        Get the definitions for the given ids serving what it can from the per process
+        definition cache and fetching the rest in one query.
+
+        Returns a dict of definition_id -> definition. Each definition is a copy which the
+        caller may modify. Ids w/o definitions are omitted.
+        :param definition_ids: iterable of definition ids
+        '''
+        result = {}
+        missing = []
+        with self.definition_cache_lock:
+            for definition_id in definition_ids:
+                if definition_id in self.definition_cache:
+                    definition = self.definition_cache.pop(definition_id)
+                    # reinsert to mark it as most recently used
+                    self.definition_cache[definition_id] = definition
+                    result[definition_id] = definition
+                else:
+                    missing.append(definition_id)
+
+        if missing:
+            if len(missing) == 1:
+                fetched = self.definitions.find({'_id': missing[0]})
+            else:
+                fetched = self.definitions.find({'_id': {'$in': missing}})
+            with self.definition_cache_lock:
+                for definition in fetched:
+                    self.definition_cache[definition['_id']] = definition
+                    result[definition['_id']] = definition
+                while len(self.definition_cache) > DEFINITION_CACHE_SIZE:
+                    self.definition_cache.popitem(last=False)
+
+        return {definition_id: copy.deepcopy(definition) for definition_id, definition in result.iteritems()}
+
     def _load_items(self, course_entry, usage_ids, depth=0, lazy=True):
         '''
         Load & cache the given blocks from the course. Prefetch down to the
@@ -117,6 +117,41 @@ class TestMongoModuleStore(object):
                 '{0} is a template course'.format(course)
             )
 
+    def test_get_instances(self):
+        '''All of the found locations' instances are fetched at once'''
+        locations = [
+            Location("i4x://edX/toy/course/2012_Fall"),
+            Location("i4x://edX/toy/video/Welcome"),
+            Location("i4x://edX/toy/video/NoSuchVideo"),
+        ]
+        instances = self.store.get_instances('edX/toy/2012_Fall', locations)
+        assert_equals(set(instances.keys()), set(locations[:2]))
+        assert_equals(instances[locations[1]].location, locations[1])
+
+    def test_course_items_prefetch(self):
+        '''Loading the whole course should cache its items in the request cache for later loads'''
+        class RequestCache(object):
+            data = {}
+        self.store.request_cache = RequestCache()
+        try:
+            course = self.store.get_item("i4x://edX/toy/course/2012_Fall", depth=None)
+            course_items = self.store._get_request_cached_course_items(('edX', 'toy'))
+            assert_not_equals(course_items, None)
+            assert_equals(
+                len(course_items),
+                self.connection[DB][COLLECTION].find({'_id.org': 'edX', '_id.course': 'toy'}).count()
+            )
+
+            chapter = course.get_children()[0]
+            # served from the cached course items
+            reloaded = self.store.get_item(chapter.location, depth=1)
+            assert_equals(
+                [child.location for child in reloaded.get_children()],
+                [child.location for child in chapter.get_children()]
+            )
+        finally:
+            self.store.request_cache = None
+
 class TestMongoKeyValueStore(object):
 
     def setUp(self):
@@ -375,6 +375,23 @@ class SplitModuleItemTests(SplitModuleTest):
         with self.assertRaises(InsufficientSpecificationError):
             modulestore().get_item(BlockUsageLocator(course_id='GreekHero', revision='draft'))
 
+    # pylint: disable=W0212
+    def test_lazy_definition_batching(self):
+        '''
+        The first lazy definition fetch should get all pending definitions in one query
+        '''
+        modulestore()._clear_cache()
+        modulestore().definition_cache.clear()
+        locator = BlockUsageLocator(course_id='GreekHero', usage_id='head12345', revision='draft')
+        block = modulestore().get_item(locator, depth=1)
+        # forces the fetch of the course's definition
+        self.assertDictEqual(block.grade_cutoffs, {"Pass": 0.45})
+        for child in block.get_children():
+            self.assertIn(child.definition_locator.definition_id, modulestore().definition_cache)
+        self.assertEqual(
+            modulestore().get_definitions(["head12345_12"])["head12345_12"]['_id'], "head12345_12"
+        )
+
     # pylint: disable=W0212
     def test_matching(self):
         '''
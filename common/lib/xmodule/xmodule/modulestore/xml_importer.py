@@ -44,14 +44,12 @@ def import_static_content(modules, course_loc, course_data_path, static_content_
 
                 content = StaticContent(content_loc, filename, mime_type, data, import_path=fullname_with_subpath)
 
-                # first let's save a thumbnail so we can get back a thumbnail location
-                (thumbnail_content, thumbnail_location) = static_content_store.generate_thumbnail(content)
-
-                if thumbnail_content is not None:
-                    content.thumbnail_location = thumbnail_location
+                # first get the thumbnail location; the thumbnail itself is generated in the background
+                static_content_store.schedule_thumbnail(content)
 
                 #then commit the content
                 static_content_store.save(content)
+                static_content_store.queue_thumbnail(content)
 
                 #store the remapping information which will be needed to subsitute in the module data
                 remap_dict[fullname_with_subpath] = content_loc.name
@@ -79,14 +77,12 @@ def verify_content_links(module, base_dir, static_content_store, link, remap_dic
 
                 content = StaticContent(content_loc, filename, mime_type, data, import_path=path)
 
-                # first let's save a thumbnail so we can get back a thumbnail location
-                (thumbnail_content, thumbnail_location) = static_content_store.generate_thumbnail(content)
-
-                if thumbnail_content is not None:
-                    content.thumbnail_location = thumbnail_location
+                # first get the thumbnail location; the thumbnail itself is generated in the background
+                static_content_store.schedule_thumbnail(content)
 
                 #then commit the content
                 static_content_store.save(content)
+                static_content_store.queue_thumbnail(content)
 
                 new_link = StaticContent.get_url_path_from_location(content_loc)
 
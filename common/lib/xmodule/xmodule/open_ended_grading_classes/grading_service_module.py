@@ -1,19 +1,82 @@
 # This class gives a common interface for logging into the grading controller
+#
+# The requests sessions (and so the connection pools and login cookies) are shared by all of the
+# GradingService instances talking to the same service as the same user, identical concurrent GET
+# requests are made only once, and rendered rubrics are cached by the hash of their xml.
+import hashlib
 import json
 import logging
+import threading
+from collections import OrderedDict
+
 import requests
 from requests.exceptions import RequestException, ConnectionError, HTTPError
 
-from .combined_open_ended_rubric import CombinedOpenEndedRubric
+from .combined_open_ended_rubric import CombinedOpenEndedRubric, RubricParsingError
 from lxml import etree
 
 log = logging.getLogger(__name__)
 
+# the number of seconds to wait for the grading controller to respond (unless configured w/ 'timeout')
+GRADING_SERVICE_TIMEOUT = 10
+
+# the maximum number of connections kept open to each grading service
+GRADING_SERVICE_POOL_SIZE = 10
+
+# the number of rendered rubrics to remember
+RENDERED_RUBRIC_CACHE_SIZE = 500
+
+# (login_url, username) -> _SharedSession
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# (rubric xml sha1, view_only) -> rendered rubric html
+_rendered_rubrics = OrderedDict()
+_rendered_rubrics_lock = threading.Lock()
+
 
 class GradingServiceError(Exception):
     pass
 
 
+class _Call(object):
+    """
+    A GET request in flight, whose result is shared by all of the identical requests made meanwhile
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SharedSession(object):
+    """
+    A requests session (w/ its connection pool and login cookies) shared by all of the
+    GradingServices logging into the same service as the same user
+    """
+    def __init__(self):
+        self.session = requests.session(config={'pool_maxsize': GRADING_SERVICE_POOL_SIZE})
+        # serializes logins; the count of logins lets a thread which found it wasn't logged in
+        # tell whether another thread has logged in since
+        self.login_lock = threading.Lock()
+        self.logins = 0
+        # identical GET requests in flight: (url, params, allow_redirects) -> _Call
+        self.calls = {}
+        self.calls_lock = threading.Lock()
+
+
+def _get_shared_session(login_url, username):
+    """
+    Get the _SharedSession for logging into login_url as username
+    """
+    key = (login_url, username)
+    with _sessions_lock:
+        shared = _sessions.get(key)
+        if shared is None:
+            shared = _sessions[key] = _SharedSession()
+        return shared
+
+
 class GradingService(object):
     """
     Interface to staff grading backend.
@@ -22,8 +85,26 @@ class GradingService(object):
     def __init__(self, config):
         self.username = config['username']
         self.password = config['password']
-        self.session = requests.session()
         self.system = config['system']
+        self.timeout = config.get('timeout', GRADING_SERVICE_TIMEOUT)
+        self._shared = None
+
+    @property
+    def shared_session(self):
+        """
+        The _SharedSession for this service. (The subclasses set the login_url after calling
+        GradingService.__init__, so it's looked up on first use.)
+        """
+        if self._shared is None:
+            self._shared = _get_shared_session(self.login_url, self.username)
+        return self._shared
+
+    @property
+    def session(self):
+        """
+        The requests session for this service
+        """
+        return self.shared_session.session
 
     def _login(self):
         """
@@ -35,7 +116,8 @@ class GradingService(object):
         """
         response = self.session.post(self.login_url,
                                      {'username': self.username,
-                                      'password': self.password, })
+                                      'password': self.password, },
+                                     timeout=self.timeout)
 
         response.raise_for_status()
 
@@ -47,7 +129,8 @@ class GradingService(object):
         """
         try:
             op = lambda: self.session.post(url, data=data,
-                                           allow_redirects=allow_redirects)
+                                           allow_redirects=allow_redirects,
+                                           timeout=self.timeout)
             r = self._try_with_login(op)
         except (RequestException, ConnectionError, HTTPError) as err:
             # reraise as promised GradingServiceError, but preserve stacktrace.
@@ -59,13 +142,49 @@ class GradingService(object):
         return r.text
 
     def get(self, url, params, allow_redirects=False):
+        """
+        Make a get request to the grading controller.
+
+        If an identical request (by the same user) is already in flight, waits for it and returns
+        its result rather than making the request again.
+        """
+        shared = self.shared_session
+        key = (url, json.dumps(params, sort_keys=True), allow_redirects)
+        with shared.calls_lock:
+            call = shared.calls.get(key)
+            in_flight = call is not None
+            if not in_flight:
+                call = shared.calls[key] = _Call()
+
+        if in_flight:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._get(url, params, allow_redirects)
+        except GradingServiceError as err:
+            call.error = err
+            raise
+        except Exception:
+            call.error = GradingServiceError("Problem getting data from the grading controller.  URL: {0}".format(url))
+            raise
+        finally:
+            with shared.calls_lock:
+                del shared.calls[key]
+            call.done.set()
+        return call.result
+
+    def _get(self, url, params, allow_redirects=False):
         """
         Make a get request to the grading controller
         """
         log.debug(params)
         op = lambda: self.session.get(url,
                                       allow_redirects=allow_redirects,
-                                      params=params)
+                                      params=params,
+                                      timeout=self.timeout)
         try:
             r = self._try_with_login(op)
         except (RequestException, ConnectionError, HTTPError) as err:
@@ -80,20 +199,25 @@ class GradingService(object):
     def _try_with_login(self, operation):
         """
         Call operation(), which should return a requests response object.  If
-        the request fails with a 'login_required' error, call _login() and try
-        the operation again.
+        the request fails with a 'login_required' error, call _login() (unless
+        another request has logged in meanwhile) and try the operation again.
 
         Returns the result of operation().  Does not catch exceptions.
         """
+        shared = self.shared_session
+        logins = shared.logins
         response = operation()
         if (response.json
             and response.json.get('success') is False
             and response.json.get('error') == 'login_required'):
             # apparrently we aren't logged in.  Try to fix that.
-            r = self._login()
-            if r and not r.get('success'):
-                log.warning("Couldn't log into staff_grading backend. Response: %s",
-                            r)
+            with shared.login_lock:
+                if shared.logins == logins:
+                    r = self._login()
+                    shared.logins += 1
+                    if r and not r.get('success'):
+                        log.warning("Couldn't log into staff_grading backend. Response: %s",
+                                    r)
                 # try again
             response = operation()
             response.raise_for_status()
@@ -103,7 +227,8 @@ class GradingService(object):
     def _render_rubric(self, response, view_only=False):
         """
         Given an HTTP Response with the key 'rubric', render out the html
-        required to display the rubric and put it back into the response
+        required to display the rubric and put it back into the response.
+        The rendered html is cached by the hash of the rubric xml.
 
         returns the updated response as a dictionary that can be serialized later
 
@@ -116,14 +241,20 @@ class GradingService(object):
         try:
             if 'rubric' in response_json:
                 rubric = response_json['rubric']
-                rubric_renderer = CombinedOpenEndedRubric(self.system, view_only)
-                rubric_dict = rubric_renderer.render_rubric(rubric)
-                success = rubric_dict['success']
-                rubric_html = rubric_dict['html']
+                key = (hashlib.sha1(rubric.encode('utf-8')).hexdigest(), view_only)
+                with _rendered_rubrics_lock:
+                    rubric_html = _rendered_rubrics.get(key)
+                if rubric_html is None:
+                    rubric_renderer = CombinedOpenEndedRubric(self.system, view_only)
+                    rubric_html = rubric_renderer.render_rubric(rubric)['html']
+                    with _rendered_rubrics_lock:
+                        _rendered_rubrics[key] = rubric_html
+                        while len(_rendered_rubrics) > RENDERED_RUBRIC_CACHE_SIZE:
+                            _rendered_rubrics.popitem(last=False)
                 response_json['rubric'] = rubric_html
             return response_json
         # if we can't parse the rubric into HTML,
-        except etree.XMLSyntaxError, RubricParsingError:
+        except (etree.XMLSyntaxError, RubricParsingError):
             #This is a dev_facing_error
             log.exception("Cannot parse rubric string. Raw string: {0}"
             .format(rubric))
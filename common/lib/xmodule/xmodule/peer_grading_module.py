@@ -8,6 +8,7 @@ from pkg_resources import resource_string
 from .capa_module import ComplexEncoder
 from .x_module import XModule
 from xmodule.raw_module import RawDescriptor
+from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from .timeinfo import TimeInfo
@@ -23,6 +24,28 @@ log = logging.getLogger(__name__)
 
 EXTERNAL_GRADER_NO_CONTACT_ERROR = "Failed to contact external graders.  Please notify course staff."
 
+# how long to cache a student's peer grading data (counts) for a location
+PEER_GRADING_DATA_CACHE_TIMEOUT = 5 * 60
+# how long to cache the list of problems a student can peer grade in a course
+PEER_GRADING_PROBLEM_LIST_CACHE_TIMEOUT = 60
+# how long to keep the last known data to fall back on if the grading controller can't be reached
+PEER_GRADING_DATA_FALLBACK_TIMEOUT = 7 * 24 * 60 * 60
+
+
+def peer_grading_data_cache_key(location, student_id):
+    """
+    The system cache key for the peer grading data of the student for the location
+    """
+    return u'peer_grading.data_for_location.{0}.{1}'.format(location, student_id)
+
+
+def peer_grading_problem_list_cache_key(course_id, student_id):
+    """
+    The system cache key for the list of problems the student can peer grade in the course
+    """
+    return u'peer_grading.problem_list.{0}.{1}'.format(course_id, student_id)
+
+
 class PeerGradingFields(object):
     use_for_single_location = Boolean(
         display_name="Show Single Problem",
@@ -186,11 +209,24 @@ class PeerGradingModule(PeerGradingFields, XModule):
         return json.dumps(d, cls=ComplexEncoder)
 
     def query_data_for_location(self):
+        """
+        Get the student's peer grading data (counts) for the linked location. The data is cached
+        (see PEER_GRADING_DATA_CACHE_TIMEOUT) so that computing grades and rendering progress don't
+        query the grading controller for each student every time. If the controller can't be
+        reached, the last data it gave (if any) is used.
+
+        Returns (success, data)
+        """
         student_id = self.system.anonymous_student_id
         location = self.link_to_location
+        cache_key = peer_grading_data_cache_key(location, student_id)
         success = False
         response = {}
 
+        cached = self.system.cache.get(cache_key)
+        if cached is not None:
+            return True, cached
+
         try:
             response = self.peer_gs.get_data_for_location(location, student_id)
             count_graded = response['count_graded']
@@ -200,7 +236,13 @@ class PeerGradingModule(PeerGradingFields, XModule):
             # This is a dev_facing_error
             log.exception("Error getting location data from controller for location {0}, student {1}"
             .format(location, student_id))
+            fallback = self.system.cache.get(cache_key + '.fallback')
+            if fallback is not None:
+                return True, fallback
 
+        if success:
+            self.system.cache.set(cache_key, response, PEER_GRADING_DATA_CACHE_TIMEOUT)
+            self.system.cache.set(cache_key + '.fallback', response, PEER_GRADING_DATA_FALLBACK_TIMEOUT)
         return success, response
 
     def get_progress(self):
@@ -326,6 +368,11 @@ class PeerGradingModule(PeerGradingFields, XModule):
         try:
             response = self.peer_gs.save_grade(location, grader_id, submission_id,
                                                score, feedback, submission_key, rubric_scores, submission_flagged)
+            # the grader's count of graded submissions has changed
+            data_cache_key = peer_grading_data_cache_key(location, grader_id)
+            self.system.cache.delete(data_cache_key)
+            self.system.cache.delete(data_cache_key + '.fallback')
+            self.system.cache.delete(peer_grading_problem_list_cache_key(self.system.course_id, grader_id))
             return response
         except GradingServiceError:
             # This is a dev_facing_error
@@ -484,6 +531,19 @@ class PeerGradingModule(PeerGradingFields, XModule):
         })
         return html
 
+    def _get_problem_list(self):
+        """
+        Get the list of problems to peer grade (w/ the student's counts for each) from the grading
+        controller. Successful responses are cached for PEER_GRADING_PROBLEM_LIST_CACHE_TIMEOUT.
+        """
+        cache_key = peer_grading_problem_list_cache_key(self.system.course_id, self.system.anonymous_student_id)
+        problem_list_dict = self.system.cache.get(cache_key)
+        if problem_list_dict is None:
+            problem_list_dict = self.peer_gs.get_problem_list(self.system.course_id, self.system.anonymous_student_id)
+            if isinstance(problem_list_dict, dict) and problem_list_dict.get('success'):
+                self.system.cache.set(cache_key, problem_list_dict, PEER_GRADING_PROBLEM_LIST_CACHE_TIMEOUT)
+        return problem_list_dict
+
     def peer_grading(self, _data=None):
         '''
         Show a peer grading interface
@@ -494,8 +554,7 @@ class PeerGradingModule(PeerGradingFields, XModule):
         error_text = ""
         problem_list = []
         try:
-            problem_list_json = self.peer_gs.get_problem_list(self.system.course_id, self.system.anonymous_student_id)
-            problem_list_dict = problem_list_json
+            problem_list_dict = self._get_problem_list()
             success = problem_list_dict['success']
             if 'error' in problem_list_dict:
                 error_text = problem_list_dict['error']
@@ -518,20 +577,17 @@ class PeerGradingModule(PeerGradingFields, XModule):
             success = False
 
 
-        def _find_corresponding_module_for_location(location):
-            '''
-            find the peer grading module that links to the given location
-            '''
-            try:
-                return modulestore().get_instance(self.system.course_id, location)
-            except:
-                # the linked problem doesn't exist
-                log.error("Problem {0} does not exist in this course".format(location))
-                raise
+        # find the linked problems (for their due dates) all at once
+        descriptors = modulestore().get_instances(
+            self.system.course_id, [problem['location'] for problem in problem_list]
+        )
 
         for problem in problem_list:
             problem_location = problem['location']
-            descriptor = _find_corresponding_module_for_location(problem_location)
+            descriptor = descriptors.get(Location(problem_location))
+            if descriptor is None:
+                # the linked problem doesn't exist
+                log.error("Problem {0} does not exist in this course".format(problem_location))
             if descriptor:
                 problem['due'] = descriptor._model_data.get('due', None)
                 grace_period_string = descriptor._model_data.get('graceperiod', None)
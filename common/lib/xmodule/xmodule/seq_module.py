@@ -67,8 +67,49 @@ class SequenceModule(SequenceFields, XModule):
         if dispatch == 'goto_position':
             self.position = int(data['position'])
             return json.dumps({'success': True})
+        elif dispatch == 'render_position':
+            # the content of a position which wasn't rendered with the sequence (see render)
+            items = self.get_display_items()
+            position = int(data['position'])
+            if not 1 <= position <= len(items):
+                raise NotFoundError('Position {0} out of range'.format(position))
+            return json.dumps({'success': True, 'content': items[position - 1].get_html()})
         raise NotFoundError('Unexpected dispatch type')
 
+    @property
+    def lazy(self):
+        """
+        Whether only the active position is rendered with the sequence (the others being
+        fetched w/ the render_position dispatch when the student navigates to them)
+        """
+        return bool(self.system.get('lazy_sequence_rendering')) and self.system.get('get_recorded_score') is not None
+
+    def _recorded_progress(self, descriptor):
+        """
+        The Progress of the scored modules under (and including) the descriptor according to
+        the scores recorded for them, so w/o instantiating them.  Modules w/o a recorded score
+        count as 0 out of their weight (or 1), which gives the same progress status as an
+        unattempted problem.  Like CapaModule.get_progress, modules which are worth nothing
+        (a weight or recorded max score of 0) have no progress.
+        """
+        if descriptor.has_score:
+            weight = getattr(descriptor, 'weight', None)
+            if weight is not None and weight <= 0:
+                return None
+            score = self.system.get('get_recorded_score')(descriptor.location)
+            if score is None or score[0] is None:
+                return Progress(0, 1 if weight is None else weight)
+            grade, max_grade = score
+            if not max_grade:
+                return None
+            if weight is not None:
+                grade, max_grade = grade * weight / max_grade, weight
+            return Progress(grade, max_grade)
+        if descriptor.has_children:
+            progresses = [self._recorded_progress(child) for child in descriptor.get_children()]
+            return reduce(Progress.add_counts, progresses, None)
+        return None
+
     def render(self):
         # If we're rendering this sequence, but no position is set yet,
         # default the position to the first element
@@ -79,7 +120,11 @@ class SequenceModule(SequenceFields, XModule):
             return
         ## Returns a set of all types of all sub-children
         contents = []
-        for child in self.get_display_items():
+        for index, child in enumerate(self.get_display_items()):
+            if self.lazy and index + 1 != self.position:
+                # describe the position from its descriptors w/o instantiating its children
+                contents.append(self._lazy_childinfo(child))
+                continue
             progress = child.get_progress()
             childinfo = {
                 'content': child.get_html(),
@@ -101,12 +146,41 @@ class SequenceModule(SequenceFields, XModule):
                   'element_id': self.location.html_id(),
                   'item_id': self.id,
                   'position': self.position,
-                  'tag': self.location.category
+                  'tag': self.location.category,
+                  'prefetch': self.lazy and bool(self.system.get('prefetch_sequence_neighbors')),
                   }
 
         self.content = self.system.render_template('seq_module.html', params)
         self.rendered = True
 
+    def _lazy_childinfo(self, child):
+        """
+        The item for a position which isn't rendered with the sequence: its content is None and
+        its title, type and progress come from the descriptors of its children
+        """
+        grand_children = child.descriptor.get_children() if child.has_children else []
+        progress = self._recorded_progress(child.descriptor)
+        if grand_children:
+            child_classes = set(grand_child.module_class.icon_class for grand_child in grand_children)
+            icon_class = 'other'
+            for c in class_priority:
+                if c in child_classes:
+                    icon_class = c
+        else:
+            icon_class = child.get_icon_class()
+        return {
+            'content': None,
+            'title': "\n".join(
+                grand_child.display_name
+                for grand_child in grand_children
+                if grand_child.display_name is not None
+            ) or child.display_name_with_default,
+            'progress_status': Progress.to_js_status_str(progress),
+            'progress_detail': Progress.to_js_detail_str(progress),
+            'type': icon_class,
+            'id': child.id,
+        }
+
     def get_icon_class(self):
         child_classes = set(child.get_icon_class()
                             for child in self.get_children())
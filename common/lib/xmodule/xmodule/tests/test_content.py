@@ -1,6 +1,9 @@
 import unittest
+import StringIO
+from PIL import Image
 from xmodule.contentstore.content import StaticContent
 from xmodule.contentstore.content import ContentStore
+from xmodule.contentstore.thumbnails import ThumbnailGenerator
 from xmodule.modulestore import Location
 
 
@@ -10,6 +13,37 @@ class Content:
         self.content_type = content_type
 
 
+class MemoryContentStore(ContentStore):
+    """
+    A ContentStore keeping its content in a dict, counting the thumbnails it generates
+    """
+    thumbnail_sizes = ((128, 128), (32, 32))
+
+    def __init__(self):
+        self.contents = {}
+        self.generated = 0
+
+    def save(self, content):
+        self.contents[content.location] = content
+        return content
+
+    def find(self, location, throw_on_not_found=True, as_stream=False):
+        return self.contents.get(location)
+
+    def generate_thumbnail(self, content, tempfile_path=None, dimensions=None):
+        self.generated += 1
+        return super(MemoryContentStore, self).generate_thumbnail(content, tempfile_path, dimensions)
+
+
+def image_data():
+    """
+    The data of a small png
+    """
+    image_file = StringIO.StringIO()
+    Image.new('RGB', (256, 256)).save(image_file, 'PNG')
+    return image_file.getvalue()
+
+
 class ContentTest(unittest.TestCase):
     def test_thumbnail_none(self):
         # We had a bug where a thumbnail location of None was getting transformed into a Location tuple, with
@@ -30,3 +64,40 @@ class ContentTest(unittest.TestCase):
         # still happen.
         asset_location = StaticContent.compute_location('mitX', '400', 'subs__1eo_jXvZnE .srt.sjson')
         self.assertEqual(Location(u'c4x', u'mitX', u'400', u'asset', u'subs__1eo_jXvZnE_.srt.sjson', None), asset_location)
+
+    def test_thumbnail_names(self):
+        self.assertEqual(StaticContent.generate_thumbnail_name('foo.png'), 'foo.jpg')
+        self.assertEqual(StaticContent.generate_thumbnail_name('foo.png', (32, 32)), 'foo-32x32.jpg')
+        self.assertEqual(StaticContent.parse_thumbnail_name('foo-32x32.jpg'), ('foo.jpg', (32, 32)))
+        self.assertEqual(StaticContent.parse_thumbnail_name('foo.jpg'), ('foo.jpg', None))
+
+    def test_schedule_thumbnail(self):
+        store = MemoryContentStore()
+        content = StaticContent(StaticContent.compute_location('mitX', '800', 'notes.txt'), 'notes.txt', 'text/plain', 'data')
+        self.assertIsNone(store.schedule_thumbnail(content))
+        self.assertIsNone(content.thumbnail_location)
+
+        content = StaticContent(StaticContent.compute_location('mitX', '800', 'cat.png'), 'cat.png', 'image/png', image_data())
+        thumbnail_location = store.schedule_thumbnail(content)
+        self.assertEqual(StaticContent.compute_location('mitX', '800', 'cat.jpg', is_thumbnail=True), thumbnail_location)
+        self.assertEqual(thumbnail_location, content.thumbnail_location)
+
+        store.save(content)
+        store.queue_thumbnail(content)
+        store.get_thumbnail_generator().wait()
+        self.assertIn(thumbnail_location, store.contents)
+        self.assertIn(StaticContent.compute_location('mitX', '800', 'cat-32x32.jpg', is_thumbnail=True), store.contents)
+
+    def test_thumbnail_dedup(self):
+        # identical images are only rendered once per size
+        store = MemoryContentStore()
+        generator = ThumbnailGenerator(store)
+        data = image_data()
+        for name in ('one.png', 'two.png'):
+            content = StaticContent(StaticContent.compute_location('mitX', '800', name), name, 'image/png', data)
+            results = generator.generate(content)
+            self.assertEqual(len(results), 2)
+            for thumbnail_content, thumbnail_location in results:
+                self.assertIsNotNone(thumbnail_content)
+                self.assertIn(thumbnail_location, store.contents)
+        self.assertEqual(store.generated, 2)
@@ -1,5 +1,6 @@
 import unittest
 import datetime
+import time
 
 from fs.memoryfs import MemoryFS
 
@@ -176,3 +177,67 @@ class DiscussionTopicsTestCase(unittest.TestCase):
     def test_default_discussion_topics(self):
         d = get_dummy_course('2012-12-02T12:00')
         self.assertEqual({'General': {'id': 'i4x-test_org-test_course-course-test'}}, d.discussion_topics)
+
+
+class DictCache(object):
+    """
+    A minimal stand in for a django cache
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def add(self, key, value, timeout=None):
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+
+TOC_XML = '<table_of_contents><entry page="1" name="One"/><entry page="2" name="Two"><entry page="5" name="Five"/></entry></table_of_contents>'
+
+
+class TextbookTocTestCase(unittest.TestCase):
+    def setUp(self):
+        xmodule.course_module.Textbook.toc_cache = DictCache()
+
+    def tearDown(self):
+        xmodule.course_module.Textbook.toc_cache = None
+
+    @patch('xmodule.course_module.requests.get')
+    def test_cached(self, mock_get):
+        mock_get.return_value.text = TOC_XML
+        textbook = xmodule.course_module.Textbook('Book', 'http://example.com/cached/')
+        self.assertEqual((textbook.start_page, textbook.end_page), (1, 5))
+        self.assertEqual(mock_get.call_count, 1)
+
+        # served from the cache (and parsed only once)
+        other = xmodule.course_module.Textbook('Book', 'http://example.com/cached/')
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIs(other.table_of_contents, textbook.table_of_contents)
+
+    @patch('xmodule.course_module._refresh_toc')
+    @patch('xmodule.course_module.requests.get')
+    def test_stale(self, mock_get, mock_refresh):
+        mock_get.return_value.text = TOC_XML
+        xmodule.course_module.Textbook('Book', 'http://example.com/stale/')
+        self.assertFalse(mock_refresh.called)
+
+        # stale tables of contents are served and refreshed in the background
+        stale_time = time.time() + xmodule.course_module.TOC_FRESH_SECONDS + 1
+        with patch('xmodule.course_module.time.time', return_value=stale_time):
+            textbook = xmodule.course_module.Textbook('Book', 'http://example.com/stale/')
+        self.assertEqual(textbook.end_page, 5)
+        self.assertEqual(mock_get.call_count, 1)
+        mock_refresh.assert_called_once_with('http://example.com/stale/toc.xml')
+
+    @patch('xmodule.course_module.threading.Thread')
+    def test_refresh_once(self, mock_thread):
+        xmodule.course_module._refresh_toc('http://example.com/refresh/toc.xml')
+        xmodule.course_module._refresh_toc('http://example.com/refresh/toc.xml')
+        self.assertEqual(mock_thread.call_count, 1)
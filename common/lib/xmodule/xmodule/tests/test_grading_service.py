@@ -0,0 +1,76 @@
+"""
+Tests of the grading service client shared by the open ended grading services
+"""
+import json
+import unittest
+
+from mock import Mock, patch
+
+from xmodule.open_ended_grading_classes import grading_service_module
+from xmodule.open_ended_grading_classes.peer_grading_service import PeerGradingService
+
+from . import get_test_system, open_ended_grading_interface
+
+RUBRIC = '''<rubric><category>
+    <description>Response Quality</description>
+    <option>The response is not a satisfactory answer to the question.</option>
+    <option>The response is a satisfactory answer to the question.</option>
+</category></rubric>'''
+
+
+def json_response(content):
+    """A mock requests response with the given json content"""
+    return Mock(json=content, text=json.dumps(content))
+
+
+class GradingServiceTest(unittest.TestCase):
+    def setUp(self):
+        grading_service_module._sessions.clear()
+        grading_service_module._rendered_rubrics.clear()
+        self.system = get_test_system()
+        self.system.render_template = Mock(return_value='rendered rubric')
+        self.service = PeerGradingService(dict(open_ended_grading_interface), self.system)
+
+    def test_shared_session(self):
+        other = PeerGradingService(dict(open_ended_grading_interface), self.system)
+        self.assertIs(self.service.session, other.session)
+
+    def test_timeout(self):
+        with patch.object(self.service.session, 'get', return_value=json_response({'success': True})) as get:
+            self.service.get_problem_list('course', 'grader')
+        self.assertEqual(get.call_args[1]['timeout'], grading_service_module.GRADING_SERVICE_TIMEOUT)
+
+    def test_login(self):
+        responses = [json_response({'success': False, 'error': 'login_required'}), json_response({'success': True})]
+        with patch.object(self.service.session, 'post', return_value=json_response({'success': True})) as post:
+            response = self.service._try_with_login(lambda: responses.pop(0))
+        self.assertEqual(response.json, {'success': True})
+        self.assertEqual(post.call_count, 1)
+
+    def test_no_login_after_another_request_logged_in(self):
+        shared = self.service.shared_session
+
+        def operation():
+            if shared.logins == 0:
+                # another request logs in while this one is in flight
+                shared.logins += 1
+                return json_response({'success': False, 'error': 'login_required'})
+            return json_response({'success': True})
+
+        with patch.object(self.service.session, 'post') as post:
+            response = self.service._try_with_login(operation)
+        self.assertEqual(response.json, {'success': True})
+        self.assertFalse(post.called)
+
+    def test_rendered_rubric_cached(self):
+        response = json.dumps({'success': True, 'rubric': RUBRIC})
+        self.assertEqual(self.service._render_rubric(response)['rubric'], 'rendered rubric')
+        self.assertEqual(self.service._render_rubric(response)['rubric'], 'rendered rubric')
+        self.assertEqual(self.system.render_template.call_count, 1)
+
+        self.service._render_rubric(response, view_only=True)
+        self.assertEqual(self.system.render_template.call_count, 2)
+
+    def test_bad_rubric(self):
+        response = json.dumps({'success': True, 'rubric': '<rubric><category></rubric>'})
+        self.assertFalse(self.service._render_rubric(response)['success'])
@@ -1,5 +1,8 @@
 import unittest
+from mock import Mock
 from xmodule.modulestore import Location
+from xmodule.open_ended_grading_classes.peer_grading_service import GradingServiceError
+from xmodule.peer_grading_module import peer_grading_data_cache_key
 from .import get_test_system
 from test_util_open_ended import MockQueryDict, DummyModulestore
 
@@ -135,6 +138,69 @@ class PeerGradingModuleTest(unittest.TestCase, DummyModulestore):
         """
         self.peer_grading.get_instance_state()
 
+    def test_get_data_cached(self):
+        """
+        The data from the grading service is cached until the student grades again
+        @return:
+        """
+        self.peer_grading.system.cache = DictCache()
+        self.peer_grading.peer_gs = Mock(wraps=self.peer_grading.peer_gs)
+        save_dict = MockQueryDict()
+        save_dict.update(self.save_dict)
+        save_dict['location'] = self.peer_grading.link_to_location
+        self.peer_grading.query_data_for_location()
+        success, data = self.peer_grading.query_data_for_location()
+        self.assertEqual(success, True)
+        self.assertEqual(data['count_graded'], 3)
+        self.assertEqual(self.peer_grading.peer_gs.get_data_for_location.call_count, 1)
+
+        self.peer_grading.save_grade(save_dict)
+        self.peer_grading.query_data_for_location()
+        self.assertEqual(self.peer_grading.peer_gs.get_data_for_location.call_count, 2)
+
+        # the last known data is used if the grading service is down once the data expired
+        cache_key = peer_grading_data_cache_key(self.peer_grading.link_to_location,
+                                                self.peer_grading.system.anonymous_student_id)
+        self.peer_grading.system.cache.delete(cache_key)
+        self.peer_grading.peer_gs.get_data_for_location = Mock(side_effect=GradingServiceError)
+        success, data = self.peer_grading.query_data_for_location()
+        self.assertEqual(success, True)
+        self.assertEqual(data['count_graded'], 3)
+
+        # but not once the student graded again, as it's out of date
+        self.peer_grading.save_grade(save_dict)
+        success, data = self.peer_grading.query_data_for_location()
+        self.assertEqual(success, False)
+        self.assertNotIn(cache_key + '.fallback', self.peer_grading.system.cache.data)
+
+    def test_problem_list_cached(self):
+        """
+        The list of problems to grade is cached
+        @return:
+        """
+        self.peer_grading.system.cache = DictCache()
+        self.peer_grading.peer_gs = Mock(wraps=self.peer_grading.peer_gs)
+        self.peer_grading.peer_grading()
+        self.peer_grading.peer_grading()
+        self.assertEqual(self.peer_grading.peer_gs.get_problem_list.call_count, 1)
+
+
+class DictCache(object):
+    """
+    A minimal system cache
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
 class PeerGradingModuleScoredTest(unittest.TestCase, DummyModulestore):
     """
     Test peer grading xmodule at the unit level.  More detailed tests are difficult, as the module relies on an
@@ -77,6 +77,11 @@ class VideoModule(VideoFields, XModule):
         """Return information about state (position)."""
         return json.dumps({'position': self.position})
 
+    @property
+    def has_user_independent_html(self):
+        # the only user state rendered is the position
+        return self.position == 0
+
     def get_html(self):
         return self.system.render_template('video.html', {
             'youtube_id_0_75': self.youtube_id_0_75,
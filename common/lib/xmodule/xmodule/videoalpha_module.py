@@ -66,6 +66,7 @@ class VideoAlphaModule(VideoAlphaFields, XModule):
     """
     video_time = 0
     icon_class = 'video'
+    has_user_independent_html = True
 
     js = {
         'js': [resource_string(__name__, 'js/src/videoalpha/display/html5_video.js')],
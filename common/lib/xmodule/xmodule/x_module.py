@@ -150,6 +150,11 @@ class XModule(XModuleFields, HTMLSnippet, XBlock):
     # in the module
     icon_class = 'other'
 
+    # Whether the output of get_html is the same for every user (so depends only on the
+    # module's content and settings), in which case the runtime may share it between users.
+    # Subclasses whose output only sometimes depends on the user can make this a property.
+    has_user_independent_html = False
+
 
     def __init__(self, runtime, descriptor, model_data):
         '''
@@ -944,9 +949,10 @@ class ModuleSystem(object):
         xblock_model_data - A function that constructs a model_data for an xblock from its
             corresponding descriptor
 
-        cache - A cache object with two methods:
+        cache - A cache object with three methods:
             .get(key) returns an object from the cache or None.
             .set(key, value, timeout_secs=None) stores a value in the cache with a timeout.
+            .delete(key) removes a value from the cache.
 
         can_execute_unsafe_code - A function returning a boolean, whether or
             not to allow the execution of unsafe, unsandboxed code.
@@ -1000,3 +1006,6 @@ class DoNothingCache(object):
 
     def set(self, key, value, timeout=None):
         pass
+
+    def delete(self, key):
+        pass
@@ -6,7 +6,10 @@ from datetime import datetime, timedelta
 from functools import partial
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 
 from xmodule.course_module import CourseDescriptor
 from xmodule.error_module import ErrorDescriptor
@@ -482,6 +485,62 @@ course_beta_test_group_name.__test__ = False
 
 
 
+def _group_names_cache_key(user_id):
+    """
+    The cache key for the names of the groups of the user with the given id
+    """
+    return 'courseware.access.group_names.{0}'.format(user_id)
+
+
+def _get_group_names(user):
+    """
+    Returns the set of the names of the user's groups.
+
+    For django Users (e.g., request.user), the names are cached on the user object, so they're
+    looked up once per request, and shared between requests for ACCESS_GROUP_NAMES_CACHE_TIMEOUT
+    seconds in the django cache.
+    """
+    if not isinstance(user, User):
+        return set(g.name for g in user.groups.all())
+
+    group_names = getattr(user, '_group_names', None)
+    if group_names is not None:
+        return group_names
+
+    timeout = getattr(settings, 'ACCESS_GROUP_NAMES_CACHE_TIMEOUT', 0)
+    if timeout:
+        group_names = cache.get(_group_names_cache_key(user.id))
+    if group_names is None:
+        group_names = set(g.name for g in user.groups.all())
+        if timeout:
+            cache.set(_group_names_cache_key(user.id), group_names, timeout)
+
+    user._group_names = group_names
+    return group_names
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _invalidate_group_names(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Forget the cached group names of the users whose groups changed
+    """
+    if action == 'pre_clear' and reverse:
+        # group.user_set is being cleared, its users can only be found before it's done.  They're
+        # forgotten both now and once it's cleared, in case they're cached again in between
+        instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+        user_ids = instance._cleared_user_ids
+    elif action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    elif reverse:
+        # group.user_set changed
+        user_ids = pk_set if pk_set is not None else instance.__dict__.pop('_cleared_user_ids', [])
+    else:
+        user_ids = [instance.id]
+        instance.__dict__.pop('_group_names', None)
+        instance.__dict__.pop('_course_access', None)
+    cache.delete_many([_group_names_cache_key(user_id) for user_id in user_ids])
+
+
 def _has_global_staff_access(user):
     if user.is_staff:
         debug("Allow: user.is_staff")
@@ -504,9 +563,6 @@ def _adjust_start_date_for_beta_testers(user, descriptor):
     Returns:
         A datetime.  Either the same as start, or earlier for beta testers.
 
-    NOTE: number of days to adjust should be cached to avoid looking it up thousands of
-    times per query.
-
     NOTE: For now, this function assumes that the descriptor's location is in the course
     the user is looking at.  Once we have proper usages and definitions per the XBlock
     design, this should use the course the usage is in.
@@ -518,7 +574,7 @@ def _adjust_start_date_for_beta_testers(user, descriptor):
         # bail early if no beta testing is set up
         return descriptor.lms.start
 
-    user_groups = [g.name for g in user.groups.all()]
+    user_groups = _get_group_names(user)
 
     beta_group = course_beta_test_group_name(descriptor.location)
     if beta_group in user_groups:
@@ -552,6 +608,9 @@ def _has_access_to_location(user, location, access_level, course_context):
     course is a string: the course field of the location being accessed.
     location = location
     access_level = string, either "staff" or "instructor"
+
+    For django Users, the result is remembered on the user (per access_level and course) for
+    the rest of the request.
     '''
     if user is None or (not user.is_authenticated()):
         debug("Deny: no user or anon user")
@@ -564,8 +623,26 @@ def _has_access_to_location(user, location, access_level, course_context):
         debug("Allow: user.is_staff")
         return True
 
+    if not isinstance(user, User):
+        return _has_group_access_to_location(user, location, access_level, course_context)
+
+    # the groups checked depend only on the course and the course run
+    loc = Location(location)
+    course_id = loc.course_id if loc.category == 'course' else course_context
+    access_key = (access_level, loc.course, course_id)
+    course_access = user.__dict__.setdefault('_course_access', {})
+    if access_key not in course_access:
+        course_access[access_key] = _has_group_access_to_location(user, location, access_level, course_context)
+    return course_access[access_key]
+
+
+def _has_group_access_to_location(user, location, access_level, course_context):
+    """
+    Returns True if the user is in one of the staff or instructor groups giving access_level
+    access to the location (see _has_access_to_location)
+    """
     # If not global staff, is the user in the Auth group for this class?
-    user_groups = [g.name for g in user.groups.all()]
+    user_groups = _get_group_names(user)
 
     if access_level == 'staff':
         staff_groups = group_names_for_staff(location, course_context) + \
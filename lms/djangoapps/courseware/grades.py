@@ -1,16 +1,20 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 
+import hashlib
 import random
 import logging
 
 from collections import defaultdict
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 
+from .access import has_access
 from .model_data import ModelDataCache, LmsKeyValueStore
 from xblock.core import Scope
 from .module_render import get_module, get_module_for_descriptor
+from xmodule_modifiers import content_version
 from xmodule import graders
 from xmodule.capa_module import CapaModule
 from xmodule.graders import Score
@@ -18,6 +22,9 @@ from .models import StudentModule
 
 log = logging.getLogger("mitx.courseware")
 
+# How long (in seconds) the max score of a version of a problem is cached for progress_summary
+MAX_SCORE_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 def yield_module_descendents(module):
     stack = module.get_display_items()
@@ -254,10 +261,45 @@ def grade_for_percentage(grade_cutoffs, percentage):
     return letter_grade
 
 
-# TODO: This method is not very good. It was written in the old course style and
-# then converted over and performance is not good. Once the progress page is redesigned
-# to not have the progress summary this method should be deleted (so it won't be copied).
-def progress_summary(student, request, course, model_data_cache):
+def _recorded_scores(student, course_id):
+    """
+    The (grade, max_grade) of each module of the course the student has been graded on,
+    keyed by location url, from one query
+    """
+    return dict(
+        (module_state_key, (grade, max_grade))
+        for module_state_key, grade, max_grade in StudentModule.objects.filter(
+            student=student, course_id=course_id, max_grade__isnull=False
+        ).values_list('module_state_key', 'grade', 'max_grade')
+    )
+
+
+def _max_score_key(course_id, descriptor):
+    """The cache key of the max score of the current version of the problem"""
+    return 'courseware.grades.max_score.' + hashlib.md5(u'{0}|{1}|{2}'.format(
+        course_id, descriptor.location.url(), content_version(descriptor)
+    ).encode('utf-8')).hexdigest()
+
+
+def _static_descendents(descriptor):
+    """
+    The descriptor and all of its descendents which don't depend on the student, and the
+    descriptors whose children do
+    """
+    descendents = []
+    dynamic = []
+    stack = [descriptor]
+    while stack:
+        next_descriptor = stack.pop()
+        descendents.append(next_descriptor)
+        if next_descriptor.has_dynamic_children():
+            dynamic.append(next_descriptor)
+        else:
+            stack.extend(next_descriptor.get_children())
+    return descendents, dynamic
+
+
+def progress_summary(student, request, course, model_data_cache=None):
     """
     This pulls a summary of all problems in the course.
 
@@ -268,47 +310,114 @@ def progress_summary(student, request, course, model_data_cache):
     ungraded problems, and is good for displaying a course summary with due dates,
     etc.
 
+    The summary is built from the course's descriptors and the scores recorded in the student's
+    StudentModules (fetched w/ one query). Modules are only instantiated for problems which are
+    always rescored, for descriptors w/ dynamic children and for problems the student hasn't been
+    graded on whose max score isn't cached yet.
+
     Arguments:
         student: A User object for the student to grade
         course: A Descriptor containing the course to grade
-        model_data_cache: A ModelDataCache initialized with all
-             instance_modules for the student
+        model_data_cache: A ModelDataCache for the modules which need to be instantiated, or None
+             to have one created for them (with one query per scope)
 
     If the student does not have access to load the course module, this function
     will return None.
 
     """
-
-    # TODO: We need the request to pass into here. If we could forego that, our arguments
-    # would be simpler
-    course_module = get_module(student, request, course.location, model_data_cache, course.id, depth=None)
-    if not course_module:
+    if not has_access(student, course, 'load', course.id):
         # This student must not have access to the course.
         return None
 
-    chapters = []
-    # Don't include chapters that aren't displayable (e.g. due to error)
-    for chapter_module in course_module.get_display_items():
-        # Skip if the chapter is hidden
-        if chapter_module.lms.hide_from_toc:
-            continue
+    def visible_children(descriptor):
+        """The children of the descriptor shown to the student"""
+        return [
+            child for child in descriptor.get_children()
+            if not child.lms.hide_from_toc and has_access(student, child, 'load', course.id)
+        ]
 
-        sections = []
-        for section_module in chapter_module.get_display_items():
-            # Skip if the section is hidden
-            if section_module.lms.hide_from_toc:
-                continue
+    sections_by_chapter = [(chapter, visible_children(chapter)) for chapter in visible_children(course)]
 
-            # Same for sections
-            graded = section_module.lms.graded
-            scores = []
+    recorded_scores = _recorded_scores(student, course.id) if student.is_authenticated() else {}
 
-            module_creator = section_module.system.get_module
+    # the max scores of the problems the student hasn't been graded on, and the descriptors which
+    # need a module
+    scored = []
+    needs_module = []
+    for _chapter, sections in sections_by_chapter:
+        for section in sections:
+            descendents, dynamic = _static_descendents(section)
+            needs_module.extend(dynamic)
+            for descriptor in descendents:
+                if descriptor.always_recalculate_grades:
+                    needs_module.append(descriptor)
+                elif descriptor.has_score and descriptor.location.url() not in recorded_scores:
+                    scored.append(descriptor)
+    max_score_keys = dict((descriptor.location, _max_score_key(course.id, descriptor)) for descriptor in scored)
+    max_scores = cache.get_many(max_score_keys.values()) if max_score_keys else {}
+    needs_module.extend(descriptor for descriptor in scored if max_score_keys[descriptor.location] not in max_scores)
 
-            for module_descriptor in yield_dynamic_descriptor_descendents(section_module.descriptor, module_creator):
+    if model_data_cache is None:
+        model_data_cache_descriptors = []
+        for descriptor in needs_module:
+            model_data_cache_descriptors.extend(_static_descendents(descriptor)[0])
+        model_data_cache = ModelDataCache(model_data_cache_descriptors, course.id, student)
+
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
+
+    def get_progress_score(descriptor):
+        """The (correct, total) of the problem for the student, like get_score"""
+        if not student.is_authenticated():
+            return (None, None)
+        if descriptor.always_recalculate_grades or not descriptor.has_score:
+            return get_score(course.id, student, descriptor, create_module, model_data_cache)
+        # like get_module, which the problem would otherwise be instantiated with (e.g. the
+        # problem may not be released yet)
+        if not has_access(student, descriptor, 'load', course.id):
+            return (None, None)
+
+        recorded = recorded_scores.get(descriptor.location.url())
+        if recorded is not None:
+            correct = recorded[0] if recorded[0] is not None else 0
+            total = recorded[1]
+        else:
+            correct = 0.0
+            key = max_score_keys.get(descriptor.location) or _max_score_key(course.id, descriptor)
+            total = max_scores[key] if key in max_scores else cache.get(key)
+            if total is None:
+                problem = create_module(descriptor)
+                if problem is None:
+                    return (None, None)
+                total = problem.max_score()
+                # Problem may be an error module (if something in the problem builder failed)
+                # In which case total might be None
+                if total is None:
+                    return (None, None)
+                max_scores[key] = total
+                cache.set(key, total, MAX_SCORE_CACHE_TIMEOUT)
+
+        # Now we re-weight the problem, if specified
+        weight = descriptor.weight
+        if weight is not None:
+            if total == 0:
+                log.exception("Cannot reweight a problem with zero total points. Problem: " + descriptor.location.url())
+                return (correct, total)
+            correct = correct * weight / total
+            total = weight
+
+        return (correct, total)
+
+    chapters = []
+    for chapter, sections in sections_by_chapter:
+        section_summaries = []
+        for section in sections:
+            graded = section.lms.graded
+            scores = []
 
-                course_id = course.id
-                (correct, total) = get_score(course_id, student, module_descriptor, module_creator, model_data_cache)
+            for module_descriptor in yield_dynamic_descriptor_descendents(section, create_module):
+                (correct, total) = get_progress_score(module_descriptor)
                 if correct is None and total is None:
                     continue
 
@@ -316,23 +425,23 @@ def progress_summary(student, request, course, model_data_cache):
 
             scores.reverse()
             section_total, _ = graders.aggregate_scores(
-                scores, section_module.display_name_with_default)
+                scores, section.display_name_with_default)
 
-            module_format = section_module.lms.format if section_module.lms.format is not None else ''
-            sections.append({
-                'display_name': section_module.display_name_with_default,
-                'url_name': section_module.url_name,
+            module_format = section.lms.format if section.lms.format is not None else ''
+            section_summaries.append({
+                'display_name': section.display_name_with_default,
+                'url_name': section.url_name,
                 'scores': scores,
                 'section_total': section_total,
                 'format': module_format,
-                'due': section_module.lms.due,
+                'due': section.lms.due,
                 'graded': graded,
             })
 
         chapters.append({'course': course.display_name_with_default,
-                         'display_name': chapter_module.display_name_with_default,
-                         'url_name': chapter_module.url_name,
-                         'sections': sections})
+                         'display_name': chapter.display_name_with_default,
+                         'url_name': chapter.url_name,
+                         'sections': section_summaries})
 
     return chapters
 
@@ -2,8 +2,11 @@
 Classes to provide the LMS runtime data storage to XBlocks
 """
 
+import copy
 import json
+import operator
 from collections import namedtuple, defaultdict
+from contextlib import contextmanager
 from itertools import chain
 from .models import (
     StudentModule,
@@ -14,7 +17,11 @@ from .models import (
 )
 import logging
 
-from django.db import DatabaseError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
 
 from xblock.runtime import KeyValueStore, InvalidScopeError
 from xblock.core import KeyValueMultiSaveError, Scope
@@ -29,6 +36,71 @@ class InvalidWriteError(Exception):
     """
 
 
+# The models storing the scopes which deployments don't necessarily store in SQL. With
+# settings.MODEL_DATA_CACHE_SCOPES = 'auto', ModelDataCache doesn't query their tables while they're empty.
+OPTIONAL_SCOPE_MODELS = {
+    Scope.content: XModuleContentField,
+    Scope.settings: XModuleSettingsField,
+    Scope.preferences: XModuleStudentPrefsField,
+    Scope.user_info: XModuleStudentInfoField,
+}
+
+# How long (in seconds) an optional scope's table is known to be empty before it's checked again.
+# Rows created through the ORM mark it as populated immediately.
+EMPTY_SCOPE_TIMEOUT = 5 * 60
+# How long (in seconds) the shared cache remembers that an optional scope's table is populated
+POPULATED_SCOPE_TIMEOUT = 24 * 60 * 60
+
+# the scopes whose tables are known to be populated in this process (they're assumed to stay so)
+_populated_scopes = set()
+
+# module class -> {scope: set of the class' fields in that scope} (see ModelDataCache._fields_to_cache)
+_class_scope_fields = {}
+
+
+def _populated_scope_key(scope):
+    """The cache key recording whether the table of the optional scope is populated"""
+    return 'courseware.model_data.populated.{0}'.format(OPTIONAL_SCOPE_MODELS[scope].__name__)
+
+
+def scope_is_populated(scope):
+    """
+    Whether the courseware tables may hold fields of the scope, so ModelDataCache should query them.
+    settings.MODEL_DATA_CACHE_SCOPES is either None to query all scopes, a list of the names
+    of the optional scopes to query, or 'auto' to query those whose tables aren't empty.
+    """
+    configured = getattr(settings, 'MODEL_DATA_CACHE_SCOPES', None)
+    if scope not in OPTIONAL_SCOPE_MODELS or configured is None:
+        return True
+    if configured != 'auto':
+        return scope in [getattr(Scope, name) for name in configured]
+    if scope in _populated_scopes:
+        return True
+
+    populated = cache.get(_populated_scope_key(scope))
+    if populated is None:
+        populated = OPTIONAL_SCOPE_MODELS[scope].objects.exists()
+        cache.set(_populated_scope_key(scope), populated, POPULATED_SCOPE_TIMEOUT if populated else EMPTY_SCOPE_TIMEOUT)
+    if populated:
+        _populated_scopes.add(scope)
+    return populated
+
+
+def _scope_populated(sender, created=False, **kwargs):  # pylint: disable=unused-argument
+    """
+    Record that the table of an optional scope isn't empty anymore when a row is created in it
+    """
+    if not created:
+        return
+    for scope, model_class in OPTIONAL_SCOPE_MODELS.items():
+        if sender is model_class and scope not in _populated_scopes:
+            _populated_scopes.add(scope)
+            cache.set(_populated_scope_key(scope), True, POPULATED_SCOPE_TIMEOUT)
+
+for _model_class in OPTIONAL_SCOPE_MODELS.values():
+    post_save.connect(_scope_populated, sender=_model_class, dispatch_uid='courseware.model_data.scope_populated')
+
+
 def chunks(items, chunk_size):
     """
     Yields the values from items in chunks of size chunk_size
@@ -37,6 +109,41 @@ def chunks(items, chunk_size):
     return (items[i:i + chunk_size] for i in xrange(0, len(items), chunk_size))
 
 
+def _copy_value(value):
+    """
+    A copy of the field value if it's mutable, so callers can't change the decoded state
+    kept on StudentModules (see _decoded_state) w/o setting the field
+    """
+    if isinstance(value, (dict, list)):
+        return copy.deepcopy(value)
+    return value
+
+
+def _decoded_state(student_module):
+    """
+    Returns the decoded state dict of the StudentModule. The state is only decoded once and
+    the dict is kept on the StudentModule (until its state is replaced by something else).
+    It's private to this module: field values read from it or stored in it are copied.
+    """
+    cached = getattr(student_module, '_decoded_state', None)
+    if cached is None or cached[0] is not student_module.state:
+        cached = student_module._decoded_state = (student_module.state, json.loads(student_module.state))
+    return cached[1]
+
+
+def _encode_state(student_module, state):
+    """
+    Encodes the state dict into the StudentModule. Returns whether its state changed.
+    """
+    # compare the decoded states, as the same state may be encoded differently (e.g. key order)
+    if student_module.state is not None and json.loads(student_module.state) == state:
+        return False
+    encoded = json.dumps(state)
+    student_module.state = encoded
+    student_module._decoded_state = (encoded, state)
+    return True
+
+
 class ModelDataCache(object):
     """
     A cache of django model objects needed to supply the data
@@ -60,9 +167,15 @@ class ModelDataCache(object):
         self.select_for_update = select_for_update
         self.course_id = course_id
         self.user = user
+        # (location url, field name) -> the default of the user_state field (see is_default)
+        self._user_state_defaults = None
+        # while in batch_creates, the (key, field object) of the field objects to be created
+        self._pending_creates = None
 
         if user.is_authenticated():
             for scope, fields in self._fields_to_cache().items():
+                if not scope_is_populated(scope):
+                    continue
                 for field_object in self._retrieve_fields(scope, fields):
                     self.cache[self._cache_key_from_field_object(scope, field_object)] = field_object
 
@@ -186,9 +299,15 @@ class ModelDataCache(object):
         Returns a map of scopes to fields in that scope that should be cached
         """
         scope_map = defaultdict(set)
-        for descriptor in self.descriptors:
-            for field in (descriptor.module_class.fields + descriptor.module_class.lms.fields):
-                scope_map[field.scope].add(field)
+        for module_class in set(descriptor.module_class for descriptor in self.descriptors):
+            class_scope_fields = _class_scope_fields.get(module_class)
+            if class_scope_fields is None:
+                class_scope_fields = defaultdict(set)
+                for field in (module_class.fields + module_class.lms.fields):
+                    class_scope_fields[field.scope].add(field)
+                class_scope_fields = _class_scope_fields[module_class] = dict(class_scope_fields)
+            for scope, fields in class_scope_fields.items():
+                scope_map[scope].update(fields)
         return scope_map
 
     def _cache_key_from_kvs_key(self, key):
@@ -222,6 +341,31 @@ class ModelDataCache(object):
         elif scope == Scope.user_info:
             return (scope, field_object.field_name)
 
+    def is_default(self, key, value):
+        """
+        Returns whether value is the default of the user_state field `key` of one of the
+        descriptors in this cache
+        """
+        if self._user_state_defaults is None:
+            self._user_state_defaults = {}
+            for descriptor in self.descriptors:
+                for field in (descriptor.module_class.fields + descriptor.module_class.lms.fields):
+                    if field.scope == Scope.user_state:
+                        self._user_state_defaults[(descriptor.location.url(), field.name)] = field.default
+
+        default_key = (key.block_scope_id.url(), key.field_name)
+        return default_key in self._user_state_defaults and self._user_state_defaults[default_key] == value
+
+    def get_score(self, location):
+        """
+        Returns the (grade, max_grade) recorded in the cached StudentModule for the location,
+        or None if there's none or it hasn't been graded
+        """
+        student_module = self.cache.get((Scope.user_state, location.url()))
+        if student_module is None or student_module.max_grade is None:
+            return None
+        return (student_module.grade, student_module.max_grade)
+
     def find(self, key):
         '''
         Look for a model data object using an LmsKeyValueStore.Key object
@@ -232,52 +376,139 @@ class ModelDataCache(object):
         '''
         return self.cache.get(self._cache_key_from_kvs_key(key))
 
+    def _field_object_lookup(self, key):
+        """
+        Returns the (model class, lookup kwargs, defaults) of the model data object for the key
+        """
+        if key.scope == Scope.user_state:
+            return StudentModule, {
+                'course_id': self.course_id,
+                'student': self.user,
+                'module_state_key': key.block_scope_id.url(),
+            }, {
+                'state': json.dumps({}),
+                'module_type': key.block_scope_id.category,
+            }
+        elif key.scope == Scope.content:
+            return XModuleContentField, {
+                'field_name': key.field_name,
+                'definition_id': key.block_scope_id.url(),
+            }, {}
+        elif key.scope == Scope.settings:
+            return XModuleSettingsField, {
+                'field_name': key.field_name,
+                'usage_id': '%s-%s' % (self.course_id, key.block_scope_id.url()),
+            }, {}
+        elif key.scope == Scope.preferences:
+            return XModuleStudentPrefsField, {
+                'field_name': key.field_name,
+                'module_type': key.block_scope_id,
+                'student': self.user,
+            }, {}
+        elif key.scope == Scope.user_info:
+            return XModuleStudentInfoField, {
+                'field_name': key.field_name,
+                'student': self.user,
+            }, {}
+
     def find_or_create(self, key):
         '''
         Find a model data object in this cache, or create it if it doesn't
-        exist
+        exist.
+
+        Within batch_creates, the missing object is only instantiated here; it's saved
+        when the batch ends.
         '''
         field_object = self.find(key)
 
         if field_object is not None:
             return field_object
 
-        if key.scope == Scope.user_state:
-            field_object, _ = StudentModule.objects.get_or_create(
-                course_id=self.course_id,
-                student=self.user,
-                module_state_key=key.block_scope_id.url(),
-                defaults={
-                    'state': json.dumps({}),
-                    'module_type': key.block_scope_id.category,
-                },
-            )
-        elif key.scope == Scope.content:
-            field_object, _ = XModuleContentField.objects.get_or_create(
-                field_name=key.field_name,
-                definition_id=key.block_scope_id.url()
-            )
-        elif key.scope == Scope.settings:
-            field_object, _ = XModuleSettingsField.objects.get_or_create(
-                field_name=key.field_name,
-                usage_id='%s-%s' % (self.course_id, key.block_scope_id.url()),
-            )
-        elif key.scope == Scope.preferences:
-            field_object, _ = XModuleStudentPrefsField.objects.get_or_create(
-                field_name=key.field_name,
-                module_type=key.block_scope_id,
-                student=self.user,
-            )
-        elif key.scope == Scope.user_info:
-            field_object, _ = XModuleStudentInfoField.objects.get_or_create(
-                field_name=key.field_name,
-                student=self.user,
-            )
+        model_class, lookup, defaults = self._field_object_lookup(key)
+        if self._pending_creates is not None:
+            field_object = model_class(**dict(lookup, **defaults))
+            self._pending_creates.append((key, field_object))
+        else:
+            field_object, _ = model_class.objects.get_or_create(defaults=defaults, **lookup)
 
         cache_key = self._cache_key_from_kvs_key(key)
         self.cache[cache_key] = field_object
         return field_object
 
+    def is_pending(self, field_object):
+        """
+        Returns whether the field object is waiting to be created at the end of batch_creates
+        """
+        return self._pending_creates is not None and field_object.pk is None
+
+    def discard_pending(self, key):
+        """
+        Forget the field object for the key, which is waiting to be created at the end of batch_creates
+        """
+        field_object = self.cache.pop(self._cache_key_from_kvs_key(key))
+        self._pending_creates = [pending for pending in self._pending_creates if pending[1] is not field_object]
+
+    @contextmanager
+    def batch_creates(self):
+        """
+        A context within which the model data objects missing from this cache are created
+        all at once, with one bulk insert per model, when the context exits (rather than
+        one get_or_create per object). The objects are created w/ the values set on them
+        meanwhile, so LmsKeyValueStore doesn't save them itself.
+        """
+        if self._pending_creates is not None:
+            # already batching
+            yield
+            return
+
+        self._pending_creates = []
+        try:
+            yield
+        finally:
+            pending, self._pending_creates = self._pending_creates, None
+            self._create_pending(pending)
+
+    def _create_pending(self, pending):
+        """
+        Create the (key, field object)s collected by batch_creates and put the created
+        objects in the cache.
+        """
+        by_class = defaultdict(list)
+        for key, field_object in pending:
+            by_class[type(field_object)].append((key, field_object))
+
+        for model_class, class_pending in by_class.items():
+            savepoint = transaction.savepoint()
+            try:
+                model_class.objects.bulk_create([field_object for _key, field_object in class_pending])
+                transaction.savepoint_commit(savepoint)
+            except IntegrityError:
+                # some were created meanwhile (e.g., by a concurrent request of the same user), so
+                # fall back to updating or creating them one at a time
+                transaction.savepoint_rollback(savepoint)
+                for key, field_object in class_pending:
+                    _, lookup, defaults = self._field_object_lookup(key)
+                    created_object, created = model_class.objects.get_or_create(defaults=defaults, **lookup)
+                    if key.scope == Scope.user_state:
+                        # only the fields set during the batch are applied, the others are kept as the
+                        # concurrent request left them
+                        state = _decoded_state(created_object)
+                        state.update(_decoded_state(field_object))
+                        _encode_state(created_object, state)
+                    else:
+                        created_object.value = field_object.value
+                    created_object.save()
+                    self.cache[self._cache_key_from_kvs_key(key)] = created_object
+                continue
+
+            # bulk_create doesn't set the ids of the objects or send post_save, so refetch them
+            for chunk in chunks(class_pending, 100):
+                query = reduce(operator.or_, (Q(**self._field_object_lookup(key)[1]) for key, _ in chunk))
+                for created_object in model_class.objects.filter(query):
+                    scope = chunk[0][0].scope
+                    self.cache[self._cache_key_from_field_object(scope, created_object)] = created_object
+                    post_save.send(sender=model_class, instance=created_object, created=True, raw=False)
+
 
 class LmsKeyValueStore(KeyValueStore):
     """
@@ -329,7 +560,7 @@ class LmsKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            return _copy_value(_decoded_state(field_object)[key.field_name])
         else:
             return json.loads(field_object.value)
 
@@ -346,10 +577,15 @@ class LmsKeyValueStore(KeyValueStore):
         `kv_dict`: A dictionary of dirty fields that maps
           xblock.DbModel._key : value
 
+        Only the field objects whose values actually changed are saved. In particular, user_state
+        fields which aren't stored yet aren't stored when set to their default, so modules which are
+        just rendered don't create StudentModules.
         """
         saved_fields = []
         # field_objects maps a field_object to a list of associated fields
         field_objects = dict()
+        # the field objects whose values changed
+        changed = set()
         for field in kv_dict:
             # Check field for validity
             if field.field_name in self._descriptor_model_data:
@@ -358,6 +594,11 @@ class LmsKeyValueStore(KeyValueStore):
             if field.scope not in self._allowed_scopes:
                 raise InvalidScopeError(field.scope)
 
+            if field.scope == Scope.user_state and not self.has(field) and \
+                    self._model_data_cache.is_default(field, kv_dict[field]):
+                saved_fields.append(field.field_name)
+                continue
+
             # If the field is valid and isn't already in the dictionary, add it.
             field_object = self._model_data_cache.find_or_create(field)
             if field_object not in field_objects.keys():
@@ -366,16 +607,24 @@ class LmsKeyValueStore(KeyValueStore):
             field_objects[field_object].append(field)
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
+            # (which is encoded once all of its fields are set, below)
             if field.scope == Scope.user_state:
-                state = json.loads(field_object.state)
-                state[field.field_name] = kv_dict[field]
-                field_object.state = json.dumps(state)
+                _decoded_state(field_object)[field.field_name] = _copy_value(kv_dict[field])
             else:
             # The remaining scopes save fields on different rows, so
             # we don't have to worry about conflicts
-                field_object.value = json.dumps(kv_dict[field])
+                value = json.dumps(kv_dict[field])
+                if value != field_object.value:
+                    field_object.value = value
+                    changed.add(field_object)
 
         for field_object in field_objects:
+            if isinstance(field_object, StudentModule) and _encode_state(field_object, _decoded_state(field_object)):
+                changed.add(field_object)
+            if field_object not in changed or self._model_data_cache.is_pending(field_object):
+                # pending objects are created w/ their values at the end of the batch
+                saved_fields.extend([field.field_name for field in field_objects[field_object]])
+                continue
             try:
                 # Save the field object that we made above
                 field_object.save()
@@ -398,10 +647,13 @@ class LmsKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
+            state = _decoded_state(field_object)
             del state[key.field_name]
-            field_object.state = json.dumps(state)
-            field_object.save()
+            _encode_state(field_object, state)
+            if not self._model_data_cache.is_pending(field_object):
+                field_object.save()
+        elif self._model_data_cache.is_pending(field_object):
+            self._model_data_cache.discard_pending(key)
         else:
             field_object.delete()
 
@@ -420,7 +672,7 @@ class LmsKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in _decoded_state(field_object)
         else:
             return True
 
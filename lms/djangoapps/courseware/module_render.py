@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import sys
@@ -10,12 +11,13 @@ from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.http import Http404
 from django.http import HttpResponse
+from django.utils.encoding import iri_to_uri
 from django.views.decorators.csrf import csrf_exempt
 
 from requests.auth import HTTPBasicAuth
 from statsd import statsd
 
-from capa.xqueue_interface import XQueueInterface
+from capa.xqueue_interface import XQueueInterface, AsyncXQueueInterface
 from mitxmako.shortcuts import render_to_string
 from xblock.runtime import DbModel
 from xmodule.error_module import ErrorDescriptor, NonStaffErrorDescriptor
@@ -25,7 +27,7 @@ from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.x_module import ModuleSystem
-from xmodule_modifiers import replace_course_urls, replace_jump_to_id_urls, replace_static_urls, add_histogram, wrap_xmodule, save_module  # pylint: disable=F0401
+from xmodule_modifiers import replace_course_urls, replace_jump_to_id_urls, replace_static_urls, add_histogram, wrap_xmodule, save_module, cache_html, grade_histograms, invalidate_grade_histogram  # pylint: disable=F0401
 
 import static_replace
 from psychometrics.psychoanalyze import make_psychometrics_data_update_handler
@@ -54,6 +56,15 @@ xqueue_interface = XQueueInterface(
     requests_auth,
 )
 
+# If a spool directory is configured, submissions are persisted there and delivered to xqueue in
+# the background rather than during the student's request
+if settings.XQUEUE_INTERFACE.get('spool_dir') is not None:
+    xqueue_interface = AsyncXQueueInterface(
+        xqueue_interface,
+        settings.XQUEUE_INTERFACE['spool_dir'],
+        report_metric=statsd.gauge,
+    )
+
 
 def make_track_function(request):
     '''
@@ -189,7 +200,10 @@ def get_module_for_descriptor(user, request, descriptor, model_data_cache, cours
     if has_access(user, descriptor, 'staff', course_id):
         setup_masquerade(request, True)
 
-    track_function = make_track_function(request)
+    # the same track function for all of the request's modules lets them share a ModuleSystemTemplate
+    track_function = request.__dict__.get('_xmodule_track_function')
+    if track_function is None:
+        track_function = request.__dict__['_xmodule_track_function'] = make_track_function(request)
     xqueue_callback_url_prefix = get_xqueue_callback_url_prefix(request)
 
     return get_module_for_descriptor_internal(user, descriptor, model_data_cache, course_id,
@@ -197,102 +211,122 @@ def get_module_for_descriptor(user, request, descriptor, model_data_cache, cours
                                               position, wrap_xmodule_display, grade_bucket_type)
 
 
-def get_module_for_descriptor_internal(user, descriptor, model_data_cache, course_id,
-                                       track_function, xqueue_callback_url_prefix,
-                                       position=None, wrap_xmodule_display=True, grade_bucket_type=None):
-    """
-    Actually implement get_module, without requiring a request.
+# stands in for the variable parts of urls while they're reversed, so the reversed urls can be
+# turned into format strings (see ModuleSystemTemplate)
+_URL_PLACEHOLDER = 'URLPLACEHOLDER{0}'
 
-    See get_module() docstring for further details.
+
+def _url_format(name, **kwargs):
     """
+    Reverse the url name w/ the kwargs, returning a format string w/ a {field} for each kwarg
+    whose value is None
+    """
+    fields = [key for key, value in kwargs.items() if value is None]
+    for index, key in enumerate(fields):
+        kwargs[key] = _URL_PLACEHOLDER.format(index)
+    url = reverse(name, kwargs=kwargs).replace('{', '{{').replace('}', '}}')
+    for index, key in enumerate(fields):
+        url = url.replace(_URL_PLACEHOLDER.format(index), '{' + key + '}')
+    return url
 
-    # Short circuit--if the user shouldn't have access, bail without doing any work
-    if not has_access(user, descriptor, 'load', course_id):
-        return None
 
-    # Setup system context for module instance
-    ajax_url = reverse(
-        'modx_dispatch',
-        kwargs=dict(
-            course_id=course_id,
-            location=descriptor.location.url(),
-            dispatch=''
-        ),
-    )
-    # Intended use is as {ajax_url}/{dispatch_command}, so get rid of the trailing slash.
-    ajax_url = ajax_url.rstrip('/')
-
-    def make_xqueue_callback(dispatch='score_update'):
-        # Fully qualified callback URL for external queueing system
-        relative_xqueue_callback_url = reverse(
-            'xqueue_callback',
-            kwargs=dict(
-                course_id=course_id,
-                userid=str(user.id),
-                mod_id=descriptor.location.url(),
-                dispatch=dispatch
-            ),
+class ModuleSystemTemplate(object):
+    """
+    Everything in the ModuleSystems of a user's modules in a course which doesn't depend on the
+    module, so it's only computed once per request, however many modules are instantiated
+    (e.g. for the progress page or grading). system_for specializes it for a descriptor.
+    """
+    def __init__(self, user, model_data_cache, course_id, track_function, xqueue_callback_url_prefix,
+                 position=None, wrap_xmodule_display=True, grade_bucket_type=None):
+        self.user = user
+        self.model_data_cache = model_data_cache
+        self.course_id = course_id
+        self.track_function = track_function
+        self.xqueue_callback_url_prefix = xqueue_callback_url_prefix
+        self.position = position
+        self.wrap_xmodule_display = wrap_xmodule_display
+        self.grade_bucket_type = grade_bucket_type
+
+        # Intended use is as {ajax_url}/{dispatch_command}, so get rid of the trailing slash.
+        self.ajax_url_format = _url_format('modx_dispatch', course_id=course_id, location=None, dispatch='').rstrip('/')
+        self.xqueue_callback_format = xqueue_callback_url_prefix + _url_format(
+            'xqueue_callback', course_id=course_id, userid=str(user.id), mod_id=None, dispatch=None
         )
-        return xqueue_callback_url_prefix + relative_xqueue_callback_url
-
-    # Default queuename is course-specific and is derived from the course that
-    #   contains the current module.
-    # TODO: Queuename should be derived from 'course_settings.json' of each course
-    xqueue_default_queuename = descriptor.location.org + '-' + descriptor.location.course
-
-    xqueue = {
-        'interface': xqueue_interface,
-        'construct_callback': make_xqueue_callback,
-        'default_queuename': xqueue_default_queuename.replace(' ', '_'),
-        'waittime': settings.XQUEUE_WAITTIME_BETWEEN_REQUESTS
-    }
-
-    # This is a hacky way to pass settings to the combined open ended xmodule
-    # It needs an S3 interface to upload images to S3
-    # It needs the open ended grading interface in order to get peer grading to be done
-    # this first checks to see if the descriptor is the correct one, and only sends settings if it is
-
-    # Get descriptor metadata fields indicating needs for various settings
-    needs_open_ended_interface = getattr(descriptor, "needs_open_ended_interface", False)
-    needs_s3_interface = getattr(descriptor, "needs_s3_interface", False)
-
-    # Initialize interfaces to None
-    open_ended_grading_interface = None
-    s3_interface = None
-
-    # Create interfaces if needed
-    if needs_open_ended_interface:
-        open_ended_grading_interface = settings.OPEN_ENDED_GRADING_INTERFACE
-        open_ended_grading_interface['mock_peer_grading'] = settings.MOCK_PEER_GRADING
-        open_ended_grading_interface['mock_staff_grading'] = settings.MOCK_STAFF_GRADING
-    if needs_s3_interface:
-        s3_interface = {
+
+        self.open_ended_grading_interface = settings.OPEN_ENDED_GRADING_INTERFACE
+        self.open_ended_grading_interface['mock_peer_grading'] = settings.MOCK_PEER_GRADING
+        self.open_ended_grading_interface['mock_staff_grading'] = settings.MOCK_STAFF_GRADING
+        self.s3_interface = {
             'access_key': getattr(settings, 'AWS_ACCESS_KEY_ID', ''),
             'secret_access_key': getattr(settings, 'AWS_SECRET_ACCESS_KEY', ''),
             'storage_bucket_name': getattr(settings, 'AWS_STORAGE_BUCKET_NAME', 'openended')
         }
 
-    def inner_get_module(descriptor):
+        # TODO (cpennington): When modules are shared between courses, the static
+        # prefix is going to have to be specific to the module, not the directory
+        # that the xml was loaded from
+        self.prototype = ModuleSystem(
+            track_function=track_function,
+            render_template=render_to_string,
+            ajax_url=None,
+            get_module=self.get_module,
+            user=user,
+            # set by system_for
+            replace_urls=None,
+            node_path=settings.NODE_PATH,
+            xblock_model_data=self.xblock_model_data,
+            anonymous_student_id=unique_id_for_user(user),
+            course_id=course_id,
+            cache=cache,
+            can_execute_unsafe_code=(lambda: can_execute_unsafe_code(course_id)),
+        )
+        # pass position specified in URL to module through ModuleSystem
+        self.prototype.set('position', position)
+        self.prototype.set('DEBUG', settings.DEBUG)
+        # let sequences render their inactive positions on demand, w/ their progress from the recorded scores
+        self.prototype.set('lazy_sequence_rendering', settings.MITX_FEATURES.get('LAZY_SEQUENCE_RENDERING', False))
+        self.prototype.set('prefetch_sequence_neighbors', settings.MITX_FEATURES.get('PREFETCH_SEQUENCE_NEIGHBORS', False))
+        self.prototype.set('get_recorded_score', model_data_cache.get_score)
+        self.psychometrics_enabled = settings.MITX_FEATURES.get('ENABLE_PSYCHOMETRICS')
+        self.histograms_enabled = settings.MITX_FEATURES.get('DISPLAY_HISTOGRAMS_TO_STAFF')
+        self._grade_histograms = None
+
+    @classmethod
+    def for_request(cls, user, model_data_cache, course_id, track_function, xqueue_callback_url_prefix,
+                    position=None, wrap_xmodule_display=True, grade_bucket_type=None):
+        """
+        The template for the arguments, reused for every call w/ the same model_data_cache
+        (which only lives as long as the request or task using it) and arguments
+        """
+        key = (user.id, course_id, track_function, xqueue_callback_url_prefix,
+               position, wrap_xmodule_display, grade_bucket_type)
+        templates = model_data_cache.__dict__.setdefault('_module_system_templates', {})
+        template = templates.get(key)
+        if template is None or template.user is not user:
+            template = templates[key] = cls(user, model_data_cache, course_id, track_function,
+                                            xqueue_callback_url_prefix, position, wrap_xmodule_display,
+                                            grade_bucket_type)
+        return template
+
+    def get_module(self, descriptor):
         """
         Delegate to get_module_for_descriptor_internal() with all values except `descriptor` set.
 
         Because it does an access check, it may return None.
         """
-        # TODO: fix this so that make_xqueue_callback uses the descriptor passed into
-        # inner_get_module, not the parent's callback.  Add it as an argument....
-        return get_module_for_descriptor_internal(user, descriptor, model_data_cache, course_id,
-                                                  track_function, make_xqueue_callback,
-                                                  position, wrap_xmodule_display, grade_bucket_type)
+        return get_module_for_descriptor_internal(self.user, descriptor, self.model_data_cache, self.course_id,
+                                                  self.track_function, self.xqueue_callback_url_prefix,
+                                                  self.position, self.wrap_xmodule_display, self.grade_bucket_type)
 
-    def xblock_model_data(descriptor):
+    def xblock_model_data(self, descriptor):
         return DbModel(
-            LmsKeyValueStore(descriptor._model_data, model_data_cache),
+            LmsKeyValueStore(descriptor._model_data, self.model_data_cache),
             descriptor.module_class,
-            user.id,
+            self.user.id,
             LmsUsage(descriptor.location, descriptor.location)
         )
 
-    def publish(event):
+    def publish(self, descriptor, event):
         """A function that allows XModules to publish events. This only supports grade changes right now."""
         if event.get('event_name') != 'grade':
             return
@@ -301,21 +335,23 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
         # Construct the key for the module
         key = KeyValueStore.Key(
             scope=Scope.user_state,
-            student_id=user.id,
+            student_id=self.user.id,
             block_scope_id=usage.id,
             field_name='grade'
         )
 
-        student_module = model_data_cache.find_or_create(key)
+        student_module = self.model_data_cache.find_or_create(key)
         # Update the grades
         student_module.grade = event.get('value')
         student_module.max_grade = event.get('max_value')
         # Save all changes to the underlying KeyValueStore
         student_module.save()
+        if self.histograms_enabled:
+            invalidate_grade_histogram(student_module.module_state_key)
 
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
-        org, course_num, run = course_id.split("/")
+        org, course_num, run = self.course_id.split("/")
 
         tags = [
             "org:{0}".format(org),
@@ -324,49 +360,106 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
             "score_bucket:{0}".format(score_bucket)
         ]
 
-        if grade_bucket_type is not None:
-            tags.append('type:%s' % grade_bucket_type)
+        if self.grade_bucket_type is not None:
+            tags.append('type:%s' % self.grade_bucket_type)
 
         statsd.increment("lms.courseware.question_answered", tags=tags)
 
-    # TODO (cpennington): When modules are shared between courses, the static
-    # prefix is going to have to be specific to the module, not the directory
-    # that the xml was loaded from
-    system = ModuleSystem(
-        track_function=track_function,
-        render_template=render_to_string,
-        ajax_url=ajax_url,
-        xqueue=xqueue,
+    def grade_histogram(self, module_id):
+        """
+        The grade histogram of the module, the histograms of all of the scored modules in the
+        model data cache being fetched together when the first one is needed
+        """
+        if self._grade_histograms is None:
+            self._grade_histograms = grade_histograms(
+                descriptor.location.url() for descriptor in self.model_data_cache.descriptors if descriptor.has_score
+            )
+        if module_id not in self._grade_histograms:
+            self._grade_histograms.update(grade_histograms([module_id]))
+        return self._grade_histograms[module_id]
+
+    def psychometrics_handler(self, location):
+        """
+        A callback for updating the PsychometricsData of the module at location, which only
+        looks up the data when the module is first checked
+        """
+        handler = []
+
+        def psychometrics_handler(state):
+            if not handler:
+                handler.append(make_psychometrics_data_update_handler(self.course_id, self.user, location))
+            return handler[0](state)
+        return psychometrics_handler
+
+    def system_for(self, descriptor):
+        """
+        A ModuleSystem for the descriptor's module
+        """
+        location = descriptor.location.url()
+        encoded_location = iri_to_uri(location)
+
+        def make_xqueue_callback(dispatch='score_update'):
+            # Fully qualified callback URL for external queueing system
+            return self.xqueue_callback_format.format(mod_id=encoded_location, dispatch=iri_to_uri(dispatch))
+
+        # Default queuename is course-specific and is derived from the course that
+        #   contains the current module.
+        # TODO: Queuename should be derived from 'course_settings.json' of each course
+        xqueue_default_queuename = descriptor.location.org + '-' + descriptor.location.course
+
+        system = copy.copy(self.prototype)
+        system.ajax_url = self.ajax_url_format.format(location=encoded_location)
+        system.xqueue = {
+            'interface': xqueue_interface,
+            'construct_callback': make_xqueue_callback,
+            'default_queuename': xqueue_default_queuename.replace(' ', '_'),
+            'waittime': settings.XQUEUE_WAITTIME_BETWEEN_REQUESTS
+        }
         # TODO (cpennington): Figure out how to share info between systems
-        filestore=descriptor.system.resources_fs,
-        get_module=inner_get_module,
-        user=user,
+        system.filestore = descriptor.system.resources_fs
         # TODO (cpennington): This should be removed when all html from
         # a module is coming through get_html and is therefore covered
         # by the replace_static_urls code below
-        replace_urls=partial(
+        system.replace_urls = partial(
             static_replace.replace_static_urls,
             data_directory=getattr(descriptor, 'data_dir', None),
             course_namespace=descriptor.location._replace(category=None, name=None),
-        ),
-        node_path=settings.NODE_PATH,
-        xblock_model_data=xblock_model_data,
-        publish=publish,
-        anonymous_student_id=unique_id_for_user(user),
-        course_id=course_id,
-        open_ended_grading_interface=open_ended_grading_interface,
-        s3_interface=s3_interface,
-        cache=cache,
-        can_execute_unsafe_code=(lambda: can_execute_unsafe_code(course_id)),
-    )
-    # pass position specified in URL to module through ModuleSystem
-    system.set('position', position)
-    system.set('DEBUG', settings.DEBUG)
-    if settings.MITX_FEATURES.get('ENABLE_PSYCHOMETRICS'):
-        system.set(
-            'psychometrics_handler',  # set callback for updating PsychometricsData
-            make_psychometrics_data_update_handler(course_id, user, descriptor.location.url())
         )
+        system.publish = partial(self.publish, descriptor)
+
+        # This is a hacky way to pass settings to the combined open ended xmodule
+        # It needs an S3 interface to upload images to S3
+        # It needs the open ended grading interface in order to get peer grading to be done
+        # this first checks to see if the descriptor is the correct one, and only sends settings if it is
+        if getattr(descriptor, "needs_open_ended_interface", False):
+            system.open_ended_grading_interface = self.open_ended_grading_interface
+        if getattr(descriptor, "needs_s3_interface", False):
+            system.s3_interface = self.s3_interface
+
+        # only problems update their PsychometricsData
+        if self.psychometrics_enabled and descriptor.location.category == 'problem':
+            system.set('psychometrics_handler', self.psychometrics_handler(location))
+        return system
+
+
+def get_module_for_descriptor_internal(user, descriptor, model_data_cache, course_id,
+                                       track_function, xqueue_callback_url_prefix,
+                                       position=None, wrap_xmodule_display=True, grade_bucket_type=None):
+    """
+    Actually implement get_module, without requiring a request.
+
+    See get_module() docstring for further details.
+    """
+
+    # Short circuit--if the user shouldn't have access, bail without doing any work
+    if not has_access(user, descriptor, 'load', course_id):
+        return None
+
+    system_template = ModuleSystemTemplate.for_request(
+        user, model_data_cache, course_id, track_function, xqueue_callback_url_prefix,
+        position, wrap_xmodule_display, grade_bucket_type
+    )
+    system = system_template.system_for(descriptor)
 
     try:
         module = descriptor.xmodule(system)
@@ -416,9 +509,19 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
         reverse('jump_to_id', kwargs={'course_id': course_id, 'module_id': ''})
     )
 
+    if settings.MODULE_HTML_CACHE_TIMEOUT:
+        # render modules whose output doesn't depend on the user once for everyone
+        module.get_html = cache_html(
+            module.get_html,
+            module,
+            course_id,
+            settings.MODULE_HTML_CACHE_TIMEOUT,
+            key_prefix='wrapped' if wrap_xmodule_display else 'unwrapped'
+        )
+
     if settings.MITX_FEATURES.get('DISPLAY_HISTOGRAMS_TO_STAFF'):
         if has_access(user, module, 'staff', course_id):
-            module.get_html = add_histogram(module.get_html, module, user)
+            module.get_html = add_histogram(module.get_html, module, user, system_template.grade_histogram)
 
     # force the module to save after rendering
     module.get_html = save_module(module.get_html, module)
@@ -1,10 +1,12 @@
 from mock import Mock
 
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from xmodule.modulestore import Location
 import courseware.access as access
-from .factories import CourseEnrollmentAllowedFactory
+from .factories import CourseEnrollmentAllowedFactory, GroupFactory, UserFactory
 import datetime
 from django.utils.timezone import UTC
 
@@ -58,6 +60,41 @@ class AccessTestCase(TestCase):
         self.assertFalse(access._has_access_to_location(u, location,
                                                         'instructor', None))
 
+    def test__has_access_to_location_cached(self):
+        location = Location('i4x://edX/toy/course/2012_Fall')
+        user = UserFactory.create(is_staff=False)
+        self.assertFalse(access._has_access_to_location(user, location, 'staff', None))
+
+        # changing the user's groups forgets what was cached
+        user.groups.add(GroupFactory.create(name='staff_edX/toy/2012_Fall'))
+        with self.assertNumQueries(1):
+            self.assertTrue(access._has_access_to_location(user, location, 'staff', None))
+        with self.assertNumQueries(0):
+            self.assertTrue(access._has_access_to_location(user, location, 'staff', None))
+            self.assertFalse(access._has_access_to_location(user, location, 'instructor', None))
+
+    @override_settings(ACCESS_GROUP_NAMES_CACHE_TIMEOUT=60)
+    def test_group_names_shared_between_requests(self):
+        user = UserFactory.create()
+        user.groups.add(GroupFactory.create(name='beta_testers_toy'))
+        self.assertEquals(access._get_group_names(user), set(['beta_testers_toy']))
+
+        same_user = User.objects.get(id=user.id)
+        with self.assertNumQueries(0):
+            self.assertEquals(access._get_group_names(same_user), set(['beta_testers_toy']))
+
+    @override_settings(ACCESS_GROUP_NAMES_CACHE_TIMEOUT=60)
+    def test_group_cleared(self):
+        location = Location('i4x://edX/toy/course/2012_Fall')
+        user = UserFactory.create(is_staff=False)
+        group = GroupFactory.create(name='staff_edX/toy/2012_Fall')
+        user.groups.add(group)
+        self.assertTrue(access._has_access_to_location(User.objects.get(id=user.id), location, 'staff', None))
+
+        # removing all of the group's users revokes their access at once
+        group.user_set.clear()
+        self.assertFalse(access._has_access_to_location(User.objects.get(id=user.id), location, 'staff', None))
+
     def test__has_access_string(self):
         u = Mock(is_staff=True)
         self.assertFalse(access._has_access_string(u, 'not_global', 'staff', None))
@@ -17,7 +17,9 @@ from courseware.tests.factories import StudentPrefsFactory, StudentInfoFactory
 
 from xblock.core import Scope, BlockScope
 from xmodule.modulestore import Location
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.db import DatabaseError
 from xblock.core import KeyValueMultiSaveError
 
@@ -151,6 +153,40 @@ class TestStudentModuleStorage(TestCase):
         "Test that `has` returns False for missing fields in StudentModule"
         self.assertFalse(self.kvs.has(user_state_key('not_a_field')))
 
+    def test_state_decoded_once(self):
+        "Test that the StudentModule state is only decoded once for many reads"
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEquals('a_value', self.kvs.get(user_state_key('a_field')))
+            self.assertTrue(self.kvs.has(user_state_key('b_field')))
+            self.assertEquals('b_value', self.kvs.get(user_state_key('b_field')))
+        self.assertEquals(1, mock_loads.call_count)
+
+    def test_set_unchanged_field(self):
+        "Test that setting a field to its current value doesn't save the StudentModule"
+        with patch('django.db.models.Model.save') as mock_save:
+            self.kvs.set(user_state_key('a_field'), 'a_value')
+        self.assertFalse(mock_save.called)
+
+    def test_mutating_read_value(self):
+        "Test that mutating a value read from the state doesn't change the state"
+        self.kvs.set(user_state_key('a_field'), ['a_value'])
+        self.kvs.get(user_state_key('a_field')).append('other_value')
+        self.assertEquals(['a_value'], self.kvs.get(user_state_key('a_field')))
+
+    def test_set_unchanged_state_encoded_differently(self):
+        "Test that a state encoded w/ its keys in another order isn't saved when unchanged"
+        student_module = StudentModule.objects.get()
+        state = json.loads(student_module.state)
+        student_module.state = '{' + ', '.join(
+            '{0}: {1}'.format(json.dumps(name), json.dumps(state[name])) for name in sorted(state, reverse=True)
+        ) + '}'
+        student_module.save()
+        self.mdc = ModelDataCache([mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user)
+        self.kvs = LmsKeyValueStore(self.desc_md, self.mdc)
+        with patch('django.db.models.Model.save') as mock_save:
+            self.kvs.set(user_state_key('a_field'), 'a_value')
+        self.assertFalse(mock_save.called)
+
     def construct_kv_dict(self):
         """Construct a kv_dict that can be passed to set_many"""
         key1 = user_state_key('field_a')
@@ -208,6 +244,19 @@ class TestMissingStudentModule(TestCase):
         self.assertEquals(location('def_id').url(), student_module.module_state_key)
         self.assertEquals(course_id, student_module.course_id)
 
+    def test_set_default_in_missing_student_module(self):
+        "Test that setting a field to its default doesn't create a StudentModule"
+        field = mock_field(Scope.user_state, 'a_field')
+        field.default = 'default_value'
+        self.mdc = ModelDataCache([mock_descriptor([field])], course_id, self.user)
+        self.kvs = LmsKeyValueStore(self.desc_md, self.mdc)
+
+        self.kvs.set_many({user_state_key('a_field'): 'default_value'})
+        self.assertEquals(0, StudentModule.objects.all().count())
+
+        self.kvs.set_many({user_state_key('a_field'): 'a_value'})
+        self.assertEquals(1, StudentModule.objects.all().count())
+
     def test_delete_field_from_missing_student_module(self):
         "Test that deleting a field from a missing StudentModule raises a KeyError"
         self.assertRaises(KeyError, self.kvs.delete, user_state_key('a_field'))
@@ -217,6 +266,55 @@ class TestMissingStudentModule(TestCase):
         self.assertFalse(self.kvs.has(user_state_key('a_field')))
 
 
+class TestBatchCreates(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create(username='user')
+        self.desc_md = {}
+        self.mdc = ModelDataCache([mock_descriptor()], course_id, self.user)
+        self.kvs = LmsKeyValueStore(self.desc_md, self.mdc)
+
+    def test_created_at_end_of_batch(self):
+        "Test that the field objects missing in a batch are created when it ends, with their values"
+        with self.mdc.batch_creates():
+            self.kvs.set(user_state_key('a_field'), 'a_value')
+            self.kvs.set(user_state_key('b_field'), 'b_value')
+            self.kvs.set(content_key('a_field'), 'content_value')
+            self.assertEquals(0, StudentModule.objects.all().count())
+            self.assertEquals(0, XModuleContentField.objects.all().count())
+            self.assertEquals('a_value', self.kvs.get(user_state_key('a_field')))
+
+        self.assertEquals({'a_field': 'a_value', 'b_field': 'b_value'}, json.loads(StudentModule.objects.get().state))
+        self.assertEquals('content_value', json.loads(XModuleContentField.objects.get().value))
+
+        # the created objects are in the cache
+        self.kvs.set(user_state_key('a_field'), 'new_value')
+        self.assertEquals(1, StudentModule.objects.all().count())
+        self.assertEquals('new_value', json.loads(StudentModule.objects.get().state)['a_field'])
+
+    def test_created_concurrently(self):
+        "Test that field objects created by someone else during the batch are updated instead"
+        with self.mdc.batch_creates():
+            self.kvs.set(user_state_key('a_field'), 'a_value')
+            StudentModuleFactory.create(
+                student=self.user,
+                course_id='edX/test_course/test',
+                module_state_key=location('def_id').url(),
+                state=json.dumps({'b_field': 'b_value'}),
+            )
+        # the fields set by the concurrent request are kept
+        self.assertEquals(
+            {'a_field': 'a_value', 'b_field': 'b_value'},
+            json.loads(StudentModule.objects.get().state)
+        )
+
+    def test_delete_pending(self):
+        "Test that deleting a field object which is waiting to be created means it isn't created"
+        with self.mdc.batch_creates():
+            self.kvs.set(content_key('a_field'), 'content_value')
+            self.kvs.delete(content_key('a_field'))
+        self.assertEquals(0, XModuleContentField.objects.all().count())
+
+
 class StorageTestBase(object):
     """
     A base class for that gets subclassed when testing each of the scopes.
@@ -346,3 +444,37 @@ class TestStudentInfoStorage(StorageTestBase, TestCase):
     scope = Scope.user_info
     key_factory = user_info_key
     storage_class = XModuleStudentInfoField
+
+
+class TestScopePrefetch(TestCase):
+    """
+    Tests of which scopes ModelDataCache loads from the database
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create()
+        self.descriptor = mock_descriptor([
+            mock_field(Scope.content, 'existing_field'),
+            mock_field(Scope.settings, 'existing_field')])
+
+    @override_settings(MODEL_DATA_CACHE_SCOPES=['settings'])
+    def test_configured_scopes(self):
+        ContentFactory.create()
+        with self.assertNumQueries(1):
+            mdc = ModelDataCache([self.descriptor], course_id, self.user)
+        self.assertIsNone(mdc.find(content_key('existing_field')))
+
+    @override_settings(MODEL_DATA_CACHE_SCOPES='auto')
+    @patch('courseware.model_data._populated_scopes', set())
+    def test_empty_scopes_skipped(self):
+        # checks whether the content and settings tables are empty
+        with self.assertNumQueries(2):
+            ModelDataCache([self.descriptor], course_id, self.user)
+        # remembers that they are
+        with self.assertNumQueries(0):
+            ModelDataCache([self.descriptor], course_id, self.user)
+
+        ContentFactory.create()
+        with self.assertNumQueries(1):
+            mdc = ModelDataCache([self.descriptor], course_id, self.user)
+        self.assertIsNotNone(mdc.find(content_key('existing_field')))
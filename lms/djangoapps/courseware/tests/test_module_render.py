@@ -7,19 +7,23 @@ import json
 from django.http import Http404, HttpResponse
 from django.core.urlresolvers import reverse
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
 
+from xmodule.html_module import HtmlModule
+from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 import courseware.module_render as render
 from courseware.tests.tests import LoginEnrollmentTestCase
 from courseware.model_data import ModelDataCache
 from modulestore_config import TEST_DATA_XML_MODULESTORE
+import xmodule_modifiers
 
 from courseware.courses import get_course_with_access
 
-from .factories import UserFactory
+from .factories import StudentModuleFactory, UserFactory
 
 
 class Stub:
@@ -258,3 +262,147 @@ class TestTOC(TestCase):
 
         actual = render.toc_for_course(self.portal_user, request, self.toy_course, chapter, section, model_data_cache)
         assert reduce(lambda x, y: x and (y in actual), expected, True)
+
+
+@override_settings(MODULESTORE=TEST_DATA_XML_MODULESTORE)
+class TestLazySequence(TestCase):
+    """Check that sequences render their inactive positions on demand"""
+    def setUp(self):
+        self.course_id = 'edX/toy/2012_Fall'
+        self.toy_course = modulestore().get_course(self.course_id)
+        self.location = ['i4x', 'edX', 'toy', 'videosequence', 'Toy_Videos']
+        self.user = UserFactory()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def get_sequence(self):
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
+            self.course_id, self.user, modulestore().get_instance(self.course_id, self.location), depth=None)
+        return render.get_module(self.user, self.request, self.location, model_data_cache, self.course_id)
+
+    @patch.dict("django.conf.settings.MITX_FEATURES", {"LAZY_SEQUENCE_RENDERING": True})
+    def test_lazy_render(self):
+        sequence = self.get_sequence()
+        html = sequence.get_html()
+        self.assertEqual(html.count('data-lazy="true"'), len(sequence.get_display_items()) - 1)
+
+        response = json.loads(sequence.handle_ajax('render_position', {'position': 2}))
+        self.assertTrue(response['success'])
+        self.assertEqual(response['content'], sequence.get_display_items()[1].get_html())
+        # rendering a position doesn't navigate to it
+        self.assertEqual(sequence.position, 1)
+
+    @patch.dict("django.conf.settings.MITX_FEATURES", {"LAZY_SEQUENCE_RENDERING": True})
+    def test_recorded_progress_zero_weight(self):
+        sequence = self.get_sequence()
+        sequence.system.set('get_recorded_score', lambda location: (1.0, 2.0))
+        problem = MagicMock(has_score=True, weight=0)
+        self.assertIsNone(sequence._recorded_progress(problem))
+        problem.weight = 4
+        self.assertEqual(sequence._recorded_progress(problem).frac(), (2.0, 4))
+
+    @patch.dict("django.conf.settings.MITX_FEATURES", {"LAZY_SEQUENCE_RENDERING": False})
+    def test_eager_render(self):
+        self.assertNotIn('data-lazy="true"', self.get_sequence().get_html())
+
+
+@override_settings(MODULESTORE=TEST_DATA_XML_MODULESTORE, MODULE_HTML_CACHE_TIMEOUT=60)
+class TestSharedHtml(TestCase):
+    """Check that the html of modules which render the same for everyone is shared between users"""
+    def setUp(self):
+        self.course_id = 'edX/toy/2012_Fall'
+        self.location = ['i4x', 'edX', 'toy', 'html', 'toyjumpto']
+        cache.clear()
+
+    def render(self):
+        user = UserFactory()
+        request = RequestFactory().get('/')
+        request.user = user
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
+            self.course_id, user, modulestore().get_instance(self.course_id, self.location), depth=0)
+        return render.get_module(user, request, self.location, model_data_cache, self.course_id).get_html()
+
+    def test_shared(self):
+        with patch.object(HtmlModule, 'get_html', return_value='<p>shared</p>') as get_html:
+            html = self.render()
+            self.assertEqual(self.render(), html)
+        self.assertIn('<p>shared</p>', html)
+        self.assertEqual(get_html.call_count, 1)
+
+    def test_user_dependent(self):
+        with patch.object(HtmlModule, 'get_html', return_value='<p>mine</p>') as get_html:
+            with patch.object(HtmlModule, 'has_user_independent_html', False):
+                self.render()
+                self.render()
+        self.assertEqual(get_html.call_count, 2)
+
+
+@override_settings(MODULESTORE=TEST_DATA_XML_MODULESTORE)
+class TestModuleSystemTemplate(TestCase):
+    """Check the ModuleSystems specialized from a ModuleSystemTemplate"""
+    def setUp(self):
+        self.course_id = 'edX/toy/2012_Fall'
+        self.user = UserFactory()
+        self.descriptor = modulestore().get_instance(
+            self.course_id, Location(['i4x', 'edX', 'toy', 'videosequence', 'Toy_Videos']))
+        self.model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
+            self.course_id, self.user, self.descriptor, depth=None)
+
+    def get_template(self):
+        return render.ModuleSystemTemplate.for_request(
+            self.user, self.model_data_cache, self.course_id, None, 'https://lms.example.com')
+
+    def test_reused(self):
+        self.assertIs(self.get_template(), self.get_template())
+
+    def test_urls(self):
+        location = self.descriptor.location.url()
+        system = self.get_template().system_for(self.descriptor)
+        self.assertEqual(
+            system.ajax_url,
+            reverse('modx_dispatch', kwargs=dict(course_id=self.course_id, location=location, dispatch='')).rstrip('/')
+        )
+        self.assertEqual(
+            system.xqueue['construct_callback'](),
+            'https://lms.example.com' + reverse('xqueue_callback', kwargs=dict(
+                course_id=self.course_id, userid=str(self.user.id), mod_id=location, dispatch='score_update'
+            ))
+        )
+
+    def test_specialized(self):
+        template = self.get_template()
+        child = self.descriptor.get_children()[0]
+        system = template.system_for(self.descriptor)
+        child_system = template.system_for(child)
+        self.assertIsNot(system, child_system)
+        self.assertNotEqual(system.ajax_url, child_system.ajax_url)
+        self.assertEqual(system.anonymous_student_id, child_system.anonymous_student_id)
+
+
+class TestGradeHistograms(TestCase):
+    """Check the grade histograms shown to staff"""
+    def setUp(self):
+        cache.clear()
+        self.problems = ['i4x://edX/toy/problem/p1', 'i4x://edX/toy/problem/p2']
+        for grade in (0, 1, 1):
+            StudentModuleFactory.create(module_state_key=self.problems[0], grade=grade, max_grade=1)
+        StudentModuleFactory.create(module_state_key=self.problems[1], grade=None)
+
+    def test_bulk(self):
+        histograms = xmodule_modifiers.grade_histograms(self.problems + ['i4x://edX/toy/problem/none'])
+        self.assertEqual(histograms, {
+            self.problems[0]: [(0, 1), (1, 2)],
+            self.problems[1]: [],
+            'i4x://edX/toy/problem/none': [],
+        })
+        self.assertEqual(xmodule_modifiers.grade_histogram(self.problems[0]), [(0, 1), (1, 2)])
+
+    def test_grade_change(self):
+        xmodule_modifiers.grade_histograms(self.problems)
+        StudentModuleFactory.create(module_state_key=self.problems[0], grade=1, max_grade=1)
+        # the cached counts are used until they're invalidated
+        with patch('django.db.connection.cursor') as cursor:
+            self.assertEqual(xmodule_modifiers.grade_histogram(self.problems[0]), [(0, 1), (1, 2)])
+        self.assertFalse(cursor.called)
+        xmodule_modifiers.invalidate_grade_histogram(self.problems[0])
+        self.assertEqual(xmodule_modifiers.grade_histogram(self.problems[0]), [(0, 1), (1, 3)])
@@ -2,6 +2,7 @@
 
 # text processing dependancies
 import json
+from mock import patch
 from textwrap import dedent
 
 from django.contrib.auth.models import User
@@ -471,6 +472,42 @@ class TestCourseGrader(TestSubmittingProblems):
         self.check_grade_percent(0.67)
         self.assertEqual(self.get_grade_summary()['grade'], 'B')
 
+    def test_progress_summary_without_modules(self):
+        """
+        Check that once the max scores of the problems are known the progress
+        summary is built w/o instantiating any module.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.assertEqual(self.score_for_hw('homework'), [1.0, 0.0, 0.0])
+
+        fake_request = self.factory.get(reverse('progress', kwargs={'course_id': self.course.id}))
+        with patch('courseware.grades.get_module_for_descriptor') as get_module_for_descriptor:
+            summary = grades.progress_summary(self.student_user, fake_request, self.course)
+        self.assertFalse(get_module_for_descriptor.called)
+        sections = [section for chapter in summary for section in chapter['sections']]
+        homework = next(section for section in sections if section['url_name'] == 'homework')
+        self.assertEqual([score.earned for score in homework['scores']], [1.0, 0.0, 0.0])
+        self.assertEqual([score.possible for score in homework['scores']], [1.0, 1.0, 1.0])
+
+    def test_progress_summary_inaccessible_problem(self):
+        """
+        Check that a problem the student can't load isn't listed, even w/ its max score cached.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.assertEqual(self.score_for_hw('homework'), [1.0, 0.0, 0.0])
+
+        real_has_access = grades.has_access
+
+        def has_access(user, obj, action, course_id=None):
+            if getattr(obj, 'url_name', None) in ('p1', 'p3'):
+                return False
+            return real_has_access(user, obj, action, course_id)
+
+        with patch('courseware.grades.has_access', has_access):
+            self.assertEqual(self.score_for_hw('homework'), [0.0])
+
     def test_weighted_homework(self):
         """
         Test that the homework section has proper weight.
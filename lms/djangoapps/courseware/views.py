@@ -400,7 +400,9 @@ def index(request, course_id, chapter=None, section=None,
                 # add in the appropriate timer information to the rendering context:
                 context.update(check_for_active_timelimit_module(request, course_id, course))
 
-            context['content'] = section_module.get_html()
+            # any model data objects the render creates are created together when it's done
+            with section_model_data_cache.batch_creates():
+                context['content'] = section_module.get_html()
         else:
             # section is none, so display a message
             prev_section = get_current_child(chapter_module)
@@ -732,12 +734,10 @@ def progress(request, course_id, student_id=None):
     # additional DB lookup (this kills the Progress page in particular).
     student = User.objects.prefetch_related("groups").get(id=student.id)
 
-    model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
-        course_id, student, course, depth=None)
-
-    courseware_summary = grades.progress_summary(student, request, course,
-                                                 model_data_cache)
-    grade_summary = grades.grade(student, request, course, model_data_cache)
+    # the summary is built from the student's recorded scores, so only the modules
+    # which are graded need their model data
+    courseware_summary = grades.progress_summary(student, request, course)
+    grade_summary = grades.grade(student, request, course)
 
     if courseware_summary is None:
         #This means the student didn't have access to the course (which the instructor requested)
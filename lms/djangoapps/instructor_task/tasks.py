@@ -18,9 +18,13 @@ object contains a 'task_input' row which is a JSON-encoded dict containing
 a problem URL and optionally a student.  These are used to set up the initial value
 of the query for traversing StudentModule objects.
 
+Tasks updating many StudentModule objects split them into chunks which are updated
+in parallel by update_problem_module_state_chunk subtasks.
+
 """
 from celery import task
 from instructor_task.tasks_helper import (update_problem_module_state,
+                                          update_module_state_chunk,
                                           rescore_problem_module_state,
                                           reset_attempts_module_state,
                                           delete_problem_module_state)
@@ -95,3 +99,18 @@ def delete_problem_state(entry_id, xmodule_instance_args):
     return update_problem_module_state(entry_id,
                                        update_fcn, action_name, filter_fcn=None,
                                        xmodule_instance_args=xmodule_instance_args)
+
+
+@task
+def update_problem_module_state_chunk(task_id, chunk_index, course_id, module_state_key, action_name, module_ids,
+                                      xmodule_instance_args):
+    """Updates one chunk of the StudentModules being updated by the task with id `task_id`.
+
+    `chunk_index` identifies the chunk within the task, and `module_ids` are the ids of its
+    StudentModule objects, which belong to the problem `module_state_key` in the course `course_id`.
+    `action_name` identifies the update function ('rescored', 'reset' or 'deleted').
+
+    The parent task aggregates the progress of its chunks, so this doesn't update an InstructorTask entry.
+    """
+    return update_module_state_chunk(task_id, chunk_index, course_id, module_state_key, action_name, module_ids,
+                                     xmodule_instance_args)
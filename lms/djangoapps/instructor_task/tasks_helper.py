@@ -5,7 +5,7 @@ running state of a course.
 """
 
 import json
-from time import time
+from time import time, sleep
 from sys import exc_info
 from traceback import format_exc
 
@@ -15,6 +15,9 @@ from celery.signals import worker_process_init
 from celery.states import SUCCESS, FAILURE
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.db import transaction
 from dogapi import dog_stats_api
 
@@ -34,6 +37,21 @@ TASK_LOG = get_task_logger(__name__)
 # define value to use when no task_id is provided:
 UNKNOWN_TASK_ID = 'unknown-task_id'
 
+# tasks updating more StudentModules than this are split into chunks of this size which are
+# updated in parallel by update_problem_module_state_chunk subtasks
+CHUNK_SIZE = 1000
+
+# the minimum number of seconds between updates of a task's progress
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+# how often (in seconds) the parent task checks the progress of its chunks, and how long the
+# chunks may go w/o making any progress before the task is considered failed
+CHUNK_POLL_INTERVAL = 2
+CHUNK_STALL_TIMEOUT = 15 * 60
+
+# how long to remember the claims and progress of chunks
+CHUNK_STATUS_TIMEOUT = 24 * 60 * 60
+
 
 def initialize_mako(sender=None, conf=None, **kwargs):
     """
@@ -71,7 +89,7 @@ def _get_current_task():
 
 
 def _perform_module_state_update(course_id, module_state_key, student_identifier, update_fcn, action_name, filter_fcn,
-                                 xmodule_instance_args):
+                                 xmodule_instance_args, task_id=None):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
@@ -82,6 +100,10 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
     If a `filter_fcn` is not None, it is applied to the query that has been constructed.  It takes one
     argument, which is the query being filtered, and returns the filtered version of the query.
 
+    If there are more than CHUNK_SIZE StudentModules to update (and a `task_id` is given), they are
+    updated in parallel chunks (see _perform_chunked_update), as long as the cache is shared between
+    the workers.
+
     The `update_fcn` is called on each StudentModule that passes the resulting filtering.
     It is passed three arguments:  the module_descriptor for the module pointed to by the
     module_state_key, the particular StudentModule to update, and the xmodule_instance_args being
@@ -130,10 +152,19 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
     if filter_fcn is not None:
         modules_to_update = filter_fcn(modules_to_update)
 
+    num_total = modules_to_update.count()
+
+    # large updates are split into chunks updated in parallel.  The chunks are handed to subtasks
+    # by action_name, so this is only possible for the standard update functions.
+    if (num_total > CHUNK_SIZE and task_id is not None and UPDATE_FUNCTIONS.get(action_name) is update_fcn
+            and _cache_is_shared()):
+        module_ids = list(modules_to_update.order_by('id').values_list('id', flat=True))
+        return _perform_chunked_update(task_id, course_id, module_state_key, module_descriptor, module_ids,
+                                       action_name, xmodule_instance_args, start_time)
+
     # perform the main loop
     num_updated = 0
     num_attempted = 0
-    num_total = modules_to_update.count()
 
     def get_task_progress():
         """Return a dict containing info about current task"""
@@ -148,7 +179,8 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
 
     task_progress = get_task_progress()
     _get_current_task().update_state(state=PROGRESS, meta=task_progress)
-    for module_to_update in modules_to_update:
+    last_update_time = time()
+    for module_to_update in modules_to_update.select_related('student'):
         num_attempted += 1
         # There is no try here:  if there's an error, we let it throw, and the task will
         # be marked as FAILED, with a stack trace.
@@ -158,13 +190,184 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
                 # Logging of failures is left to the update_fcn itself.
                 num_updated += 1
 
-        # update task status:
-        task_progress = get_task_progress()
-        _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+        # update task status (but not so often that updating it is most of the work):
+        if time() - last_update_time >= PROGRESS_UPDATE_INTERVAL:
+            task_progress = get_task_progress()
+            _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+            last_update_time = time()
 
+    task_progress = get_task_progress()
+    _get_current_task().update_state(state=PROGRESS, meta=task_progress)
     return task_progress
 
 
+def _cache_is_shared():
+    """
+    Returns True if the cache is shared between the worker processes.  The chunks are claimed
+    and report their progress through the cache, so w/ a per-process (or no) cache several
+    workers would update the same chunk and the parent would never see the chunks finish.
+    """
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def _chunk_key(task_id, chunk_index, name):
+    """The cache key for the `name` (claim or progress) of the given chunk of the task"""
+    return 'instructor_task.{task_id}.chunk.{index}.{name}'.format(task_id=task_id, index=chunk_index, name=name)
+
+
+def _claim_chunk(task_id, chunk_index):
+    """
+    Claim the given chunk of the task for updating.  Returns False if it has already been claimed
+    (by its subtask or by the parent task), in which case it must not be updated.
+    """
+    return cache.add(_chunk_key(task_id, chunk_index, 'claim'), True, CHUNK_STATUS_TIMEOUT)
+
+
+def _update_chunk(task_id, chunk_index, course_id, module_state_key, module_descriptor, update_fcn, action_name,
+                  module_ids, xmodule_instance_args, on_progress=None):
+    """
+    Visits the StudentModules of the chunk (given by their ids) with the update_fcn, recording the
+    chunk's progress in the cache as it goes (see _get_chunk_progress).  `on_progress` is called
+    after each such update.
+
+    If the update_fcn raises an exception, it is recorded in the chunk's progress and re-raised.
+
+    Returns the chunk's final progress.
+    """
+    progress = {'attempted': 0, 'updated': 0, 'done': False, 'error': None}
+    progress_key = _chunk_key(task_id, chunk_index, 'progress')
+
+    def save_progress():
+        """Record the chunk's progress and notify on_progress"""
+        cache.set(progress_key, progress, CHUNK_STATUS_TIMEOUT)
+        if on_progress is not None:
+            on_progress()
+
+    save_progress()
+    last_update_time = time()
+    try:
+        # the StudentModules of a chunk are fetched in one query, w/ their students
+        modules_to_update = StudentModule.objects.filter(id__in=module_ids).select_related('student')
+        for module_to_update in modules_to_update:
+            progress['attempted'] += 1
+            with dog_stats_api.timer('instructor_tasks.module.time.step', tags=['action:{name}'.format(name=action_name)]):
+                if update_fcn(module_descriptor, module_to_update, xmodule_instance_args):
+                    progress['updated'] += 1
+            if time() - last_update_time >= PROGRESS_UPDATE_INTERVAL:
+                save_progress()
+                last_update_time = time()
+    except Exception as exception:
+        progress['error'] = u'{0}: {1}'.format(type(exception).__name__, exception)
+        save_progress()
+        raise
+
+    progress['done'] = True
+    save_progress()
+    return progress
+
+
+def _get_chunk_progress(task_id, num_chunks):
+    """
+    Get the progress of each of the chunks of the task, as a list of dicts w/ keys 'attempted',
+    'updated', 'done' and 'error' (the error message of a failed chunk), or None for the chunks
+    which haven't started.
+    """
+    keys = [_chunk_key(task_id, chunk_index, 'progress') for chunk_index in range(num_chunks)]
+    progress = cache.get_many(keys)
+    return [progress.get(key) for key in keys]
+
+
+def _perform_chunked_update(task_id, course_id, module_state_key, module_descriptor, module_ids, action_name,
+                            xmodule_instance_args, start_time):
+    """
+    Updates the StudentModules w/ the given ids in chunks of CHUNK_SIZE.
+
+    Every chunk but the first is dispatched to an update_problem_module_state_chunk subtask, then
+    this task updates every chunk which hasn't been claimed by its subtask yet (so the update finishes
+    even if there are no other workers free) and waits for the rest.  The progress of the chunks is
+    aggregated into this task's progress and result, which has the same form as that of
+    _perform_module_state_update.
+
+    Raises UpdateProblemModuleStateError if any chunk fails or the chunks stop making progress
+    for CHUNK_STALL_TIMEOUT seconds.
+    """
+    # imported here since the tasks module imports this one
+    from instructor_task.tasks import update_problem_module_state_chunk
+
+    update_fcn = UPDATE_FUNCTIONS[action_name]
+    chunks = [module_ids[start:start + CHUNK_SIZE] for start in range(0, len(module_ids), CHUNK_SIZE)]
+    num_total = len(module_ids)
+
+    fmt = 'Task "{task_id}": updating {total} modules of problem "{state_key}" in {num} chunks'
+    TASK_LOG.info(fmt.format(task_id=task_id, total=num_total, state_key=module_state_key, num=len(chunks)))
+
+    state = {'progress': None, 'last_update_time': 0, 'done': False}
+
+    def update_task_progress(force=False):
+        """Aggregate the progress of the chunks into the task's progress, at most every PROGRESS_UPDATE_INTERVAL"""
+        if not force and time() - state['last_update_time'] < PROGRESS_UPDATE_INTERVAL:
+            return state['progress']
+        chunk_progress = _get_chunk_progress(task_id, len(chunks))
+        task_progress = {'action_name': action_name,
+                         'attempted': sum(progress['attempted'] for progress in chunk_progress if progress),
+                         'updated': sum(progress['updated'] for progress in chunk_progress if progress),
+                         'total': num_total,
+                         'duration_ms': int((time() - start_time) * 1000),
+                         }
+        _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+        state['progress'] = task_progress
+        state['last_update_time'] = time()
+        errors = [progress['error'] for progress in chunk_progress if progress and progress['error']]
+        if errors:
+            raise UpdateProblemModuleStateError(errors[0])
+        if all(progress and progress['done'] for progress in chunk_progress):
+            state['done'] = True
+        return task_progress
+
+    update_task_progress(force=True)
+
+    for chunk_index, chunk in enumerate(chunks):
+        if chunk_index > 0:
+            update_problem_module_state_chunk.delay(task_id, chunk_index, course_id, module_state_key, action_name,
+                                                    chunk, xmodule_instance_args)
+
+    for chunk_index, chunk in enumerate(chunks):
+        if _claim_chunk(task_id, chunk_index):
+            _update_chunk(task_id, chunk_index, course_id, module_state_key, module_descriptor, update_fcn,
+                          action_name, chunk, xmodule_instance_args, on_progress=update_task_progress)
+
+    # wait for the chunks claimed by subtasks
+    last_attempted = None
+    last_change_time = time()
+    while True:
+        task_progress = update_task_progress(force=True)
+        if state['done']:
+            return task_progress
+        if task_progress['attempted'] != last_attempted:
+            last_attempted = task_progress['attempted']
+            last_change_time = time()
+        elif time() - last_change_time > CHUNK_STALL_TIMEOUT:
+            fmt = 'Chunks of task "{task_id}" made no progress for {timeout} seconds'
+            raise UpdateProblemModuleStateError(fmt.format(task_id=task_id, timeout=CHUNK_STALL_TIMEOUT))
+        sleep(CHUNK_POLL_INTERVAL)
+
+
+def update_module_state_chunk(task_id, chunk_index, course_id, module_state_key, action_name, module_ids,
+                              xmodule_instance_args):
+    """
+    Updates one chunk of the StudentModules of a task split by _perform_chunked_update.
+
+    Does nothing (and returns None) if the chunk has already been claimed, e.g., by the parent task
+    because this subtask didn't start before the parent got to it.  Otherwise returns the chunk's
+    progress.
+    """
+    if not _claim_chunk(task_id, chunk_index):
+        return None
+    module_descriptor = modulestore().get_instance(course_id, module_state_key)
+    return _update_chunk(task_id, chunk_index, course_id, module_state_key, module_descriptor,
+                         UPDATE_FUNCTIONS[action_name], action_name, module_ids, xmodule_instance_args)
+
+
 def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
                                 xmodule_instance_args):
     """
@@ -233,7 +436,8 @@ def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
         # Now do the work:
         with dog_stats_api.timer('instructor_tasks.module.time.overall', tags=['action:{name}'.format(name=action_name)]):
             task_progress = _perform_module_state_update(course_id, module_state_key, student_ident, update_fcn,
-                                                         action_name, filter_fcn, xmodule_instance_args)
+                                                         action_name, filter_fcn, xmodule_instance_args,
+                                                         task_id=task_id)
         # If we get here, we assume we've succeeded, so update the InstructorTask entry in anticipation.
         # But we do this within the try, in case creating the task_output causes an exception to be
         # raised.
@@ -386,3 +590,11 @@ def delete_problem_module_state(_module_descriptor, student_module, xmodule_inst
     task_info = {"student": student_module.student.username, "task_id": _get_task_id_from_xmodule_args(xmodule_instance_args)}
     task_track(request_info, task_info, 'problem_delete_state', {}, page='x_module_task')
     return True
+
+
+# the update functions of the standard actions, by action_name, for use by chunk subtasks
+UPDATE_FUNCTIONS = {
+    'rescored': rescore_problem_module_state,
+    'reset': reset_attempts_module_state,
+    'deleted': delete_problem_module_state,
+}
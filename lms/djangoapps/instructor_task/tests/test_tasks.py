@@ -168,6 +168,29 @@ class TestInstructorTasks(InstructorTaskModuleTestCase):
         # check that entries were reset
         self._assert_num_attempts(students, 0)
 
+    def test_reset_in_chunks(self):
+        initial_attempts = 3
+        input_state = json.dumps({'attempts': initial_attempts})
+        num_students = 10
+        students = self._create_students_with_state(num_students, input_state)
+        # the chunks besides the first run eagerly in subtasks, the parent picks up the first
+        with patch('instructor_task.tasks_helper.CHUNK_SIZE', 3):
+            with patch('instructor_task.tasks_helper._cache_is_shared', return_value=True):
+                self._test_run_with_task(reset_problem_attempts, 'reset', num_students)
+        self._assert_num_attempts(students, 0)
+
+    def test_no_chunks_without_shared_cache(self):
+        initial_attempts = 3
+        input_state = json.dumps({'attempts': initial_attempts})
+        num_students = 10
+        students = self._create_students_with_state(num_students, input_state)
+        # the test cache is per-process, so the task updates all the modules itself
+        with patch('instructor_task.tasks_helper.CHUNK_SIZE', 3):
+            with patch('instructor_task.tasks_helper._perform_chunked_update') as mock_chunked_update:
+                self._test_run_with_task(reset_problem_attempts, 'reset', num_students)
+        self.assertFalse(mock_chunked_update.called)
+        self._assert_num_attempts(students, 0)
+
     def test_delete_with_some_state(self):
         # This will create StudentModule entries -- we don't have to worry about
         # the state inside them.
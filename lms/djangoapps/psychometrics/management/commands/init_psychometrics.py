@@ -1,26 +1,91 @@
 #!/usr/bin/python
 #
 # generate pyschometrics data from tracking logs and student module data
+#
+# The backfill is incremental: only StudentModules modified since the last run's checkpoint
+# are processed (unless --full), in batches of --batch-size. For each batch the check times
+# are recovered from the tracking logs with one query per course, and PsychometricData is
+# upserted w/ one query to find the existing entries and one bulk insert for the new ones.
 
 import json
+import re
+from collections import defaultdict
+from datetime import datetime
+from optparse import make_option
 
 from courseware.models import StudentModule
 from track.models import TrackingLog
-from psychometrics.models import PsychometricData
+from psychometrics.models import PsychometricData, PsychometricDataCheckpoint, checktime_from_datetime
 from xmodule.modulestore import Location
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from pytz import UTC
 
 #db = "ocwtutor"	# for debugging
 #db = "default"
 
 db = getattr(settings, 'DATABASE_FOR_PSYCHOMETRICS', 'default')
 
+CHECKPOINT_NAME = 'init_psychometrics'
+
+DEFAULT_BATCH_SIZE = 1000
+
+# server tracking events are stored as the repr of the event dict
+PROBLEM_ID_RE = re.compile(r'''['"]problem_id['"]:\s*u?['"]([^'"]+)['"]''')
+
+
+def problem_id_from_event(event):
+    """
+    Get the problem_id from the text of a save_problem_check tracking event (or None)
+    """
+    match = PROBLEM_ID_RE.search(event or '')
+    return match.group(1) if match else None
+
+
+def get_checktimes(course_id, usernames):
+    """
+    Get the check times of the problems of the course checked by the given users from the
+    tracking logs in one query.
+
+    Returns a dict mapping (username, problem_id) to the list of check times (in seconds since
+    the epoch) in the order the checks were made.
+    """
+    checktimes = defaultdict(list)
+    if not usernames:
+        return checktimes
+    course_prefix = "i4x://%s/" % '/'.join(course_id.split('/')[:2])
+    tset = TrackingLog.objects.using(db).filter(
+        username__in=usernames,
+        event_type__contains='save_problem_check',
+        event_source='server',
+        event__contains=course_prefix,
+    ).order_by('dtcreated').values_list('username', 'event', 'dtcreated')
+    for username, event, dtcreated in tset.iterator():
+        problem_id = problem_id_from_event(event)
+        if problem_id is not None:
+            checktimes[(username, problem_id)].append(checktime_from_datetime(dtcreated))
+    return checktimes
+
 
 class Command(BaseCommand):
     help = "initialize PsychometricData tables from StudentModule instances (and tracking data, if in SQL)."
     help += "Note this is done for all courses for which StudentModule instances exist."
+    help += "Only the StudentModules modified since the last run are processed unless --full is given."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--full',
+                    action='store_true',
+                    dest='full',
+                    default=False,
+                    help='Process all StudentModules, not only those modified since the last run'),
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=DEFAULT_BATCH_SIZE,
+                    help='The number of StudentModules to process at a time'),
+    )
 
     def handle(self, *args, **options):
 
@@ -29,40 +94,92 @@ class Command(BaseCommand):
         #PsychometricData.objects.all().delete()
         #PsychometricData.objects.using(db).all().delete()
 
-        smset = StudentModule.objects.using(db).exclude(max_grade=None)
+        # anything modified while we run is picked up by the next run
+        started = datetime.now(UTC)
 
-        for sm in smset:
-            url = sm.module_state_key
-            location = Location(url)
-            if not location.category == "problem":
+        smset = StudentModule.objects.using(db).filter(module_type='problem').exclude(max_grade=None)
+        checkpoint = None
+        if not options['full']:
+            try:
+                checkpoint = PsychometricDataCheckpoint.objects.using(db).get(name=CHECKPOINT_NAME)
+                smset = smset.filter(modified__gte=checkpoint.modified)
+                print "Processing StudentModules modified since %s" % checkpoint.modified
+            except PsychometricDataCheckpoint.DoesNotExist:
+                pass
+
+        smset = smset.order_by('id').values_list('id', 'student__username', 'course_id', 'module_state_key', 'state')
+
+        last_id = 0
+        nprocessed = 0
+        while True:
+            batch = list(smset.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            nprocessed += self.process_batch(batch)
+
+        if checkpoint is None:
+            checkpoint = PsychometricDataCheckpoint(name=CHECKPOINT_NAME)
+        checkpoint.modified = started
+        checkpoint.save(using=db)
+
+        print "%d PMD entries updated" % nprocessed
+        print "%d PMD entries" % PsychometricData.objects.using(db).all().count()
+        return []
+
+    def process_batch(self, batch):
+        """
+        Upsert the PsychometricData of the completed problems in the batch of
+        (id, username, course_id, module_state_key, state) StudentModule rows.
+        Returns the number of entries created or updated.
+        """
+        completed = []
+        for sm_id, username, course_id, url, state in batch:
+            if not Location(url).category == "problem":
                 continue
             try:
-                state = json.loads(sm.state)
+                state = json.loads(state)
                 done = state['done']
             except:
-                print "Oops, failed to eval state for %s (state=%s)" % (sm, sm.state)
+                print "Oops, failed to eval state for StudentModule %s (state=%s)" % (sm_id, state)
                 continue
 
             if done:			# only keep if problem completed
-                try:
-                    pmd = PsychometricData.objects.using(db).get(studentmodule=sm)
-                except PsychometricData.DoesNotExist:
-                    pmd = PsychometricData(studentmodule=sm)
-
-                pmd.done = done
-                pmd.attempts = state['attempts']
-
-                # get attempt times from tracking log
-                uname = sm.student.username
-                tset = TrackingLog.objects.using(db).filter(username=uname, event_type__contains='save_problem_check')
-                tset = tset.filter(event_source='server')
-                tset = tset.filter(event__contains="'%s'" % url)
-                checktimes = [x.dtcreated for x in tset]
-                pmd.checktimes = checktimes
-                if not len(checktimes) == pmd.attempts:
-                    print "Oops, mismatch in number of attempts and check times for %s" % pmd
-
-                #print pmd
-                pmd.save(using=db)
-
-        print "%d PMD entries" % PsychometricData.objects.using(db).all().count()
+                completed.append((sm_id, username, course_id, url, state.get('attempts', 0)))
+
+        # get attempt times from tracking log, in one pass per course
+        usernames_by_course = defaultdict(set)
+        for _sm_id, username, course_id, _url, _attempts in completed:
+            usernames_by_course[course_id].add(username)
+        checktimes = {}
+        for course_id, usernames in usernames_by_course.items():
+            checktimes.update(get_checktimes(course_id, list(usernames)))
+
+        with transaction.commit_on_success(using=db):
+            existing = dict(
+                (pmd.studentmodule_id, pmd)
+                for pmd in PsychometricData.objects.using(db).filter(studentmodule__in=[row[0] for row in completed])
+            )
+            created = []
+            for sm_id, username, _course_id, url, attempts in completed:
+                pmd = existing.get(sm_id)
+                if pmd is None:
+                    pmd = PsychometricData(studentmodule_id=sm_id)
+                pmd.done = True
+                pmd.attempts = attempts
+
+                pmd_checktimes = checktimes.get((username, url))
+                if pmd_checktimes is not None:
+                    pmd.checktimes = json.dumps(pmd_checktimes)
+                    if not len(pmd_checktimes) == attempts:
+                        print "Oops, mismatch in number of attempts and check times for %s %s" % (username, url)
+                # otherwise keep whatever check times were recorded in real time
+
+                if pmd.pk is None:
+                    created.append(pmd)
+                else:
+                    pmd.save(using=db)
+
+            PsychometricData.objects.using(db).bulk_create(created)
+
+        return len(completed)
@@ -4,9 +4,53 @@
 # this data is collected in real time
 #
 
+import calendar
+import json
+import re
+
 from django.db import models
 from courseware.models import StudentModule
 
+# matches the datetimes in the legacy checktimes format (the repr of a list of datetimes)
+LEGACY_CHECKTIME_RE = re.compile(r'datetime\.datetime\(([\d,\s]+)')
+
+
+def checktime_from_datetime(checktime):
+    """
+    Convert the (UTC) datetime checktime into seconds since the epoch
+    """
+    return calendar.timegm(checktime.utctimetuple())
+
+
+def encode_checktimes(checktimes):
+    """
+    Encode a list of (UTC) datetimes for PsychometricData.checktimes: a json list of
+    seconds since the epoch
+    """
+    return json.dumps([checktime_from_datetime(checktime) for checktime in checktimes])
+
+
+def decode_checktimes(text):
+    """
+    Decode PsychometricData.checktimes into a list of seconds since the epoch. Understands
+    the legacy format (the repr of a list of datetimes) too. Returns [] for empty or
+    unparseable text.
+    """
+    if not text:
+        return []
+    if text.startswith('[datetime'):
+        checktimes = []
+        for match in LEGACY_CHECKTIME_RE.finditer(text):
+            fields = [int(field) for field in match.group(1).split(',') if field.strip()]
+            # (year, month, day, hour, minute, second, microsecond) w/ trailing fields optional
+            fields += [0] * (7 - len(fields))
+            checktimes.append(calendar.timegm(fields[:6]) + fields[6] / 1000000.0)
+        return checktimes
+    try:
+        return json.loads(text)
+    except ValueError:
+        return []
+
 
 class PsychometricData(models.Model):
     """
@@ -26,7 +70,7 @@ class PsychometricData(models.Model):
 
     done = models.BooleanField(default=False)
     attempts = models.IntegerField(default=0)			# extracted from studentmodule.state
-    checktimes = models.TextField(null=True, blank=True)  	# internally stored as list of datetime objects
+    checktimes = models.TextField(null=True, blank=True)  	# json list of seconds since the epoch (see encode_checktimes)
 
     # keep in mind
     # grade = studentmodule.grade
@@ -35,6 +79,20 @@ class PsychometricData(models.Model):
     # course_id = studentmodule.course_id
     # location = studentmodule.module_state_key
 
+    def get_checktimes(self):
+        """
+        The times of the checks as a list of seconds since the epoch
+        """
+        return decode_checktimes(self.checktimes)
+
+    def add_checktime(self, checktime):
+        """
+        Record another check at the datetime checktime
+        """
+        checktimes = self.get_checktimes()
+        checktimes.append(checktime_from_datetime(checktime))
+        self.checktimes = json.dumps(checktimes)
+
     def __unicode__(self):
         sm = self.studentmodule
         return "[PsychometricData] %s url=%s, grade=%s, max=%s, attempts=%s, ct=%s" % (sm.student,
@@ -43,3 +101,15 @@ class PsychometricData(models.Model):
                                                                                        sm.max_grade,
                                                                                        self.attempts,
                                                                                        self.checktimes)
+
+
+class PsychometricDataCheckpoint(models.Model):
+    """
+    Records the time up to which the init_psychometrics command has processed StudentModules
+    (by their modified time) so that subsequent runs only process those modified since.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    modified = models.DateTimeField()
+
+    def __unicode__(self):
+        return "[PsychometricDataCheckpoint] %s modified=%s" % (self.name, self.modified)
@@ -13,8 +13,8 @@ import numpy as np
 from scipy.optimize import curve_fit
 
 from django.conf import settings
-from django.db.models import Sum, Max
-from psychometrics.models import PsychometricData
+from django.db.models import Count
+from psychometrics.models import PsychometricData, decode_checktimes
 from courseware.models import StudentModule
 from pytz import UTC
 
@@ -70,6 +70,22 @@ class StatVar(object):
         self.sum2 += x ** 2
         self.cnt += 1
 
+    def add_array(self, xs):
+        """
+        Add all of the values in the numpy array xs at once
+        """
+        if len(xs) == 0:
+            return
+        xmin = xs.min()
+        xmax = xs.max()
+        if self.min is None or xmin < self.min:
+            self.min = xmin
+        if self.max is None or xmax > self.max:
+            self.max = xmax
+        self.sum += xs.sum()
+        self.sum2 += (xs ** 2).sum()
+        self.cnt += len(xs)
+
     def avg(self):
         if self.cnt is None:
             return 0
@@ -103,6 +119,9 @@ def make_histogram(ydata, bins=None):
     Generate histogram of ydata using bins provided, or by default bins
     from 0 to 100 by 10.  bins should be ordered in increasing order.
 
+    Each y is counted in the largest bin which is less than it; a y not
+    greater than the first bin isn't counted.
+
     returns dict with keys being bins, and values being counts.
     special: hist['bins'] = bins
     '''
@@ -110,12 +129,11 @@ def make_histogram(ydata, bins=None):
         bins = range(0, 100, 10)
 
     nbins = len(bins)
-    hist = dict(zip(bins, [0] * nbins))
-    for y in ydata:
-        for b in bins[::-1]:  # in reverse order
-            if y > b:
-                hist[b] += 1
-                break
+    ydata = np.asarray(ydata, dtype=float)
+    # index of the largest bin < y
+    indices = np.searchsorted(np.asarray(bins, dtype=float), ydata, side='left') - 1
+    counts = np.bincount(indices[indices >= 0], minlength=nbins) if nbins else []
+    hist = dict(zip(bins, [int(count) for count in counts]))
     # hist['bins'] = bins
     return hist
 
@@ -128,18 +146,38 @@ def problems_with_psychometric_data(course_id):
     Does this for a given course_id.
     '''
     pmdset = PsychometricData.objects.using(db).filter(studentmodule__course_id=course_id)
-    plist = [p['studentmodule__module_state_key'] for p in pmdset.values('studentmodule__module_state_key').distinct()]
-    problems = dict((p, pmdset.filter(studentmodule__module_state_key=p).count()) for p in plist)
+    # one grouped query for all of the problems' counts
+    counts = pmdset.values('studentmodule__module_state_key').annotate(count=Count('id')).order_by()
+    problems = dict((p['studentmodule__module_state_key'], p['count']) for p in counts)
 
     return problems
 
 #-----------------------------------------------------------------------------
 
 
+def get_problem_data(problem):
+    """
+    Get the psychometric data for all of the students of the problem in one query.
+
+    Returns (grades, max_grade, attempts, checktimes) where grades and attempts are
+    numpy arrays w/ one entry per student (grade is nan if not graded), max_grade is the
+    problem's max grade (or None if there are no students), and checktimes is a list of the
+    numpy arrays of the check times (in seconds since the epoch) of each student.
+    """
+    rows = list(PsychometricData.objects.using(db).filter(studentmodule__module_state_key=problem).values_list(
+        'studentmodule__grade', 'studentmodule__max_grade', 'attempts', 'checktimes'
+    ))
+    grades = np.array([row[0] if row[0] is not None else np.nan for row in rows], dtype=float)
+    max_grade = rows[0][1] if rows else None
+    attempts = np.array([row[2] or 0 for row in rows], dtype=int)
+    checktimes = [np.array(decode_checktimes(row[3]), dtype=float) for row in rows]
+    return grades, max_grade, attempts, checktimes
+
+
 def generate_plots_for_problem(problem):
 
-    pmdset = PsychometricData.objects.using(db).filter(studentmodule__module_state_key=problem)
-    nstudents = pmdset.count()
+    grades, max_grade, attempts, checktimes = get_problem_data(problem)
+    nstudents = len(grades)
     msg = ""
     plots = []
 
@@ -147,11 +185,7 @@ def generate_plots_for_problem(problem):
         msg += "%s nstudents=%d --> skipping, too few" % (problem, nstudents)
         return msg, plots
 
-    max_grade = pmdset[0].studentmodule.max_grade
-
-    agdat = pmdset.aggregate(Sum('attempts'), Max('attempts'))
-    max_attempts = agdat['attempts__max']
-    total_attempts = agdat['attempts__sum']  # not used yet
+    max_attempts = int(attempts.max())
 
     msg += "max attempts = %d" % max_attempts
 
@@ -159,10 +193,9 @@ def generate_plots_for_problem(problem):
     dataset = {'xdat': xdat}
 
     # compute grade statistics
-    grades = [pmd.studentmodule.grade for pmd in pmdset]
+    graded = grades[~np.isnan(grades)]
     gsv = StatVar()
-    for g in grades:
-        gsv += g
+    gsv.add_array(graded)
     msg += "<br><p><font color='blue'>Grade distribution: %s</font></p>" % gsv
 
     # generate grade histogram
@@ -183,7 +216,7 @@ def generate_plots_for_problem(problem):
         max_grade = gsv.max
 
     if max_grade > 1:
-        ghist = make_histogram(grades, np.linspace(0, max_grade, max_grade + 1))
+        ghist = make_histogram(graded, np.linspace(0, max_grade, max_grade + 1))
         ghist_json = json.dumps(ghist.items())
 
         plot = {'title': "Grade histogram for %s" % problem,
@@ -196,24 +229,12 @@ def generate_plots_for_problem(problem):
     else:
         msg += "<br/>Not generating histogram: max_grade=%s" % max_grade
 
-    # histogram of time differences between checks
-    # Warning: this is inefficient - doesn't scale to large numbers of students
-    dtset = []  # time differences in minutes
+    # histogram of time differences (in minutes) between checks
+    dtset = [np.diff(student_checktimes) / 60.0 for student_checktimes in checktimes if len(student_checktimes) > 1]
+    dtset = np.concatenate(dtset) if dtset else np.array([])
+    dtset = dtset[dtset < 20]  # ignore if dt too long
     dtsv = StatVar()
-    for pmd in pmdset:
-        try:
-            checktimes = eval(pmd.checktimes)  # update log of attempt timestamps
-        except:
-            continue
-        if len(checktimes) < 2:
-            continue
-        ct0 = checktimes[0]
-        for ct in checktimes[1:]:
-            dt = (ct - ct0).total_seconds() / 60.0
-            if dt < 20:  # ignore if dt too long
-                dtset.append(dt)
-                dtsv += dt
-            ct0 = ct
+    dtsv.add_array(dtset)
     if dtsv.cnt > 2:
         msg += "<br/><p><font color='brown'>Time differences between checks: %s</font></p>" % dtsv
         bins = np.linspace(0, 1.5 * dtsv.sdv(), 30)
@@ -234,16 +255,13 @@ def generate_plots_for_problem(problem):
     # one IRT plot curve for each grade received (TODO: this assumes integer grades)
     for grade in range(1, int(max_grade) + 1):
         yset = {}
-        gset = pmdset.filter(studentmodule__grade=grade)
-        ngset = gset.count()
+        in_grade = grades == grade
+        ngset = in_grade.sum()
         if ngset == 0:
             continue
-        ydat = []
-        ylast = 0
-        for x in xdat:
-            y = gset.filter(attempts=x).count() / ngset
-            ydat.append(y + ylast)
-            ylast = y + ylast
+        # fraction of the students w/ this grade who took each number of attempts, accumulated
+        attempt_counts = np.bincount(attempts[in_grade], minlength=max_attempts + 1)[1:max_attempts + 1]
+        ydat = list(np.cumsum(attempt_counts / float(ngset)))
         yset['ydat'] = ydat
 
         if len(ydat) > 3:  # try to fit to logistic function if enough data points
@@ -338,12 +356,7 @@ def make_psychometrics_data_update_handler(course_id, user, module_state_key):
         except:
             log.exception("no attempts for %s (state=%s)" % (sm, sm.state))
 
-        try:
-            checktimes = eval(pmd.checktimes)  # update log of attempt timestamps
-        except:
-            checktimes = []
-        checktimes.append(datetime.datetime.now(UTC))
-        pmd.checktimes = checktimes
+        pmd.add_checktime(datetime.datetime.now(UTC))  # update log of attempt timestamps
         try:
             pmd.save()
         except:
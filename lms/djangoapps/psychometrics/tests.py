@@ -0,0 +1,130 @@
+"""
+Tests for the psychometrics plot generation
+"""
+import datetime
+
+from django.core.management import call_command
+from django.test import TestCase
+from pytz import UTC
+
+from courseware.tests.factories import StudentModuleFactory, UserFactory
+from psychometrics import psychoanalyze
+from psychometrics.management.commands.init_psychometrics import problem_id_from_event
+from psychometrics.models import PsychometricData, encode_checktimes, decode_checktimes
+from track.models import TrackingLog
+
+PROBLEM = 'i4x://edX/test_course/problem/p1'
+
+
+class CheckTimesTest(TestCase):
+    """
+    Tests of the checktimes storage format
+    """
+    def test_round_trip(self):
+        checktimes = [datetime.datetime(2013, 6, 1, 10, 30, tzinfo=UTC), datetime.datetime(2013, 6, 1, 10, 32, tzinfo=UTC)]
+        self.assertEqual(decode_checktimes(encode_checktimes(checktimes)), [1370082600, 1370082720])
+
+    def test_legacy_format(self):
+        legacy = str([datetime.datetime(2013, 6, 1, 10, 30, tzinfo=UTC), datetime.datetime(2013, 6, 1, 10, 32, 0, 500000)])
+        self.assertEqual(decode_checktimes(legacy), [1370082600, 1370082720.5])
+
+    def test_bad_format(self):
+        self.assertEqual(decode_checktimes(None), [])
+        self.assertEqual(decode_checktimes('garbage'), [])
+
+
+class PlotTest(TestCase):
+    """
+    Tests of generate_plots_for_problem
+    """
+    def setUp(self):
+        start = datetime.datetime(2013, 6, 1, 10, 0, tzinfo=UTC)
+        for index, (grade, attempts) in enumerate([(1, 1), (1, 2), (0, 3), (1, 2)]):
+            module = StudentModuleFactory.create(
+                student=UserFactory.create(username='student{0}'.format(index), email='s{0}@edx.org'.format(index)),
+                module_state_key=PROBLEM,
+                course_id='edX/test_course/test',
+                grade=grade,
+                max_grade=1,
+            )
+            PsychometricData.objects.create(
+                studentmodule=module,
+                done=True,
+                attempts=attempts,
+                checktimes=encode_checktimes(
+                    [start + datetime.timedelta(minutes=minute) for minute in range(attempts)]
+                ),
+            )
+
+    def test_make_histogram(self):
+        self.assertEqual(psychoanalyze.make_histogram([0, 1, 5, 15, 95]), {
+            0: 2, 10: 1, 20: 0, 30: 0, 40: 0, 50: 0, 60: 0, 70: 0, 80: 0, 90: 1
+        })
+
+    def test_plots(self):
+        msg, plots = psychoanalyze.generate_plots_for_problem(PROBLEM)
+        self.assertIn('max attempts = 3', msg)
+        plot_ids = [plot['id'] for plot in plots]
+        self.assertIn('thistogram', plot_ids)
+        self.assertIn('irt1', plot_ids)
+        irt = [plot for plot in plots if plot['id'] == 'irt1'][0]
+        # of the 3 students w/ grade 1, 1 took 1 attempt and 2 took 2
+        self.assertIn('[[1, 0.3333333333333333], [2, 1.0], [3, 1.0]]', irt['data'])
+
+    def test_problems_with_psychometric_data(self):
+        self.assertEqual(psychoanalyze.problems_with_psychometric_data('edX/test_course/test'), {PROBLEM: 4})
+        self.assertEqual(psychoanalyze.problems_with_psychometric_data('edX/other_course/test'), {})
+
+    def test_too_few_students(self):
+        msg, plots = psychoanalyze.generate_plots_for_problem('i4x://edX/test_course/problem/none')
+        self.assertIn('too few', msg)
+        self.assertEqual(plots, [])
+
+
+class InitPsychometricsTest(TestCase):
+    """
+    Tests of the init_psychometrics command
+    """
+    def setUp(self):
+        self.module = StudentModuleFactory.create(
+            student=UserFactory.create(username='student'),
+            module_state_key=PROBLEM,
+            course_id='edX/test_course/test',
+            state='{"done": true, "attempts": 2}',
+            grade=1,
+            max_grade=1,
+        )
+        for minute in (10, 12):
+            log = TrackingLog.objects.create(
+                username='student',
+                event_source='server',
+                event_type='save_problem_check',
+                event=str({'problem_id': PROBLEM, 'success': 'correct'}),
+                time=datetime.datetime(2013, 6, 1, 10, minute, tzinfo=UTC),
+            )
+            TrackingLog.objects.filter(id=log.id).update(dtcreated=datetime.datetime(2013, 6, 1, 10, minute, tzinfo=UTC))
+
+    def test_problem_id_from_event(self):
+        self.assertEqual(problem_id_from_event(str({'problem_id': u'i4x://a/b/problem/c'})), 'i4x://a/b/problem/c')
+        self.assertIsNone(problem_id_from_event(''))
+
+    def test_backfill(self):
+        call_command('init_psychometrics')
+        pmd = PsychometricData.objects.get(studentmodule=self.module)
+        self.assertEqual(pmd.attempts, 2)
+        self.assertEqual(pmd.get_checktimes(), [1370081400, 1370081520])
+
+    def test_incremental(self):
+        call_command('init_psychometrics')
+        PsychometricData.objects.all().delete()
+        # nothing was modified since the last run
+        call_command('init_psychometrics')
+        self.assertEqual(PsychometricData.objects.count(), 0)
+
+        self.module.state = '{"done": true, "attempts": 3}'
+        self.module.save()
+        call_command('init_psychometrics')
+        self.assertEqual(PsychometricData.objects.get(studentmodule=self.module).attempts, 3)
+
+        call_command('init_psychometrics', full=True)
+        self.assertEqual(PsychometricData.objects.count(), 1)
@@ -152,7 +152,14 @@ MITX_FEATURES = {
 
     # Toggle to enable chat availability (configured on a per-course
     # basis in Studio)
-    'ENABLE_CHAT': False
+    'ENABLE_CHAT': False,
+
+    # Only render the active position of sequences with the page; the others are
+    # rendered when the student navigates to them
+    'LAZY_SEQUENCE_RENDERING': False,
+
+    # With LAZY_SEQUENCE_RENDERING, also fetch the positions next to the active one
+    'PREFETCH_SEQUENCE_NEIGHBORS': True,
 }
 
 # Used for A/B testing
@@ -254,6 +261,22 @@ BOOK_URL = 'https://mitxstatic.s3.amazonaws.com/book_images/'  # For AWS deploys
 # PRESS_URL = r''
 RSS_TIMEOUT = 600
 
+# How long (in seconds) courseware.access may share a user's group names between requests.
+# Changes to the groups made through the ORM invalidate them immediately. 0 to disable.
+ACCESS_GROUP_NAMES_CACHE_TIMEOUT = 60
+
+# How long (in seconds) the rendered html of modules which render the same for all users is shared
+# between them. Edits to the modules change their cache keys. 0 to disable.
+MODULE_HTML_CACHE_TIMEOUT = 60 * 60
+
+# How long (in seconds) the grade counts shown to staff w/ DISPLAY_HISTOGRAMS_TO_STAFF are cached. They're
+# updated as grades are published but other changes (e.g. deleted student state) show up when they expire.
+GRADE_HISTOGRAM_CACHE_TIMEOUT = 10 * 60
+
+# Which of the content, settings, preferences and user_info scopes ModelDataCache loads from the database:
+# None for all of them, a list of their names, or 'auto' for those whose tables aren't empty
+MODEL_DATA_CACHE_SCOPES = 'auto'
+
 # Configuration option for when we want to grab server error pages
 STATIC_GRAB = False
 DEV_CONTENT = True
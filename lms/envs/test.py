@@ -155,6 +155,12 @@ CELERY_ALWAYS_EAGER = True
 CELERY_RESULT_BACKEND = 'cache'
 BROKER_TRANSPORT = 'memory'
 
+# user ids are reused after each test's rollback, so don't share group names between requests
+ACCESS_GROUP_NAMES_CACHE_TIMEOUT = 0
+
+# tests rendering modules expect them to be rendered
+MODULE_HTML_CACHE_TIMEOUT = 0
+
 ############################ STATIC FILES #############################
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 MEDIA_ROOT = TEST_ROOT / "uploads"
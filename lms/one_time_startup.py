@@ -1,6 +1,7 @@
 from dogapi import dog_http_api, dog_stats_api
 from django.conf import settings
 from xmodule.modulestore.django import modulestore
+from xmodule.course_module import Textbook
 from request_cache.middleware import RequestCache
 
 from django.core.cache import get_cache
@@ -11,6 +12,9 @@ for store_name in settings.MODULESTORE:
     store.metadata_inheritance_cache_subsystem = cache
     store.request_cache = RequestCache.get_request_cache()
 
+# share the fetched textbook tables of contents among all of the processes
+Textbook.toc_cache = get_cache('default')
+
 if hasattr(settings, 'DATADOG_API'):
     dog_http_api.api_key = settings.DATADOG_API
     dog_stats_api.start(api_key=settings.DATADOG_API, statsd=True)